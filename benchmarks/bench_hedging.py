@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+对冲请求基准测试
+启动本地假webhook服务器（按比例注入慢响应），对比开启/关闭对冲时 WebhookClient.send 的延迟分布
+"""
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import RateLimiter
+from webhook_client import WebhookClient
+
+SLOW_RATIO = 0.03      # 慢响应比例
+SLOW_LATENCY = 0.8     # 慢响应延迟（秒）
+FAST_LATENCY = 0.005   # 正常响应延迟（秒）
+REQUESTS = 1000
+
+
+class FakeWebhookHandler(BaseHTTPRequestHandler):
+    """模拟企业微信webhook，随机注入延迟"""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(SLOW_LATENCY if random.random() < SLOW_RATIO else FAST_LATENCY)
+        body = json.dumps({"errcode": 0, "errmsg": "ok"}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def percentile(samples, p):
+    """计算百分位数"""
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def run(client: WebhookClient, hedge_enabled: bool):
+    """发送REQUESTS条消息并返回延迟列表"""
+    client.hedge = hedge_enabled
+    client._latencies.clear()
+    data = {"msgtype": "text", "text": {"content": "bench"}}
+    latencies = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        client.send(data)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    """运行基准测试并打印结果"""
+    random.seed(42)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeWebhookHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = WebhookClient("bench", base_url=f"http://127.0.0.1:{server.server_address[1]}")
+    # 基准测试只关心网络延迟，放开频率限制
+    robot = client.pool.primary
+    robot.limiter = RateLimiter(rate_per_minute=10 ** 9, name="bench")
+    robot.scheduler.limiter = robot.limiter
+
+    print(f"假服务器: {SLOW_RATIO:.0%} 请求注入 {SLOW_LATENCY * 1000:.0f}ms 延迟, 共 {REQUESTS} 次发送")
+    for hedge_enabled in (False, True):
+        latencies = run(client, hedge_enabled)
+        label = "对冲开启" if hedge_enabled else "对冲关闭"
+        print(f"{label}: p50={percentile(latencies, 50) * 1000:.1f}ms "
+              f"p99={percentile(latencies, 99) * 1000:.1f}ms "
+              f"max={max(latencies) * 1000:.1f}ms")
+
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+图片消息请求体构造基准测试
+对比原来的 读文件 → base64 → str → 字典 → json.dumps → bytes 流程和预编码请求体的
+峰值内存（每种方式在独立子进程中测量RSS峰值增量和tracemalloc峰值）与CPU时间
+"""
+
+import base64
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message_body import encode_image_message, iter_file
+
+IMAGE_SIZE = 2 * 1024 * 1024
+ITERATIONS = 200
+
+
+def build_json(path: str) -> bytes:
+    """原来的构造方式"""
+    with open(path, 'rb') as f:
+        content = f.read()
+    data = {
+        "msgtype": "image",
+        "image": {
+            "base64": base64.b64encode(content).decode('utf-8'),
+            "md5": hashlib.md5(content).hexdigest()
+        }
+    }
+    return json.dumps(data, allow_nan=False).encode('utf-8')
+
+
+def build_encoded(path: str) -> bytearray:
+    """预编码请求体"""
+    with open(path, 'rb') as f:
+        return encode_image_message(iter_file(f), os.path.getsize(path)).body
+
+
+BUILDERS = {"json": build_json, "encoded": build_encoded}
+
+
+def child(variant: str, path: str):
+    """在子进程中测量一种构造方式，结果以JSON输出"""
+    build = BUILDERS[variant]
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    body = build(path)
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_kb
+    del body
+
+    tracemalloc.start()
+    body = build(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del body
+
+    start = time.process_time()
+    for _ in range(ITERATIONS):
+        build(path)
+    cpu_ms = (time.process_time() - start) / ITERATIONS * 1000
+    print(json.dumps({"rss_kb": rss_kb, "traced_peak_kb": peak // 1024, "cpu_ms": cpu_ms}))
+
+
+def main():
+    """运行基准测试并打印结果"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "image.bin")
+        # 子进程继承父进程的RSS峰值，父进程在测量结束前不构造大对象
+        with open(path, 'wb') as f:
+            for _ in range(IMAGE_SIZE // 65536):
+                f.write(os.urandom(65536))
+
+        print(f"图片大小: {IMAGE_SIZE // 1024}KB, CPU时间取 {ITERATIONS} 次平均")
+        results = {}
+        for variant in BUILDERS:
+            output = subprocess.run([sys.executable, __file__, "--child", variant, path],
+                                    check=True, capture_output=True, text=True).stdout
+            results[variant] = json.loads(output)
+            r = results[variant]
+            print(f"{variant:>8}: RSS峰值增量={r['rss_kb'] / 1024:.1f}MB "
+                  f"分配峰值={r['traced_peak_kb'] / 1024:.1f}MB cpu={r['cpu_ms']:.2f}ms")
+
+        assert bytes(build_encoded(path)) == build_json(path)
+        old, new = results["json"], results["encoded"]
+        print(f"RSS峰值降低 {1 - new['rss_kb'] / old['rss_kb']:.0%}, "
+              f"分配峰值降低 {1 - new['traced_peak_kb'] / old['traced_peak_kb']:.0%}, "
+              f"CPU时间降低 {1 - new['cpu_ms'] / old['cpu_ms']:.0%}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3])
+    else:
+        main()
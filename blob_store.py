@@ -0,0 +1,158 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import threading
+from datetime import datetime
+from urllib.parse import urlparse, unquote
+from typing import Dict, Any, Optional
+from config import BLOB_DIR, BLOB_TTL, MAX_BLOB_SIZE
+
+# 暂存blob的引用形式：blob:<id>，或同一个blob的MCP资源URI
+BLOB_SCHEME = "blob:"
+RESOURCE_PREFIX = "qyweixin://blobs/"
+
+_BLOB_ID = re.compile(r"[0-9a-f]{32}")
+
+# 清理过期blob的最小间隔（秒）
+_CLEANUP_INTERVAL = 60
+
+
+class BlobStore:
+    """
+    暂存blob：大文件先写入暂存目录，发送工具按引用读取，不必把数据放进每次工具调用的JSON参数
+
+    每个blob是 {目录}/{blob_id}/{文件名}，保留原始文件名供文件消息显示；最后一次写入后
+    超过ttl秒视为过期。默认目录在共享内存中，同一台机器上的多个工作进程共用。
+    """
+
+    def __init__(self, directory: str = BLOB_DIR, ttl: float = BLOB_TTL, max_size: int = MAX_BLOB_SIZE):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self._last_cleanup = 0.0
+        self._lock = threading.Lock()
+
+    def create(self, name: str) -> str:
+        """创建空blob，返回blob_id"""
+        name = os.path.basename(name or "")
+        if not name or name in (".", ".."):
+            raise ValueError("必须提供有效的文件名")
+        self.cleanup()
+        blob_id = uuid.uuid4().hex
+        blob_dir = os.path.join(self.directory, blob_id)
+        os.makedirs(blob_dir, mode=0o700)
+        open(os.path.join(blob_dir, name), 'xb').close()
+        return blob_id
+
+    def append(self, blob_id: str, data: bytes) -> int:
+        """追加数据，返回blob当前大小"""
+        path = self.path(blob_id)
+        with self._lock:
+            size = os.path.getsize(path) + len(data)
+            if size > self.max_size:
+                raise ValueError(f"暂存blob大小超出限制: {size} > {self.max_size}")
+            with open(path, 'ab') as f:
+                f.write(data)
+        return size
+
+    def put(self, data: bytes, name: str) -> Dict[str, Any]:
+        """一次写入完整数据，返回blob信息"""
+        if len(data) > self.max_size:
+            raise ValueError(f"暂存blob大小超出限制: {len(data)} > {self.max_size}")
+        blob_id = self.create(name)
+        self.append(blob_id, data)
+        return self.info(blob_id)
+
+    def path(self, blob_id: str) -> str:
+        """blob的本地文件路径，不存在或已过期时报错"""
+        blob_id = parse_blob_id(blob_id)
+        blob_dir = os.path.join(self.directory, blob_id)
+        try:
+            names = os.listdir(blob_dir)
+        except FileNotFoundError:
+            names = []
+        if len(names) != 1:
+            raise ValueError(f"暂存blob不存在或已过期: {blob_id}")
+        path = os.path.join(blob_dir, names[0])
+        if os.path.getmtime(path) + self.ttl < time.time():
+            self.delete(blob_id)
+            raise ValueError(f"暂存blob不存在或已过期: {blob_id}")
+        return path
+
+    def info(self, blob_id: str) -> Dict[str, Any]:
+        """blob信息：引用、资源URI、文件名、大小和过期时间"""
+        path = self.path(blob_id)
+        blob_id = parse_blob_id(blob_id)
+        stat = os.stat(path)
+        return {
+            "blob_id": blob_id,
+            "ref": BLOB_SCHEME + blob_id,
+            "uri": RESOURCE_PREFIX + blob_id,
+            "name": os.path.basename(path),
+            "size": stat.st_size,
+            "expires": datetime.fromtimestamp(stat.st_mtime + self.ttl).isoformat(timespec="seconds"),
+        }
+
+    def delete(self, blob_id: str) -> bool:
+        """删除blob"""
+        blob_dir = os.path.join(self.directory, parse_blob_id(blob_id))
+        if not os.path.isdir(blob_dir):
+            return False
+        shutil.rmtree(blob_dir, ignore_errors=True)
+        return True
+
+    def cleanup(self, force: bool = False):
+        """删除过期的blob，默认最多每分钟执行一次"""
+        now = time.time()
+        if not force and now - self._last_cleanup < _CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        try:
+            entries = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if not _BLOB_ID.fullmatch(entry):
+                continue
+            blob_dir = os.path.join(self.directory, entry)
+            try:
+                mtime = max((os.path.getmtime(os.path.join(blob_dir, name)) for name in os.listdir(blob_dir)),
+                            default=os.path.getmtime(blob_dir))
+            except FileNotFoundError:
+                continue
+            if mtime + self.ttl < now:
+                shutil.rmtree(blob_dir, ignore_errors=True)
+
+
+def parse_blob_id(ref: str) -> str:
+    """从blob_id、blob:引用或资源URI中取出blob_id"""
+    blob_id = ref
+    for prefix in (BLOB_SCHEME, RESOURCE_PREFIX):
+        if blob_id.startswith(prefix):
+            blob_id = blob_id[len(prefix):]
+            break
+    if not _BLOB_ID.fullmatch(blob_id):
+        raise ValueError(f"无效的暂存blob引用: {ref}")
+    return blob_id
+
+
+def is_blob_ref(ref: Optional[str]) -> bool:
+    return bool(ref) and ref.startswith((BLOB_SCHEME, RESOURCE_PREFIX))
+
+
+def resolve_path(ref: str) -> str:
+    """
+    把文件引用解析为本地路径
+
+    支持本地路径（包括共享内存目录中的文件）、file:// URI、blob:<id> 和 qyweixin://blobs/<id>。
+    """
+    if is_blob_ref(ref):
+        return blob_store.path(ref)
+    if ref.startswith("file://"):
+        return unquote(urlparse(ref).path)
+    return ref
+
+
+blob_store = BlobStore()
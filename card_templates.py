@@ -0,0 +1,137 @@
+import re
+import copy
+import json
+import threading
+from typing import Dict, Any, List, Callable
+from config import CARD_TYPES, CARD_TEMPLATES_FILE
+
+# 占位符格式：{{变量名}}，变量名是标识符（不以数字开头），{{0}} 等按普通文本保留
+_PLACEHOLDER = re.compile(r"\{\{\s*([^\W\d]\w*)\s*\}\}")
+
+# 列表字段的长度上限
+_LIST_LIMITS = {
+    "horizontal_content_list": 6,
+    "jump_list": 3,
+    "vertical_content_list": 4,
+    "action_list": 3,
+}
+
+
+class CardTemplate:
+    """
+    预编译的模板卡片
+
+    注册时把卡片结构编译成嵌套的构造函数，渲染时只做变量替换，不再解析模板。
+    字符串中的 {{name}} 会被替换为变量的字符串形式；整个值只有一个占位符时
+    替换为变量的深拷贝，可用于传入 horizontal_content_list、jump_list 等列表，
+    渲染结果不会与调用方的对象共享。
+    """
+
+    def __init__(self, name: str, template: Dict[str, Any]):
+        if not isinstance(template, dict):
+            raise ValueError("模板卡片必须是字典")
+        if template.get("card_type") not in CARD_TYPES:
+            raise ValueError(f"card_type必须是{CARD_TYPES}之一")
+
+        self.name = name
+        self.variables = set()
+        self._build = self._compile(template, None)
+
+    def render(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """用变量渲染出template_card字典"""
+        missing = self.variables.difference(values)
+        if missing:
+            raise ValueError(f"模板 {self.name} 缺少变量: {sorted(missing)}")
+        return self._build(values)
+
+    def _compile(self, node: Any, key: Any) -> Callable[[Dict[str, Any]], Any]:
+        """把模板节点编译为构造函数"""
+        if isinstance(node, dict):
+            builders = [(k, self._compile(v, k)) for k, v in node.items()]
+            return lambda values: {k: build(values) for k, build in builders}
+
+        if isinstance(node, list):
+            _check_list_length(key, node)
+            builders = [self._compile(item, None) for item in node]
+            return lambda values: [build(values) for build in builders]
+
+        if isinstance(node, str):
+            parts = _PLACEHOLDER.split(node)
+            if len(parts) == 1:
+                return lambda values: node
+
+            names = parts[1::2]
+            self.variables.update(names)
+
+            if len(parts) == 3 and not parts[0] and not parts[2]:
+                name = names[0]
+                if key in _LIST_LIMITS:
+                    def _build_list(values):
+                        value = values[name]
+                        _check_list_length(key, value)
+                        return copy.deepcopy(value)
+                    return _build_list
+                return lambda values: copy.deepcopy(values[name])
+
+            fmt = "".join(
+                part.replace("{", "{{").replace("}", "}}") if i % 2 == 0 else "{" + part + "}"
+                for i, part in enumerate(parts)
+            )
+            return lambda values: fmt.format_map(values)
+
+        return lambda values: node
+
+
+def _check_list_length(key: Any, value: Any):
+    """检查列表字段长度是否超出限制"""
+    limit = _LIST_LIMITS.get(key)
+    if limit is None:
+        return
+    if not isinstance(value, list):
+        raise ValueError(f"{key}必须是列表")
+    if len(value) > limit:
+        raise ValueError(f"{key}最多支持{limit}项，实际为{len(value)}项")
+
+
+_templates: Dict[str, CardTemplate] = {}
+_templates_lock = threading.Lock()
+
+
+def register_card_template(name: str, template: Dict[str, Any]) -> Dict[str, Any]:
+    """注册（或覆盖）命名模板卡片，返回模板需要的变量列表"""
+    compiled = CardTemplate(name, template)
+    with _templates_lock:
+        _templates[name] = compiled
+    return {"name": name, "variables": sorted(compiled.variables)}
+
+
+def get_card_template(name: str) -> CardTemplate:
+    """获取已注册的模板卡片"""
+    template = _templates.get(name)
+    if template is None:
+        raise ValueError(f"模板卡片不存在: {name}")
+    return template
+
+
+def list_card_templates() -> List[Dict[str, Any]]:
+    """列出所有已注册的模板卡片"""
+    return [{"name": t.name, "variables": sorted(t.variables)} for t in list(_templates.values())]
+
+
+def render_card_message(name: str, values: Dict[str, Any]) -> Dict[str, Any]:
+    """渲染完整的template_card消息体，可直接交给发送函数或批量发送"""
+    return {
+        "msgtype": "template_card",
+        "template_card": get_card_template(name).render(values)
+    }
+
+
+def load_card_templates(file_path: str):
+    """从JSON文件加载模板卡片，格式为 {模板名: 模板卡片}"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for name, template in json.load(f).items():
+            register_card_template(name, template)
+
+
+if CARD_TEMPLATES_FILE:
+    load_card_templates(CARD_TEMPLATES_FILE)
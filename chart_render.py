@@ -0,0 +1,167 @@
+import io
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional
+from config import MAX_IMAGE_SIZE, CHART_WORKERS, CHART_MAX_POINTS, REQUEST_TIMEOUT
+
+CHART_TYPES = ["line", "bar", "scatter"]
+
+# 超出图片大小限制时依次尝试的DPI
+_DPI_STEPS = [100, 80, 60, 45]
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _require_numpy():
+    """按需导入numpy"""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("生成图表需要安装numpy和matplotlib: pip install numpy matplotlib")
+    return numpy
+
+
+def lttb_downsample(x, y, threshold: int):
+    """
+    Largest-Triangle-Three-Buckets降采样，保留曲线的视觉形状
+
+    每个桶内三角形面积的计算是向量化的，只在桶之间循环，
+    循环次数等于目标点数而不是原始点数。
+    """
+    np = _require_numpy()
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    # 桶边界：首尾两个点单独保留，中间n-2个点分成threshold-2个桶
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    # 预先计算每个桶的平均点，作为下一桶三角形的第三个顶点
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        bx = x[start:end]
+        by = y[start:end]
+        area = np.abs((x[a] - avg_x[i + 1]) * (by - y[a]) - (x[a] - bx) * (avg_y[i + 1] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return x[selected], y[selected]
+
+
+def bucket_downsample(x, y, buckets: int):
+    """
+    把柱状图数据按顺序等分为buckets个桶，每个桶合并为一根柱子
+
+    柱子位于桶内x的平均位置，高度为桶内y的平均值，所有数据都参与计算，不会丢弃尾部的数据。
+    返回x、y和适合合并后间距的柱宽。
+    """
+    np = _require_numpy()
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if buckets >= n or buckets < 1:
+        return x, y, 0.8
+    edges = np.linspace(0, n, buckets + 1).astype(int)[:-1]
+    counts = np.diff(np.append(edges, n))
+    bx = np.add.reduceat(x, edges) / counts
+    by = np.add.reduceat(y, edges) / counts
+    spacing = np.abs(np.diff(bx))
+    spacing = spacing[spacing > 0]
+    return bx, by, 0.8 * float(spacing.min()) if len(spacing) else 0.8
+
+
+def render_chart(series: List[Dict[str, Any]], chart_type: str = "line", title: Optional[str] = None,
+                 x_label: Optional[str] = None, y_label: Optional[str] = None,
+                 width: float = 8, height: float = 4.5, max_points: int = CHART_MAX_POINTS) -> bytes:
+    """
+    在内存中渲染图表为PNG字节，超出图片大小限制时逐步降低分辨率
+
+    Args:
+        series: 数据序列，每个元素包含y，可选x和name
+        chart_type: 图表类型：line、bar或scatter
+        title: 图表标题
+        x_label: X轴标题
+        y_label: Y轴标题
+        width: 宽度（英寸）
+        height: 高度（英寸）
+        max_points: 每个序列最多绘制的点数，折线图和散点图超出时使用LTTB降采样，
+            柱状图超出时把相邻的数据合并为一根柱子（取平均值）
+
+    Returns:
+        bytes: PNG图片数据
+    """
+    np = _require_numpy()
+    try:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+    except ImportError:
+        raise ImportError("生成图表需要安装numpy和matplotlib: pip install numpy matplotlib")
+
+    if chart_type not in CHART_TYPES:
+        raise ValueError(f"不支持的图表类型: {chart_type}")
+    if not series:
+        raise ValueError("数据序列不能为空")
+
+    # 使用Figure对象而不是pyplot，避免全局状态
+    figure = Figure(figsize=(width, height))
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    for item in series:
+        if not item.get("y"):
+            raise ValueError("每个数据序列必须包含y")
+        y = np.asarray(item["y"], dtype=float)
+        x = np.asarray(item["x"], dtype=float) if item.get("x") else np.arange(len(y), dtype=float)
+        if len(x) != len(y):
+            raise ValueError("数据序列的x和y长度不一致")
+        if chart_type == "line":
+            x, y = lttb_downsample(x, y, max_points)
+            axes.plot(x, y, label=item.get("name"), linewidth=1.2)
+        elif chart_type == "scatter":
+            x, y = lttb_downsample(x, y, max_points)
+            axes.scatter(x, y, label=item.get("name"), s=6)
+        else:
+            x, y, bar_width = bucket_downsample(x, y, max_points)
+            axes.bar(x, y, width=bar_width, label=item.get("name"))
+
+    if title:
+        axes.set_title(title)
+    if x_label:
+        axes.set_xlabel(x_label)
+    if y_label:
+        axes.set_ylabel(y_label)
+    if any(item.get("name") for item in series):
+        axes.legend()
+    axes.grid(True, alpha=0.3)
+    figure.tight_layout()
+
+    for dpi in _DPI_STEPS:
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format="png", dpi=dpi)
+        if buffer.tell() <= MAX_IMAGE_SIZE:
+            return buffer.getvalue()
+    raise ValueError(f"图表渲染结果超出图片大小限制: {MAX_IMAGE_SIZE}")
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """延迟创建图表渲染进程池"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=CHART_WORKERS)
+        return _executor
+
+
+def render_chart_in_pool(**kwargs) -> bytes:
+    """在进程池中渲染图表，避免CPU密集的绘图阻塞服务进程"""
+    return _get_executor().submit(render_chart, **kwargs).result(timeout=REQUEST_TIMEOUT)
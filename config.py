@@ -1,17 +1,56 @@
 import os
+import tempfile
 
 # 环境变量配置
 KEY = os.environ.get("key")
 
+# 机器人池：同一个群中的其他机器人key（逗号分隔），与key一起分担发送频率限制
+ROBOT_KEYS = list(dict.fromkeys(
+    k.strip() for k in [KEY or ""] + os.environ.get("QYWEIXIN_KEYS", "").split(",") if k.strip()
+))
+ROBOT_POOL_STRATEGY = os.environ.get("QYWEIXIN_POOL_STRATEGY", "least_loaded")  # least_loaded或round_robin
+ROBOT_THROTTLE_COOLDOWN = 60  # 秒，机器人被限流（45009）后暂停使用的时间
+ROBOT_REVOKED_COOLDOWN = 600  # 秒，机器人key失效（93000）后暂停使用的时间
+
 # API URL 配置
-WEBHOOK_URL = f"https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key={KEY}"
-UPLOAD_URL_TEMPLATE = "https://qyapi.weixin.qq.com/cgi-bin/webhook/upload_media?key={key}&type={media_type}"
+API_BASE_URL = os.environ.get("QYWEIXIN_API_BASE", "https://qyapi.weixin.qq.com")
+WEBHOOK_URL_TEMPLATE = "{base_url}/cgi-bin/webhook/send?key={key}"
+WEBHOOK_URL = WEBHOOK_URL_TEMPLATE.format(base_url=API_BASE_URL, key=KEY)
+UPLOAD_URL_TEMPLATE = "{base_url}/cgi-bin/webhook/upload_media?key={key}&type={media_type}"
+
+# 服务运行配置：传输方式 stdio、http 或 sse；http 模式下可启动多个工作进程
+TRANSPORT = os.environ.get("QYWEIXIN_TRANSPORT", "stdio")
+HOST = os.environ.get("QYWEIXIN_HOST", "127.0.0.1")
+PORT = int(os.environ.get("QYWEIXIN_PORT", "8000"))
+WORKERS = int(os.environ.get("QYWEIXIN_WORKERS", "1"))
 
 # 文件大小限制（字节）
 MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB
 MAX_VOICE_SIZE = 2 * 1024 * 1024  # 2MB
 MAX_IMAGE_SIZE = 2 * 1024 * 1024  # 2MB
 
+# 在途载荷内存预算：图片编码和文件上传开始前预留，额度不足时排队，超过等待时间报错
+PAYLOAD_BUDGET_BYTES = int(float(os.environ.get("QYWEIXIN_PAYLOAD_BUDGET_MB", "64")) * 1024 * 1024)
+PAYLOAD_BUDGET_WAIT = float(os.environ.get("QYWEIXIN_PAYLOAD_BUDGET_WAIT", "30"))  # 秒，0表示不等待直接报错
+
+# 语音转码配置：非AMR语音用ffmpeg（需要libopencore_amrnb编码器）转为AMR，结果按内容哈希缓存
+FFMPEG_PATH = os.environ.get("QYWEIXIN_FFMPEG", "ffmpeg")
+VOICE_WORKERS = int(os.environ.get("QYWEIXIN_VOICE_WORKERS", "2"))
+VOICE_TRANSCODE_TIMEOUT = 60  # 秒
+VOICE_CACHE_DIR = os.environ.get("QYWEIXIN_VOICE_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "qyweixin-voice-cache")
+VOICE_CACHE_TTL = 24 * 3600  # 秒
+MAX_VOICE_DURATION = 60  # 秒，企业微信语音消息建议不超过60秒
+
+# 暂存blob配置：大文件可先暂存再按引用传给发送工具，默认放在共享内存目录，多个工作进程共用
+BLOB_DIR = os.environ.get("QYWEIXIN_BLOB_DIR") or os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "qyweixin-blobs"
+)
+BLOB_TTL = int(os.environ.get("QYWEIXIN_BLOB_TTL", "3600"))  # 秒
+MAX_BLOB_SIZE = MAX_FILE_SIZE
+
+# 大文件分卷大小，预留余量避免触及上传上限
+VOLUME_SIZE = MAX_FILE_SIZE - 64 * 1024
+
 # 消息长度限制（字节）
 MAX_TEXT_LENGTH = 2048
 MAX_MARKDOWN_LENGTH = 4096
@@ -28,6 +67,91 @@ MEDIA_TYPES = ["file", "voice"]
 # 卡片类型
 CARD_TYPES = ["text_notice", "news_notice"]
 
+# 预注册模板卡片的JSON文件路径（可选）
+CARD_TEMPLATES_FILE = os.environ.get("QYWEIXIN_CARD_TEMPLATES")
+
 # HTTP 配置
 REQUEST_TIMEOUT = 60
-UPLOAD_TIMEOUT = 30 
\ No newline at end of file
+UPLOAD_TIMEOUT = 30 
+# 连接失败时的重试次数和首次重试等待时间（秒，之后每次加倍）；
+# 读取响应超时不重试，webhook没有服务端幂等，重试可能产生重复消息
+SEND_RETRIES = int(os.environ.get("QYWEIXIN_SEND_RETRIES", "2"))
+SEND_RETRY_BACKOFF = 0.5
+UPLOAD_WORKERS = int(os.environ.get("QYWEIXIN_UPLOAD_WORKERS", "4"))
+HASH_WORKERS = int(os.environ.get("QYWEIXIN_HASH_WORKERS", "4"))
+
+# media_id缓存有效期（企业微信media_id有效期为3天，预留1小时余量）
+MEDIA_CACHE_TTL = 3 * 24 * 3600 - 3600
+
+# 目录/通配符批量发送配置
+MAX_BATCH_FILES = 50
+SMALL_FILE_SIZE = 1024 * 1024
+
+# 对冲请求配置（降低尾延迟）
+HEDGE_ENABLED = os.environ.get("QYWEIXIN_HEDGE", "0") == "1"
+HEDGE_PERCENTILE = float(os.environ.get("QYWEIXIN_HEDGE_PERCENTILE", "95"))
+HEDGE_DEFAULT_DELAY = 1.0  # 秒，延迟样本不足时使用
+HEDGE_MIN_SAMPLES = 20
+HEDGE_SAMPLE_SIZE = 500
+
+# 频率限制配置
+RATE_LIMIT_PER_MINUTE = int(os.environ.get("QYWEIXIN_RATE_LIMIT", "20"))
+RATE_LIMIT_MAX_WAIT = 120  # 秒
+# 自适应频率（AIMD）：收到45009时发送频率减半，持续按配额发送成功时每分钟增加1条，在上下限之间收敛到实际可用配额
+RATE_ADAPTIVE = os.environ.get("QYWEIXIN_RATE_ADAPTIVE", "1") == "1"
+RATE_LIMIT_MIN = 2
+RATE_LIMIT_MAX = int(os.environ.get("QYWEIXIN_RATE_LIMIT_MAX", "60"))
+RATE_DECREASE_FACTOR = 0.5
+RATE_INCREASE_STEP = 1  # 每分钟增加的条数
+RATE_DECREASE_INTERVAL = 10  # 秒，同一批被限流的请求只降低一次频率
+
+# 发送优先级通道（从高到低）
+PRIORITY_LANES = ["urgent", "high", "normal", "low"]
+DEFAULT_PRIORITY = "normal"
+STARVATION_AGE = 30  # 秒，低优先级消息排队超过该时间后优先放行
+QUEUE_OVERFLOW_THRESHOLD = int(os.environ.get("QYWEIXIN_QUEUE_THRESHOLD", "100"))
+QUEUE_OVERFLOW_POLICY = os.environ.get("QYWEIXIN_QUEUE_OVERFLOW", "block")  # block、shed或coalesce
+
+# 图文消息配置
+MAX_NEWS_ARTICLES = 8
+PICURL_CHECK_TIMEOUT = 5
+
+# 远程图片探测配置：发送模板卡片前只下载card_image的文件头读取图片尺寸，结果按URL缓存；
+# 图文消息的picurl只在批量发送指定check_picurl时探测
+IMAGE_PROBE_ENABLED = os.environ.get("QYWEIXIN_IMAGE_PROBE", "1") == "1"
+IMAGE_PROBE_MAX_BYTES = 64 * 1024  # JPEG的EXIF可能较大，最多读取的字节数
+IMAGE_PROBE_TIMEOUT = PICURL_CHECK_TIMEOUT
+IMAGE_PROBE_TTL = int(os.environ.get("QYWEIXIN_IMAGE_PROBE_TTL", "600"))  # 秒
+CARD_IMAGE_ASPECT_RATIO_RANGE = (1.3, 2.25)  # 模板卡片card_image的宽高比范围
+
+# 图表渲染配置
+CHART_WORKERS = int(os.environ.get("QYWEIXIN_CHART_WORKERS", "2"))
+CHART_MAX_POINTS = 1000
+
+# 状态存储地址：memory://、sqlite:///path/to/state.db 或 redis://host:6379/0
+STATE_URL = os.environ.get("QYWEIXIN_STATE_URL", "memory://")
+MEMORY_STORE_MAX_KEYS = 100000  # 内存状态存储最多保存的键数，超出时淘汰最早写入的可过期键
+
+# 去重配置
+DEDUPE_TTL = 600  # 秒
+
+# 幂等配置
+IDEMPOTENCY_TTL = int(os.environ.get("QYWEIXIN_IDEMPOTENCY_TTL", "86400"))  # 秒，幂等键保存发送结果的时间
+IDEMPOTENCY_PENDING_TTL = 60  # 秒，处理中的标记在进程异常退出后自动失效的时间，调用执行期间每1/3 TTL刷新一次
+MAX_IDEMPOTENCY_KEY_LENGTH = 128
+
+# 链路追踪配置
+TRACE_URL = os.environ.get("QYWEIXIN_TRACE_URL", "")  # 空为关闭，file:///path/traces.jsonl 或 OTLP/HTTP collector地址
+TRACE_SAMPLE_RATE = float(os.environ.get("QYWEIXIN_TRACE_SAMPLE", "0.1"))  # 根span的采样率
+TRACE_EXPORT_INTERVAL = 5  # 秒，批量导出间隔
+TRACE_QUEUE_SIZE = 10000  # 待导出span队列上限，超出时丢弃
+
+# 管理工具配置：性能分析等管理工具默认不注册
+ADMIN_TOOLS_ENABLED = os.environ.get("QYWEIXIN_ADMIN_TOOLS", "0") == "1"
+MAX_PROFILE_SECONDS = 300  # 单次性能分析的最长时间（秒）
+PROFILE_SAMPLE_INTERVAL = 0.005  # 秒，采样分析的采样间隔
+
+# 定时发送配置
+SCHEDULE_POLL_INTERVAL = float(os.environ.get("QYWEIXIN_SCHEDULE_POLL", "30"))  # 秒，检查其他进程新增定时消息的最长间隔
+SCHEDULE_MAX_RETRIES = 3  # 定时消息发送失败后的重试次数
+SCHEDULE_RETRY_DELAY = 60  # 秒，重试间隔，按重试次数递增
@@ -0,0 +1,140 @@
+import os
+import gzip
+import hashlib
+from typing import Dict, Any
+from config import VOLUME_SIZE
+
+COMPRESSIONS = ["gzip", "zstd", "none"]
+
+_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+_CHUNK_SIZE = 1024 * 1024
+
+
+class _VolumeWriter:
+    """可写文件对象，写满volume_size字节后自动切换到下一个分卷，并流式计算每卷的sha256"""
+
+    def __init__(self, base_path: str, volume_size: int):
+        self.base_path = base_path
+        self.volume_size = volume_size
+        self.volumes = []
+        self._file = None
+        self._hash = None
+        self._written = 0
+
+    def _open_next(self):
+        self._close_current()
+        path = f"{self.base_path}.{len(self.volumes) + 1:03d}"
+        self._file = open(path, 'wb')
+        self._hash = hashlib.sha256()
+        self._written = 0
+        self.volumes.append({"path": path})
+
+    def _close_current(self):
+        if self._file is not None:
+            self._file.close()
+            self.volumes[-1].update(size=self._written, sha256=self._hash.hexdigest())
+            self._file = None
+
+    def write(self, data) -> int:
+        view = memoryview(data)
+        while view:
+            if self._file is None or self._written >= self.volume_size:
+                self._open_next()
+            n = min(len(view), self.volume_size - self._written)
+            self._file.write(view[:n])
+            self._hash.update(view[:n])
+            self._written += n
+            view = view[n:]
+        return len(data)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        self._close_current()
+
+
+def split_compressed_volumes(file_path: str, output_dir: str, compression: str = "gzip",
+                             volume_size: int = VOLUME_SIZE) -> Dict[str, Any]:
+    """
+    把文件流式压缩并切分为不超过volume_size的分卷，全程按块读写，不会把整个文件读入内存
+
+    分卷是压缩流的顺序切片，合并方式为按序号拼接后解压，
+    例如 cat data.log.gz.* > data.log.gz && gunzip data.log.gz。
+    只有一卷时去掉序号后缀。
+
+    Returns:
+        Dict: 原始文件信息和分卷列表（path、size、sha256）
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"不支持的压缩方式: {compression}")
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"文件不存在: {file_path}")
+    if os.path.getsize(file_path) == 0:
+        raise ValueError(f"文件为空: {file_path}")
+
+    name = os.path.basename(file_path) + _EXTENSIONS[compression]
+    writer = _VolumeWriter(os.path.join(output_dir, name), volume_size)
+    if compression == "gzip":
+        stream = gzip.GzipFile(filename=os.path.basename(file_path), mode='wb', fileobj=writer)
+    elif compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd压缩需要安装zstandard: pip install zstandard")
+        stream = zstandard.ZstdCompressor(threads=-1).stream_writer(writer, closefd=False)
+    else:
+        stream = writer
+
+    source_hash = hashlib.sha256()
+    source_size = 0
+    try:
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+                source_hash.update(chunk)
+                source_size += len(chunk)
+                stream.write(chunk)
+        if stream is not writer:
+            stream.close()
+    finally:
+        writer.close()
+
+    volumes = writer.volumes
+    if len(volumes) == 1:
+        single_path = os.path.join(output_dir, name)
+        os.replace(volumes[0]["path"], single_path)
+        volumes[0]["path"] = single_path
+
+    return {
+        "name": os.path.basename(file_path),
+        "size": source_size,
+        "sha256": source_hash.hexdigest(),
+        "archive_name": name,
+        "compression": compression,
+        "volumes": volumes
+    }
+
+
+def build_volume_manifest(info: Dict[str, Any]) -> str:
+    """生成分卷清单Markdown消息"""
+    mb = 1024 * 1024
+    volumes = info["volumes"]
+    lines = [
+        "**文件分卷清单**",
+        f"> 文件: {info['name']} ({info['size'] / mb:.1f}MB)",
+        f"> sha256: {info['sha256']}",
+        f"> 压缩: {info['compression']}，共 {len(volumes)} 卷",
+    ]
+    for i, volume in enumerate(volumes, 1):
+        lines.append(f"> {i}. {os.path.basename(volume['path'])} "
+                     f"{volume['size'] / mb:.1f}MB sha256: {volume['sha256'][:16]}")
+
+    archive = info["archive_name"]
+    restore = {"gzip": f"gunzip {archive}", "zstd": f"zstd -d {archive}", "none": ""}[info["compression"]]
+    if len(volumes) > 1:
+        merge = f"cat {archive}.* > {archive}"
+        restore = f"{merge} && {restore}" if restore else merge
+    if restore:
+        lines.append(f"> 还原: `{restore}`")
+    return "\n".join(lines)
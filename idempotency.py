@@ -0,0 +1,131 @@
+import time
+import json
+import threading
+import hashlib
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+from config import IDEMPOTENCY_TTL, IDEMPOTENCY_PENDING_TTL, MAX_IDEMPOTENCY_KEY_LENGTH, RATE_LIMIT_MAX_WAIT, REQUEST_TIMEOUT
+from state_store import get_state_store
+from tracing import current_span
+
+_NAMESPACE = "idempotency"
+
+# 等待相同幂等键的请求完成的最长时间（秒）
+_WAIT_TIMEOUT = RATE_LIMIT_MAX_WAIT + REQUEST_TIMEOUT
+
+# 当前工具调用的幂等键和已发送消息的序号，用于为每条消息生成确定的client_msg_id
+_current = contextvars.ContextVar("qyweixin_idempotency", default=None)
+
+
+def _fingerprint(params: Dict[str, Any]) -> str:
+    """请求参数的摘要，用于发现同一个幂等键被用于不同请求"""
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def next_message_id() -> Optional[str]:
+    """
+    返回当前幂等调用中下一条消息的client_msg_id，不在幂等调用中时返回None
+
+    同一次工具调用按顺序发送的第N条消息总是得到相同的ID，调用中途失败后用同一个幂等键重试时，
+    已经投递过的消息会命中去重窗口直接返回首次结果，只补发剩余的消息。
+    """
+    state = _current.get()
+    if state is None:
+        return None
+    state["count"] += 1
+    return f"idem:{state['key']}:{state['count']}"
+
+
+def run_idempotent(key: Optional[str], scope: str, params: Dict[str, Any], fn: Callable[[], Any]) -> Any:
+    """
+    以幂等方式执行工具调用
+
+    相同幂等键的重复调用直接返回首次调用的结果，不会再次发送；首次调用仍在处理中时等待其完成。
+    调用抛出异常或返回非零errcode时清除记录，允许使用同一个幂等键重试，
+    重试时已投递的消息由去重窗口跳过。
+
+    Args:
+        key: 幂等键，为空时直接执行
+        scope: 工具名称，不同工具的幂等键互不影响
+        params: 调用参数，同一个幂等键用于不同参数时报错
+        fn: 实际执行的函数
+
+    Returns:
+        Any: 执行结果或首次调用的结果
+    """
+    if not key:
+        return fn()
+    if len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise ValueError(f"幂等键过长，最大支持{MAX_IDEMPOTENCY_KEY_LENGTH}个字符")
+
+    store = get_state_store()
+    store_key = f"{scope}:{key}"
+    fingerprint = _fingerprint(params)
+    pending = {"status": "pending", "fingerprint": fingerprint}
+
+    while not store.add(_NAMESPACE, store_key, pending, ttl=IDEMPOTENCY_PENDING_TTL):
+        record = _wait_record(store, store_key, fingerprint)
+        if record is not None:
+            current_span().set_attribute("idempotency.replay", True)
+            return record["result"]
+        # 首次调用失败后记录已被清除，由本次调用重新执行
+
+    token = _current.set({"key": store_key, "count": 0})
+    try:
+        with _keep_pending(store, store_key, pending):
+            result = fn()
+    except BaseException:
+        store.delete(_NAMESPACE, store_key)
+        raise
+    finally:
+        _current.reset(token)
+    if isinstance(result, dict) and result.get("errcode", 0) != 0:
+        store.delete(_NAMESPACE, store_key)
+        return result
+    store.set(_NAMESPACE, store_key, {"status": "done", "fingerprint": fingerprint, "result": result},
+              ttl=IDEMPOTENCY_TTL)
+    return result
+
+
+@contextmanager
+def _keep_pending(store, store_key: str, pending: Dict[str, Any]):
+    """
+    调用执行期间定期刷新处理中的标记
+
+    排队等待配额、分卷上传等长时间调用不会因标记过期而被相同幂等键的重试再次执行；
+    进程异常退出后停止刷新，标记在IDEMPOTENCY_PENDING_TTL后失效。退出时等待刷新线程结束，
+    避免在写入结果之后又被刷新覆盖。
+    """
+    stop = threading.Event()
+
+    def refresh():
+        while not stop.wait(IDEMPOTENCY_PENDING_TTL / 3):
+            store.set(_NAMESPACE, store_key, pending, ttl=IDEMPOTENCY_PENDING_TTL)
+
+    thread = threading.Thread(target=refresh, name="qyweixin-idempotency", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _wait_record(store, store_key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+    """等待相同幂等键的首次调用完成，返回其记录；首次调用失败时返回None"""
+    deadline = time.monotonic() + _WAIT_TIMEOUT
+    delay = 0.05
+    while True:
+        record = store.get(_NAMESPACE, store_key)
+        if record is None:
+            return None
+        if record["fingerprint"] != fingerprint:
+            raise ValueError("幂等键已用于参数不同的请求")
+        if record["status"] == "done":
+            return record
+        if time.monotonic() >= deadline:
+            raise TimeoutError("相同幂等键的请求仍在处理中，请稍后重试")
+        time.sleep(delay)
+        delay = min(delay * 2, 1.0)
@@ -0,0 +1,163 @@
+import struct
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from config import IMAGE_PROBE_MAX_BYTES, IMAGE_PROBE_TIMEOUT, IMAGE_PROBE_TTL
+from state_store import get_state_store
+from tracing import span, bind_context
+
+# 每次读取的网络数据块大小
+_READ_CHUNK = 4096
+
+# JPEG中携带图片尺寸的SOF标记（C4、C8、CC不是SOF）
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+_session = requests.Session()
+
+
+def parse_image_size(head: bytes) -> Optional[Tuple[str, int, int]]:
+    """
+    从文件头解析图片格式和尺寸
+
+    支持PNG、JPEG、GIF和WebP。文件头不完整、需要更多数据时返回None。
+
+    Args:
+        head: 文件开头的若干字节
+
+    Returns:
+        Optional[Tuple[str, int, int]]: (格式, 宽, 高)
+    """
+    if len(head) < 12:
+        return None
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        if len(head) < 24:
+            return None
+        if head[12:16] != b"IHDR":
+            raise ValueError("PNG文件头损坏")
+        width, height = struct.unpack(">II", head[16:24])
+        return "png", width, height
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        width, height = struct.unpack("<HH", head[6:10])
+        return "gif", width, height
+    if head.startswith(b"\xff\xd8"):
+        return _parse_jpeg_size(head)
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return _parse_webp_size(head)
+    raise ValueError("不是PNG、JPEG、GIF或WebP图片")
+
+
+def _parse_jpeg_size(head: bytes) -> Optional[Tuple[str, int, int]]:
+    """逐个跳过JPEG段，直到找到SOF段"""
+    pos = 2
+    while pos + 4 <= len(head):
+        if head[pos] != 0xFF:
+            raise ValueError("JPEG文件头损坏")
+        marker = head[pos + 1]
+        if marker == 0xFF:
+            # 填充字节
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # 没有长度字段的标记
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            raise ValueError("JPEG文件中没有图片尺寸")
+        if marker in _JPEG_SOF_MARKERS:
+            if pos + 9 > len(head):
+                return None
+            height, width = struct.unpack(">HH", head[pos + 5:pos + 9])
+            return "jpeg", width, height
+        pos += 2 + struct.unpack(">H", head[pos + 2:pos + 4])[0]
+    return None
+
+
+def _parse_webp_size(head: bytes) -> Optional[Tuple[str, int, int]]:
+    """按第一个块的类型读取有损、无损或扩展格式WebP的画布尺寸"""
+    if len(head) < 30:
+        return None
+    chunk = head[12:16]
+    if chunk == b"VP8 ":
+        if head[23:26] != b"\x9d\x01\x2a":
+            raise ValueError("WebP文件头损坏")
+        width, height = struct.unpack("<HH", head[26:30])
+        return "webp", width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        if head[20] != 0x2F:
+            raise ValueError("WebP文件头损坏")
+        bits = struct.unpack("<I", head[21:25])[0]
+        return "webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        width = int.from_bytes(head[24:27], "little") + 1
+        height = int.from_bytes(head[27:30], "little") + 1
+        return "webp", width, height
+    raise ValueError("WebP文件头损坏")
+
+
+def _fetch_image_size(url: str) -> Dict[str, Any]:
+    """
+    只下载文件头读取图片尺寸
+
+    用Range请求前IMAGE_PROBE_MAX_BYTES字节；服务器不支持Range时同样边读边解析，
+    读到尺寸后立即关闭连接，不下载整张图片。
+    """
+    headers = {"Range": f"bytes=0-{IMAGE_PROBE_MAX_BYTES - 1}"}
+    with _session.get(url, headers=headers, timeout=IMAGE_PROBE_TIMEOUT, stream=True) as response:
+        if response.status_code not in (200, 206):
+            raise ValueError(f"HTTP {response.status_code}")
+        head = b""
+        for chunk in response.iter_content(_READ_CHUNK):
+            head += chunk
+            size = parse_image_size(head)
+            if size:
+                image_format, width, height = size
+                if not width or not height:
+                    raise ValueError("图片尺寸无效")
+                return {"url": url, "format": image_format, "width": width, "height": height,
+                        "probed_bytes": len(head)}
+            if len(head) >= IMAGE_PROBE_MAX_BYTES:
+                break
+    raise ValueError(f"前{IMAGE_PROBE_MAX_BYTES}字节中没有图片尺寸" if head else "响应为空")
+
+
+def probe_image(url: str) -> Dict[str, Any]:
+    """
+    探测远程图片的格式和尺寸，成功的结果按URL缓存IMAGE_PROBE_TTL秒
+
+    Args:
+        url: 图片URL
+
+    Returns:
+        Dict: 成功时包含format、width、height，失败时包含error
+    """
+    store = get_state_store()
+    with span("image.probe", **{"url.full": url}) as probe_span:
+        cached = store.get("image_probe", url)
+        probe_span.set_attribute("cache.hit", cached is not None)
+        if cached is not None:
+            return cached
+        try:
+            result = _fetch_image_size(url)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            probe_span.record_exception(e)
+            return {"url": url, "error": str(e)}
+        store.set("image_probe", url, result, IMAGE_PROBE_TTL)
+        return result
+
+
+def probe_images(urls: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    并发探测多张图片，重复的URL只探测一次
+
+    Args:
+        urls: 图片URL列表
+
+    Returns:
+        Dict: URL到探测结果的映射
+    """
+    urls = list(dict.fromkeys(urls))
+    if len(urls) <= 1:
+        return {url: probe_image(url) for url in urls}
+    with ThreadPoolExecutor(max_workers=min(8, len(urls))) as executor:
+        results = list(executor.map(bind_context(probe_image), urls))
+    return dict(zip(urls, results))
@@ -0,0 +1,182 @@
+import re
+import binascii
+import hashlib
+from typing import Dict, Any, Iterable, Optional, Union
+
+# 每次编码的原始数据块大小，必须是3的倍数，保证块之间不产生base64填充
+CHUNK_SIZE = 3 * 64 * 1024
+
+# 调用方传入的base64每次校验和解码的字符数，必须是4的倍数
+BASE64_CHUNK_SIZE = CHUNK_SIZE // 3 * 4
+
+# 图片消息支持的格式及其文件头
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+]
+
+_WHITESPACE = re.compile(r"\s+")
+_BASE64_BODY = re.compile(rb"[A-Za-z0-9+/]*")
+_BASE64_TAIL = re.compile(rb"[A-Za-z0-9+/]*={0,2}")
+
+_IMAGE_PREFIX = b'{"msgtype": "image", "image": {"base64": "'
+_IMAGE_MIDDLE = b'", "md5": "'
+_IMAGE_SUFFIX = b'"}}'
+
+
+class EncodedMessage(dict):
+    """
+    已编码好请求体的消息
+
+    字典部分只保存msgtype和摘要信息，供调度、去重和追踪使用；
+    body是完整的JSON请求体，发送时直接使用，不再序列化。
+    """
+
+    def __init__(self, data: Dict[str, Any], body: Union[bytes, bytearray]):
+        super().__init__(data)
+        self.body = body
+
+
+def encode_image_message(chunks: Iterable[Union[bytes, bytearray, memoryview]], size: int) -> EncodedMessage:
+    """
+    把图片数据流式编码为图片消息的JSON请求体
+
+    请求体按最终长度一次性分配，base64输出逐块写入，同时计算MD5，
+    不产生完整的base64字符串、消息字典和序列化结果等中间副本。
+    base64字符都不需要JSON转义，可以直接写入。
+
+    Args:
+        chunks: 图片数据块，块长度不是3的倍数时余下的字节并入下一块
+        size: 图片总字节数
+
+    Returns:
+        EncodedMessage: 图片消息
+    """
+    base64_size = (size + 2) // 3 * 4
+    body = bytearray(len(_IMAGE_PREFIX) + base64_size + len(_IMAGE_MIDDLE) + 32 + len(_IMAGE_SUFFIX))
+    view = memoryview(body)
+    pos = len(_IMAGE_PREFIX)
+    view[:pos] = _IMAGE_PREFIX
+
+    md5 = hashlib.md5()
+    total = 0
+    carry = b''
+    for chunk in chunks:
+        total += len(chunk)
+        if total > size:
+            raise ValueError(f"图片数据超过预期长度: {size}")
+        md5.update(chunk)
+        if carry:
+            chunk = carry + bytes(chunk)
+        usable = len(chunk) - len(chunk) % 3
+        encoded = binascii.b2a_base64(memoryview(chunk)[:usable], newline=False)
+        view[pos:pos + len(encoded)] = encoded
+        pos += len(encoded)
+        carry = bytes(chunk[usable:])
+    if total != size:
+        raise ValueError(f"图片数据长度不一致: 预期{size}字节，实际{total}字节")
+    if carry:
+        encoded = binascii.b2a_base64(carry, newline=False)
+        view[pos:pos + len(encoded)] = encoded
+        pos += len(encoded)
+
+    digest = md5.hexdigest()
+    for part in (_IMAGE_MIDDLE, digest.encode('ascii'), _IMAGE_SUFFIX):
+        view[pos:pos + len(part)] = part
+        pos += len(part)
+    view.release()
+    return EncodedMessage({"msgtype": "image", "image": {"md5": digest, "size": size}}, body)
+
+
+def sniff_image_format(head: bytes) -> Optional[str]:
+    """根据文件头识别图片格式，不是支持的格式时返回None"""
+    for signature, image_format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    # WEBP的文件头为RIFF+4字节长度+WEBP
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def encode_base64_image_message(image_base64: str, max_size: int, image_md5: Optional[str] = None) -> EncodedMessage:
+    """
+    校验调用方传入的base64图片并编码为图片消息
+
+    解码后的大小由base64长度直接算出，超过上限时不做任何解码就报错。其余检查在一次分块遍历中完成：
+    校验base64字符和填充位置、用第一块识别图片格式、计算MD5（传入image_md5时核对一致），
+    同时把已校验的base64直接写入请求体。每次只解码一块，除请求体外内存占用与图片大小无关。
+    按行折断或带有空白的base64先去除空白再校验。
+
+    Args:
+        image_base64: 图片的base64编码
+        max_size: 解码后的最大字节数
+        image_md5: 调用方提供的MD5值
+
+    Returns:
+        EncodedMessage: 图片消息
+    """
+    if _WHITESPACE.search(image_base64):
+        image_base64 = _WHITESPACE.sub("", image_base64)
+    length = len(image_base64)
+    if length == 0 or length % 4:
+        raise ValueError("image_base64不是有效的base64编码：长度必须是4的倍数")
+    padding = 2 if image_base64.endswith("==") else 1 if image_base64.endswith("=") else 0
+    size = length // 4 * 3 - padding
+    if size > max_size:
+        raise ValueError(f"图片大小超出限制: {size} > {max_size}")
+
+    body = bytearray(len(_IMAGE_PREFIX) + length + len(_IMAGE_MIDDLE) + 32 + len(_IMAGE_SUFFIX))
+    view = memoryview(body)
+    pos = len(_IMAGE_PREFIX)
+    view[:pos] = _IMAGE_PREFIX
+
+    md5 = hashlib.md5()
+    image_format = None
+    for start in range(0, length, BASE64_CHUNK_SIZE):
+        try:
+            chunk = image_base64[start:start + BASE64_CHUNK_SIZE].encode('ascii')
+        except UnicodeEncodeError:
+            raise ValueError("image_base64包含非base64字符")
+        # 填充只能出现在末尾
+        pattern = _BASE64_TAIL if start + BASE64_CHUNK_SIZE >= length else _BASE64_BODY
+        if not pattern.fullmatch(chunk):
+            raise ValueError("image_base64包含非base64字符或位置错误的填充")
+        decoded = binascii.a2b_base64(chunk)
+        if image_format is None:
+            image_format = sniff_image_format(decoded)
+            if image_format is None:
+                raise ValueError("image_base64不是JPG、PNG、GIF、BMP或WEBP图片")
+        md5.update(decoded)
+        view[pos:pos + len(chunk)] = chunk
+        pos += len(chunk)
+
+    digest = md5.hexdigest()
+    if image_md5 and image_md5.lower() != digest:
+        raise ValueError(f"image_md5与图片数据不一致: {image_md5} != {digest}")
+    for part in (_IMAGE_MIDDLE, digest.encode('ascii'), _IMAGE_SUFFIX):
+        view[pos:pos + len(part)] = part
+        pos += len(part)
+    view.release()
+    return EncodedMessage({"msgtype": "image", "image": {"md5": digest, "size": size, "format": image_format}}, body)
+
+
+def iter_buffer(data: Union[bytes, bytearray], chunk_size: int = CHUNK_SIZE) -> Iterable[memoryview]:
+    """按块切分内存中的数据，切片不复制数据"""
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size]
+
+
+def iter_file(f, chunk_size: int = CHUNK_SIZE) -> Iterable[memoryview]:
+    """按块读取文件，复用同一个缓冲区，调用方需在读取下一块前用完上一块"""
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    while True:
+        n = f.readinto(buffer)
+        if not n:
+            return
+        yield view[:n]
@@ -1,33 +1,62 @@
 import os
-import requests
-import hashlib
+import re
+import glob
+import time
+import zipfile
+import tempfile
+import shutil
+import uuid
 import base64
+import binascii
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional, List
-from config import WEBHOOK_URL, REQUEST_TIMEOUT, MAX_TEXT_LENGTH, MAX_MARKDOWN_LENGTH, MAX_IMAGE_SIZE
-from utils import qyweixin_upload_media
+from config import (
+    REQUEST_TIMEOUT, MAX_TEXT_LENGTH, MAX_MARKDOWN_LENGTH, MAX_IMAGE_SIZE,
+    MAX_FILE_SIZE, UPLOAD_WORKERS, HASH_WORKERS, MAX_BATCH_FILES, SMALL_FILE_SIZE,
+    DEFAULT_PRIORITY, PRIORITY_LANES, MAX_NEWS_ARTICLES, IMAGE_PROBE_ENABLED, CARD_IMAGE_ASPECT_RATIO_RANGE
+)
+from utils import qyweixin_upload_media, qyweixin_upload_media_cached, get_cached_media_id, file_sha256
+from webhook_client import current_client
+from payload_budget import image_payload_bytes
+from message_body import (
+    EncodedMessage, encode_image_message, encode_base64_image_message, iter_buffer, iter_file
+)
+from card_templates import render_card_message
+from report_templates import compile_report_template, get_report_template
+from table_render import Column, iter_delimited_file, render_table_pages, write_csv
+from chart_render import render_chart_in_pool
+from file_volumes import split_compressed_volumes, build_volume_manifest
+from scheduled_delivery import DeliveryScheduler, parse_send_at
+from blob_store import blob_store, resolve_path
+from voice_transcode import prepare_voice
+from image_probe import probe_images
+from tracing import span, current_span, bind_context
 
 
-def _send_message(data: Dict[str, Any]) -> Dict[str, Any]:
+def _send_message(data: Dict[str, Any], client_msg_id: Optional[str] = None,
+                  priority: str = DEFAULT_PRIORITY, sticky_key: Optional[str] = None) -> Dict[str, Any]:
     """
-    发送消息到企业微信的通用函数
+    通过当前客户端发送消息（见WebhookClient.send）
     
     Args:
         data: 消息数据字典
+        client_msg_id: 客户端消息ID，去重窗口内重复的ID直接返回首次投递结果
+        priority: 优先级通道：urgent、high、normal或low
+        sticky_key: 相关消息的粘性键，相同的键优先由同一个机器人发送
     
     Returns:
         Dict: 响应结果
     """
-    response = requests.post(
-        WEBHOOK_URL,
-        json=data,
-        timeout=REQUEST_TIMEOUT
-    )
-    response.raise_for_status()
-    return response.json()
+    return current_client().send(data, client_msg_id, priority, sticky_key)
+
+
+# 定时消息到期后走与即时消息相同的去重、优先级和限流路径
+delivery_scheduler = DeliveryScheduler(_send_message)
 
 
 def qyweixin_text(content: str, mentioned_list: Optional[List[str]] = None, 
-                  mentioned_mobile_list: Optional[List[str]] = None) -> Dict[str, Any]:
+                  mentioned_mobile_list: Optional[List[str]] = None,
+                  priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
     """
     发送文本消息
     
@@ -35,6 +64,7 @@ def qyweixin_text(content: str, mentioned_list: Optional[List[str]] = None,
         content: 文本内容
         mentioned_list: 用户ID列表，用于@指定用户
         mentioned_mobile_list: 手机号列表，用于@指定用户
+        priority: 发送优先级：urgent、high、normal或low
     
     Returns:
         Dict: 发送结果
@@ -54,15 +84,16 @@ def qyweixin_text(content: str, mentioned_list: Optional[List[str]] = None,
     if mentioned_mobile_list:
         data["text"]["mentioned_mobile_list"] = mentioned_mobile_list
     
-    return _send_message(data)
+    return _send_message(data, priority=priority)
 
 
-def qyweixin_markdown(content: str) -> Dict[str, Any]:
+def qyweixin_markdown(content: str, priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
     """
     发送Markdown消息
     
     Args:
         content: Markdown内容
+        priority: 发送优先级：urgent、high、normal或low
     
     Returns:
         Dict: 发送结果
@@ -77,15 +108,16 @@ def qyweixin_markdown(content: str) -> Dict[str, Any]:
         }
     }
     
-    return _send_message(data)
+    return _send_message(data, priority=priority)
 
 
-def qyweixin_markdown_v2(content: str) -> Dict[str, Any]:
+def qyweixin_markdown_v2(content: str, priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
     """
     发送Markdown_v2增强消息（支持表格、图片、分割线、代码块等增强功能）
     
     Args:
         content: Markdown v2内容，最长不超过4096个字节，必须是utf8编码
+        priority: 发送优先级：urgent、high、normal或low
     
     Returns:
         Dict: 发送结果
@@ -101,19 +133,115 @@ def qyweixin_markdown_v2(content: str) -> Dict[str, Any]:
         }
     }
     
-    return _send_message(data)
+    return _send_message(data, priority=priority)
+
+
+def qyweixin_markdown_report(context: Dict[str, Any], template: Optional[str] = None,
+                             template_name: Optional[str] = None, overflow: str = "truncate",
+                             markdown_v2: bool = False, priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
+    """
+    渲染Markdown报告模板并发送，超出长度限制时按分节优先级截断或分页
+    
+    Args:
+        context: 模板变量
+        template: 模板源码，编译结果会被缓存
+        template_name: 已注册的模板名称，与template二选一
+        overflow: 超出长度时的处理方式：truncate、paginate或error
+        markdown_v2: 是否以markdown_v2类型发送
+        priority: 发送优先级：urgent、high、normal或low
+    
+    Returns:
+        Dict: 汇总结果，包含每条消息的发送结果
+    """
+    if not template and not template_name:
+        raise ValueError("必须提供template或template_name")
+    
+    report = get_report_template(template_name) if template_name else compile_report_template(template)
+    msgtype = "markdown_v2" if markdown_v2 else "markdown"
+    pages = report.render(context, MAX_MARKDOWN_LENGTH, overflow)
+    
+    return _send_in_order([{"msgtype": msgtype, msgtype: {"content": page}} for page in pages], priority)
+
+
+def qyweixin_markdown_table(columns: Optional[List[Any]] = None, rows: Optional[List[Any]] = None,
+                            file_path: Optional[str] = None, title: Optional[str] = None,
+                            max_messages: int = 5, max_width: int = 30,
+                            priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
+    """
+    把结构化数据渲染为Markdown表格并以markdown_v2发送，超出长度时自动拆分为多条消息，
+    超过max_messages条时改为发送CSV文件，超过20MB的文件按qyweixin_large_file分卷发送
+    
+    Args:
+        columns: 列定义，列名或 {key, title, format, align, max_width} 字典；使用文件时默认取表头
+        rows: 表格行，字典或列表
+        file_path: CSV/TSV文件路径或暂存blob引用，与rows二选一，逐行流式读取
+        title: 表格标题
+        max_messages: 最多拆分的消息条数
+        max_width: 单元格最大字符数
+        priority: 发送优先级：urgent、high、normal或low
+    
+    Returns:
+        Dict: 汇总结果，mode为markdown_v2或file
+    """
+    if (rows is None) == (file_path is None):
+        raise ValueError("必须提供rows或file_path中的一个")
+    
+    if file_path:
+        file_path = resolve_path(file_path)
+        header, row_iter = iter_delimited_file(file_path)
+        columns = [Column.from_spec(c) for c in (columns or header)]
+    else:
+        if not columns:
+            if rows and isinstance(rows[0], dict):
+                columns = list(rows[0].keys())
+            else:
+                raise ValueError("rows为列表时必须提供columns")
+        columns = [Column.from_spec(c) for c in columns]
+        row_iter = iter(rows)
+    
+    try:
+        pages, complete = render_table_pages(columns, row_iter, title, MAX_MARKDOWN_LENGTH, max_messages, max_width)
+    finally:
+        if file_path:
+            row_iter.close()
+    if complete:
+        result = _send_in_order([{"msgtype": "markdown_v2", "markdown_v2": {"content": page}} for page in pages], priority)
+        result["mode"] = "markdown_v2"
+        return result
+    
+    # 数据过多，改为发送文件；数据量大的表格正是这种情况，文件可能超过20MB，按分卷发送
+    if file_path:
+        result = qyweixin_large_file(file_path, priority=priority)
+    else:
+        temp_dir = tempfile.mkdtemp(prefix="qyweixin_table_")
+        try:
+            csv_path = os.path.join(temp_dir, _table_file_name(title))
+            write_csv(csv_path, columns, rows)
+            result = qyweixin_large_file(csv_path, priority=priority)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    result["mode"] = "file"
+    return result
+
+
+def _table_file_name(title: Optional[str]) -> str:
+    """表格CSV文件名：标题中的路径分隔符和控制字符替换为下划线，标题为空时使用table.csv"""
+    name = re.sub(r'[\\/\x00-\x1f]', '_', title or '').strip(' .')[:80]
+    return f"{name}.csv" if name else "table.csv"
 
 
 def qyweixin_image(image_url: Optional[str] = None, image_path: Optional[str] = None, 
-                   image_base64: Optional[str] = None, image_md5: Optional[str] = None) -> Dict[str, Any]:
+                   image_base64: Optional[str] = None, image_md5: Optional[str] = None,
+                   priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
     """
     发送图片消息
     
     Args:
         image_url: 图片URL地址
-        image_path: 本地图片文件路径
+        image_path: 本地图片文件路径、file:// URI或暂存blob引用（blob:<id>、qyweixin://blobs/<id>）
         image_base64: 图片base64编码
         image_md5: 图片MD5值
+        priority: 发送优先级：urgent、high、normal或low
     
     Returns:
         Dict: 发送结果
@@ -121,33 +249,83 @@ def qyweixin_image(image_url: Optional[str] = None, image_path: Optional[str] =
     if not any([image_url, image_path, image_base64]):
         raise ValueError("必须提供image_url、image_path或image_base64中的一个")
     
-    data = {
-        "msgtype": "image",
-        "image": {}
-    }
+    if image_path:
+        image_path = resolve_path(image_path)
     
-    if image_url:
-        data["image"]["base64"] = _get_image_base64_from_url(image_url)
-        data["image"]["md5"] = _get_image_md5_from_url(image_url)
-    elif image_path:
-        data["image"]["base64"] = _get_image_base64_from_file(image_path)
-        data["image"]["md5"] = _get_image_md5_from_file(image_path)
-    else:
-        data["image"]["base64"] = image_base64
-        if image_md5:
-            data["image"]["md5"] = image_md5
+    # 编码和排队发送期间请求体一直驻留内存，预留额度直到发送完成
+    with current_client().payload_budget.reserve(_image_budget_bytes(image_url, image_path, image_base64)):
+        if image_url:
+            data = _image_message_from_url(image_url)
+        elif image_path:
+            data = _image_message_from_file(image_path)
         else:
-            data["image"]["md5"] = _get_md5_from_base64(image_base64)
+            data = _image_message_from_base64(image_base64, image_md5)
+        
+        return _send_message(data, priority=priority)
+
+
+def _image_budget_bytes(image_url: Optional[str], image_path: Optional[str], image_base64: Optional[str]) -> int:
+    """图片消息需要预留的内存额度，URL图片在下载前大小未知，按上限预留"""
+    if image_url:
+        return image_payload_bytes(MAX_IMAGE_SIZE)
+    if image_path:
+        return image_payload_bytes(os.path.getsize(image_path) if os.path.exists(image_path) else 0)
+    return image_payload_bytes(len(image_base64) * 3 // 4)
+
+
+def qyweixin_image_bytes(image_data: bytes, priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
+    """
+    直接发送内存中的图片数据，不经过临时文件
     
-    return _send_message(data)
+    Args:
+        image_data: 图片二进制数据
+        priority: 发送优先级：urgent、high、normal或low
+    
+    Returns:
+        Dict: 发送结果
+    """
+    if len(image_data) > MAX_IMAGE_SIZE:
+        raise ValueError(f"图片大小超出限制: {len(image_data)} > {MAX_IMAGE_SIZE}")
+    
+    with current_client().payload_budget.reserve(image_payload_bytes(len(image_data))):
+        with span("image.encode", **{"image.size": len(image_data)}):
+            data = encode_image_message(iter_buffer(image_data), len(image_data))
+        return _send_message(data, priority=priority)
+
+
+def qyweixin_chart(series: List[Dict[str, Any]], chart_type: str = "line", title: Optional[str] = None,
+                   x_label: Optional[str] = None, y_label: Optional[str] = None,
+                   width: float = 8, height: float = 4.5, priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
+    """
+    把数值序列渲染为图表并作为图片消息发送
+    
+    Args:
+        series: 数据序列，每个元素包含y，可选x和name；点数过多时自动降采样
+        chart_type: 图表类型：line、bar或scatter
+        title: 图表标题
+        x_label: X轴标题
+        y_label: Y轴标题
+        width: 宽度（英寸）
+        height: 高度（英寸）
+        priority: 发送优先级：urgent、high、normal或low
+    
+    Returns:
+        Dict: 发送结果
+    """
+    image_data = render_chart_in_pool(
+        series=series, chart_type=chart_type, title=title,
+        x_label=x_label, y_label=y_label, width=width, height=height
+    )
+    return qyweixin_image_bytes(image_data, priority)
 
 
-def qyweixin_news(articles: List[Dict[str, str]]) -> Dict[str, Any]:
+def qyweixin_news(articles: List[Dict[str, str]], priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
     """
     发送图文消息
     
     Args:
         articles: 图文列表，每个元素包含title、url、description、picurl
+        priority: 发送优先级：urgent、high、normal或low
     
     Returns:
         Dict: 发送结果
@@ -155,8 +333,8 @@ def qyweixin_news(articles: List[Dict[str, str]]) -> Dict[str, Any]:
     if not articles:
         raise ValueError("图文列表不能为空")
     
-    if len(articles) > 8:
-        raise ValueError("图文消息最多支持8篇文章")
+    if len(articles) > MAX_NEWS_ARTICLES:
+        raise ValueError(f"图文消息最多支持{MAX_NEWS_ARTICLES}篇文章")
     
     for article in articles:
         if not article.get("title") or not article.get("url"):
@@ -169,16 +347,101 @@ def qyweixin_news(articles: List[Dict[str, str]]) -> Dict[str, Any]:
         }
     }
     
-    return _send_message(data)
+    return _send_message(data, priority=priority)
+
+
+def qyweixin_news_bulk(articles: List[Dict[str, str]], check_picurl: bool = False,
+                       priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
+    """
+    批量发送图文消息，超过8篇时自动按每页8篇分页并按顺序发送
+    
+    Args:
+        articles: 图文列表，每个元素包含title、url、description、picurl
+        check_picurl: 是否在发送前并发探测所有picurl是否可访问且是图片，有无效的picurl时不发送任何一页
+        priority: 发送优先级：urgent、high、normal或low
+    
+    Returns:
+        Dict: 汇总结果，包含每页的发送结果
+    """
+    if not articles:
+        raise ValueError("图文列表不能为空")
+    
+    invalid = [i + 1 for i, article in enumerate(articles)
+               if not article.get("title") or not article.get("url")]
+    if invalid:
+        raise ValueError(f"每篇图文消息必须包含title和url，不符合的文章序号: {invalid}")
+    
+    if check_picurl:
+        _probe_image_urls([a["picurl"] for a in articles if a.get("picurl")], "picurl")
+    
+    return _send_in_order([
+        {"msgtype": "news", "news": {"articles": page}}
+        for page in _paginate_articles(articles)
+    ], priority)
+
+
+def _send_in_order(messages: List[Dict[str, Any]], priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
+    """按顺序发送多条消息并汇总结果，某条失败后停止发送，避免后续消息乱序"""
+    results = []
+    # 同一组消息优先由同一个机器人发送
+    sticky_key = uuid.uuid4().hex
+    for data in messages:
+        result = _send_message(data, priority=priority, sticky_key=sticky_key)
+        results.append(result)
+        if result.get("errcode") != 0:
+            break
+    
+    failed = results[-1] if results and results[-1].get("errcode") != 0 else None
+    return {
+        "errcode": failed.get("errcode") if failed else 0,
+        "errmsg": failed.get("errmsg", "") if failed else "ok",
+        "total_pages": len(messages),
+        "sent_pages": len(results) - (1 if failed else 0),
+        "results": results
+    }
+
+
+def _paginate_articles(articles: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+    """按每页最多8篇切分图文列表，保持原有顺序"""
+    return [articles[i:i + MAX_NEWS_ARTICLES] for i in range(0, len(articles), MAX_NEWS_ARTICLES)]
 
 
-def qyweixin_file(file_path: Optional[str] = None, media_id: Optional[str] = None) -> Dict[str, Any]:
+def _probe_image_urls(urls: List[str], field: str) -> Dict[str, Dict[str, Any]]:
+    """并发探测图片尺寸（只下载文件头），有无法访问或不是图片的URL时报错"""
+    results = probe_images(urls)
+    broken = [f"{url}（{result['error']}）" for url, result in results.items() if "error" in result]
+    if broken:
+        raise ValueError(f"以下{field}无法访问或不是图片: {broken}")
+    return results
+
+
+def _check_card_images(template_card: Dict[str, Any]):
+    """
+    检查模板卡片的card_image：宽高比必须在1.3~2.25之间，探测图片是否可用，
+    未指定宽高比时按图片的实际宽高比填写（超出范围时取最近的边界）
+    """
+    card_image = template_card.get("card_image") or {}
+    low, high = CARD_IMAGE_ASPECT_RATIO_RANGE
+    aspect_ratio = card_image.get("aspect_ratio")
+    if aspect_ratio is not None and not low <= aspect_ratio <= high:
+        raise ValueError(f"card_image的宽高比必须在{low}~{high}之间: {aspect_ratio}")
+    
+    if not IMAGE_PROBE_ENABLED or not card_image.get("url"):
+        return
+    size = _probe_image_urls([card_image["url"]], "card_image")[card_image["url"]]
+    if aspect_ratio is None:
+        card_image["aspect_ratio"] = round(min(max(size["width"] / size["height"], low), high), 2)
+
+
+def qyweixin_file(file_path: Optional[str] = None, media_id: Optional[str] = None,
+                  priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
     """
     发送文件消息
     
     Args:
         file_path: 本地文件路径
         media_id: 已上传文件的media_id
+        priority: 发送优先级：urgent、high、normal或low
     
     Returns:
         Dict: 发送结果
@@ -196,16 +459,148 @@ def qyweixin_file(file_path: Optional[str] = None, media_id: Optional[str] = Non
         }
     }
     
-    return _send_message(data)
+    return _send_message(data, priority=priority)
+
+
+def qyweixin_large_file(file_path: str, compression: str = "gzip",
+                        priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
+    """
+    发送可能超过20MB的文件：超限时流式压缩并切分为多个分卷，并发上传后按顺序发送，
+    最后发送分卷清单
+    
+    Args:
+        file_path: 本地文件路径
+        compression: 压缩方式：gzip、zstd或none（只切分不压缩）
+        priority: 发送优先级：urgent、high、normal或low
+    
+    Returns:
+        Dict: 汇总结果，包含分卷信息
+    """
+    file_path = resolve_path(file_path)
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"文件不存在: {file_path}")
+    
+    if os.path.getsize(file_path) <= MAX_FILE_SIZE:
+        return qyweixin_file(file_path, priority=priority)
+    
+    temp_dir = tempfile.mkdtemp(prefix="qyweixin_volumes_")
+    try:
+        info = split_compressed_volumes(file_path, temp_dir, compression)
+        paths = [volume["path"] for volume in info["volumes"]]
+        with ThreadPoolExecutor(max_workers=min(UPLOAD_WORKERS, len(paths))) as executor:
+            media_ids = list(executor.map(bind_context(lambda path: qyweixin_upload_media(path, "file")), paths))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    messages = [{"msgtype": "file", "file": {"media_id": media_id}} for media_id in media_ids]
+    messages.append({"msgtype": "markdown", "markdown": {"content": build_volume_manifest(info)}})
+    result = _send_in_order(messages, priority)
+    result["volumes"] = [
+        {"name": os.path.basename(v["path"]), "size": v["size"], "sha256": v["sha256"]}
+        for v in info["volumes"]
+    ]
+    return result
 
 
-def qyweixin_voice(voice_path: Optional[str] = None, media_id: Optional[str] = None) -> Dict[str, Any]:
+def qyweixin_files(path: str, recursive: bool = False, bundle_small: bool = False,
+                   priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
+    """
+    发送目录或通配符匹配的所有文件：并发计算文件哈希，复用media_id缓存，
+    只并发上传未命中缓存的文件，再按文件名顺序发送
+    
+    Args:
+        path: 目录路径或通配符（如 /data/output/*.csv）
+        recursive: 是否包含子目录（通配符中可使用**）
+        bundle_small: 是否把不超过1MB的小文件打包为一个zip文件发送，节省发送配额
+        priority: 发送优先级：urgent、high、normal或low
+    
+    Returns:
+        Dict: 汇总结果，包含每个文件是否命中缓存
+    """
+    file_paths = _resolve_files(path, recursive)
+    if not file_paths:
+        raise ValueError(f"没有匹配的文件: {path}")
+    
+    too_large = [p for p in file_paths if os.path.getsize(p) > MAX_FILE_SIZE]
+    if too_large:
+        raise ValueError(f"以下文件超过{MAX_FILE_SIZE // (1024 * 1024)}MB，请使用qyweixin_large_file发送: {too_large}")
+    
+    temp_dir = None
+    try:
+        if bundle_small:
+            small = [p for p in file_paths if os.path.getsize(p) <= SMALL_FILE_SIZE]
+            if len(small) > 1:
+                temp_dir = tempfile.mkdtemp(prefix="qyweixin_bundle_")
+                label = os.path.basename(os.path.normpath(path)) if os.path.isdir(path) else "files"
+                archive = _bundle_files(small, os.path.join(temp_dir, f"{label}_bundle.zip"))
+                file_paths = [p for p in file_paths if p not in small] + [archive]
+        
+        if len(file_paths) > MAX_BATCH_FILES:
+            raise ValueError(f"一次最多发送{MAX_BATCH_FILES}个文件，实际为{len(file_paths)}个")
+        
+        with ThreadPoolExecutor(max_workers=min(HASH_WORKERS, len(file_paths))) as executor:
+            hashes = list(executor.map(bind_context(file_sha256), file_paths))
+        
+        media_ids = [get_cached_media_id(h, os.path.basename(p), "file") for p, h in zip(file_paths, hashes)]
+        misses = [i for i, media_id in enumerate(media_ids) if not media_id]
+        if misses:
+            with ThreadPoolExecutor(max_workers=min(UPLOAD_WORKERS, len(misses))) as executor:
+                uploaded = executor.map(
+                    bind_context(lambda i: qyweixin_upload_media_cached(file_paths[i], "file", hashes[i])[0]), misses)
+                for i, media_id in zip(misses, uploaded):
+                    media_ids[i] = media_id
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    current_span().set_attribute("media.cache_hits", len(file_paths) - len(misses))
+    result = _send_in_order([{"msgtype": "file", "file": {"media_id": media_id}} for media_id in media_ids],
+                            priority)
+    missed = set(misses)
+    result["files"] = [
+        {"name": os.path.basename(p), "cached": i not in missed}
+        for i, p in enumerate(file_paths)
+    ]
+    return result
+
+
+def _resolve_files(path: str, recursive: bool) -> List[str]:
+    """把目录或通配符解析为排序后的文件列表"""
+    if os.path.isdir(path):
+        if recursive:
+            paths = [os.path.join(root, name) for root, _, names in os.walk(path) for name in names]
+        else:
+            paths = [os.path.join(path, name) for name in os.listdir(path)]
+    else:
+        paths = glob.glob(path, recursive=recursive)
+    return sorted(p for p in paths if os.path.isfile(p))
+
+
+def _bundle_files(file_paths: List[str], archive_path: str) -> str:
+    """
+    把文件打包为zip，条目时间取自文件修改时间，文件不变时压缩包内容不变，可以命中media_id缓存
+    """
+    base = os.path.commonpath(file_paths) if len(file_paths) > 1 else os.path.dirname(file_paths[0])
+    if os.path.isfile(base):
+        base = os.path.dirname(base)
+    with zipfile.ZipFile(archive_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for file_path in file_paths:
+            info = zipfile.ZipInfo.from_file(file_path, os.path.relpath(file_path, base))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with open(file_path, 'rb') as src, archive.open(info, 'w') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+    return archive_path
+
+
+def qyweixin_voice(voice_path: Optional[str] = None, media_id: Optional[str] = None,
+                   priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
     """
     发送语音消息
     
     Args:
-        voice_path: 本地语音文件路径（AMR格式）
+        voice_path: 本地语音文件路径，AMR以外的格式（WAV、MP3等）先转码为AMR
         media_id: 已上传语音的media_id
+        priority: 发送优先级：urgent、high、normal或low
     
     Returns:
         Dict: 发送结果
@@ -214,7 +609,8 @@ def qyweixin_voice(voice_path: Optional[str] = None, media_id: Optional[str] = N
         raise ValueError("必须提供voice_path或media_id")
     
     if voice_path and not media_id:
-        media_id = qyweixin_upload_media(voice_path, "voice")
+        amr_path, _ = prepare_voice(resolve_path(voice_path))
+        media_id = qyweixin_upload_media(amr_path, "voice")
     
     data = {
         "msgtype": "voice",
@@ -223,15 +619,16 @@ def qyweixin_voice(voice_path: Optional[str] = None, media_id: Optional[str] = N
         }
     }
     
-    return _send_message(data)
+    return _send_message(data, priority=priority)
 
 
-def qyweixin_template_card(card_type: str, **kwargs) -> Dict[str, Any]:
+def qyweixin_template_card(card_type: str, priority: str = DEFAULT_PRIORITY, **kwargs) -> Dict[str, Any]:
     """
     发送模板卡片消息
     
     Args:
         card_type: 卡片类型，"text_notice"或"news_notice"
+        priority: 发送优先级：urgent、high、normal或low
         **kwargs: 其他卡片参数
     
     Returns:
@@ -244,57 +641,190 @@ def qyweixin_template_card(card_type: str, **kwargs) -> Dict[str, Any]:
         "card_type": card_type,
         **kwargs
     }
+    _check_card_images(template_card)
     
     data = {
         "msgtype": "template_card",
         "template_card": template_card
     }
     
-    return _send_message(data)
+    return _send_message(data, priority=priority)
 
 
-# 图片处理辅助函数
-def _get_image_base64_from_url(url: str) -> str:
-    """从URL获取图片base64编码"""
-    response = requests.get(url, timeout=REQUEST_TIMEOUT)
-    response.raise_for_status()
+def qyweixin_template_card_by_name(name: str, values: Dict[str, Any],
+                                   priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
+    """
+    使用已注册的模板卡片发送消息
     
-    if len(response.content) > MAX_IMAGE_SIZE:
-        raise ValueError(f"图片大小超出限制: {len(response.content)} > {MAX_IMAGE_SIZE}")
+    Args:
+        name: 模板名称
+        values: 模板变量
+        priority: 发送优先级：urgent、high、normal或low
     
-    return base64.b64encode(response.content).decode('utf-8')
+    Returns:
+        Dict: 发送结果
+    """
+    data = render_card_message(name, values)
+    _check_card_images(data["template_card"])
+    return _send_message(data, priority=priority)
 
 
-def _get_image_md5_from_url(url: str) -> str:
-    """从URL获取图片MD5值"""
-    response = requests.get(url, timeout=REQUEST_TIMEOUT)
-    response.raise_for_status()
-    return hashlib.md5(response.content).hexdigest()
+def qyweixin_schedule_message(content: str, msgtype: str = "text", send_at: Optional[str] = None,
+                              delay_seconds: Optional[float] = None, cron: Optional[str] = None,
+                              mentioned_list: Optional[List[str]] = None,
+                              mentioned_mobile_list: Optional[List[str]] = None,
+                              priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
+    """
+    定时发送文本或Markdown消息
+    
+    Args:
+        content: 消息内容
+        msgtype: 消息类型：text、markdown或markdown_v2
+        send_at: 发送时间，如 2026-01-01T09:00 或 09:00（服务器本地时间）
+        delay_seconds: 延迟发送的秒数
+        cron: 周期发送的cron表达式（分 时 日 月 星期），如 "0 9 * * 1-5"
+        mentioned_list: 用户ID列表，用于@指定用户（仅text）
+        mentioned_mobile_list: 手机号列表，用于@指定用户（仅text）
+        priority: 发送优先级：urgent、high、normal或low
+    
+    Returns:
+        Dict: 定时消息ID和计划发送时间
+    """
+    if sum(v is not None for v in (send_at, delay_seconds, cron)) != 1:
+        raise ValueError("send_at、delay_seconds和cron必须且只能指定一个")
+    if priority not in PRIORITY_LANES:
+        raise ValueError(f"优先级必须是{PRIORITY_LANES}之一")
+    
+    limits = {"text": MAX_TEXT_LENGTH, "markdown": MAX_MARKDOWN_LENGTH, "markdown_v2": MAX_MARKDOWN_LENGTH}
+    if msgtype not in limits:
+        raise ValueError("定时消息只支持text、markdown和markdown_v2")
+    if len(content.encode('utf-8')) > limits[msgtype]:
+        raise ValueError(f"消息内容过长，最大支持{limits[msgtype]}字节")
+    
+    data = {"msgtype": msgtype, msgtype: {"content": content}}
+    if msgtype == "text":
+        if mentioned_list:
+            data["text"]["mentioned_list"] = mentioned_list
+        if mentioned_mobile_list:
+            data["text"]["mentioned_mobile_list"] = mentioned_mobile_list
+    
+    due = None
+    if send_at is not None:
+        due = parse_send_at(send_at)
+    elif delay_seconds is not None:
+        if delay_seconds < 0:
+            raise ValueError("delay_seconds不能为负数")
+        due = time.time() + delay_seconds
+    
+    result = delivery_scheduler.schedule(data, due=due, cron=cron, priority=priority)
+    return {"errcode": 0, "errmsg": "ok", **result}
 
 
-def _get_image_base64_from_file(file_path: str) -> str:
-    """从本地文件获取图片base64编码"""
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"文件不存在: {file_path}")
+def qyweixin_list_schedules(limit: int = 100) -> List[Dict[str, Any]]:
+    """
+    按计划时间顺序列出待发送的定时消息
     
-    file_size = os.path.getsize(file_path)
-    if file_size > MAX_IMAGE_SIZE:
-        raise ValueError(f"图片大小超出限制: {file_size} > {MAX_IMAGE_SIZE}")
+    Args:
+        limit: 最多返回的数量
+    
+    Returns:
+        List: 定时消息列表
+    """
+    return delivery_scheduler.list(limit)
+
+
+def qyweixin_cancel_schedule(schedule_id: str) -> Dict[str, Any]:
+    """
+    取消定时消息
+    
+    Args:
+        schedule_id: 定时消息ID
+    
+    Returns:
+        Dict: 取消结果
+    """
+    if not delivery_scheduler.cancel(schedule_id):
+        raise ValueError(f"定时消息不存在或已发送: {schedule_id}")
+    return {"errcode": 0, "errmsg": "ok", "schedule_id": schedule_id}
+
+
+def qyweixin_stage_blob(data_base64: str, name: Optional[str] = None, blob_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    暂存文件数据，之后以blob:<id>引用传给图片、文件、语音和上传工具
+
+    大文件可分块多次调用：第一次不传blob_id，之后传入返回的blob_id追加数据。
+    
+    Args:
+        data_base64: 本次写入数据的base64编码
+        name: 文件名，新建blob时必须提供，文件消息中显示该名称
+        blob_id: 追加数据的blob，不传时新建
+    
+    Returns:
+        Dict: blob引用、资源URI、大小和过期时间
+    """
+    try:
+        data = base64.b64decode(data_base64, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("data_base64不是有效的base64编码")
+    if blob_id is None:
+        blob_id = blob_store.create(name)
+    blob_store.append(blob_id, data)
+    return blob_store.info(blob_id)
+
+
+def qyweixin_delete_blob(blob_id: str) -> Dict[str, Any]:
+    """
+    删除暂存的blob，未删除的blob在最后一次写入后按有效期自动清理
+    
+    Args:
+        blob_id: blob引用
+    
+    Returns:
+        Dict: 删除结果
+    """
+    if not blob_store.delete(blob_id):
+        raise ValueError(f"暂存blob不存在或已过期: {blob_id}")
+    return {"errcode": 0, "errmsg": "ok", "blob_id": blob_id}
+
+
+# 图片处理辅助函数
+def _download_image(url: str) -> bytes:
+    """下载图片"""
+    with span("image.download", **{"url.full": url}) as download_span:
+        response = current_client().session.get(url, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        download_span.set_attribute("image.size", len(response.content))
+        return response.content
+
+
+def _image_message_from_url(url: str) -> EncodedMessage:
+    """下载图片并编码为图片消息"""
+    content = _download_image(url)
     
-    with open(file_path, 'rb') as f:
-        return base64.b64encode(f.read()).decode('utf-8')
+    if len(content) > MAX_IMAGE_SIZE:
+        raise ValueError(f"图片大小超出限制: {len(content)} > {MAX_IMAGE_SIZE}")
+    
+    with span("image.encode", **{"image.size": len(content)}):
+        return encode_image_message(iter_buffer(content), len(content))
 
 
-def _get_image_md5_from_file(file_path: str) -> str:
-    """从本地文件获取图片MD5值"""
+def _image_message_from_file(file_path: str) -> EncodedMessage:
+    """从本地文件分块读取图片并编码为图片消息，不把整个文件读入内存"""
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"文件不存在: {file_path}")
     
-    with open(file_path, 'rb') as f:
-        return hashlib.md5(f.read()).hexdigest()
+    file_size = os.path.getsize(file_path)
+    if file_size > MAX_IMAGE_SIZE:
+        raise ValueError(f"图片大小超出限制: {file_size} > {MAX_IMAGE_SIZE}")
+    
+    with span("image.encode", **{"file.path": file_path, "image.size": file_size}):
+        with open(file_path, 'rb') as f:
+            return encode_image_message(iter_file(f), file_size)
 
 
-def _get_md5_from_base64(base64_str: str) -> str:
-    """从base64字符串获取MD5值"""
-    image_data = base64.b64decode(base64_str)
-    return hashlib.md5(image_data).hexdigest() 
\ No newline at end of file
+def _image_message_from_base64(image_base64: str, image_md5: Optional[str] = None) -> EncodedMessage:
+    """校验调用方传入的base64图片并编码为图片消息，超限或损坏的图片在发送前被拒绝"""
+    with span("image.validate", **{"image.base64_size": len(image_base64)}) as validate_span:
+        message = encode_base64_image_message(image_base64, MAX_IMAGE_SIZE, image_md5)
+        validate_span.set_attribute("image.format", message["image"]["format"])
+        return message 
\ No newline at end of file
@@ -0,0 +1,99 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+from config import PAYLOAD_BUDGET_BYTES, PAYLOAD_BUDGET_WAIT
+from tracing import span
+
+
+def image_payload_bytes(image_size: int) -> int:
+    """图片消息在发送期间占用的内存估算：原始数据和直接写入base64的请求体各一份"""
+    return image_size + (image_size + 2) // 3 * 4
+
+
+def upload_payload_bytes(file_size: int) -> int:
+    """上传媒体文件时占用的内存估算：requests构造multipart请求体时读入文件并拼接一份"""
+    return file_size * 2
+
+
+class ByteBudget:
+    """
+    进程内在途载荷的内存预算
+
+    图片编码、文件上传等工作开始前按估算的峰值内存预留额度，额度不足时按先来后到排队等待，
+    超过等待时间则报错，避免大量并发的大载荷同时驻留内存。单个超过总额度的请求在没有其他
+    请求占用时独占全部额度运行。多进程模式下每个工作进程有独立的预算。
+    """
+
+    def __init__(self, capacity: int = PAYLOAD_BUDGET_BYTES, max_wait: float = PAYLOAD_BUDGET_WAIT):
+        if capacity <= 0:
+            raise ValueError("内存预算必须大于0")
+        self.capacity = capacity
+        self.max_wait = max_wait
+        self.in_use = 0
+        self.peak = 0
+        self.rejected = 0
+        self._waiters = deque()
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def reserve(self, nbytes: int, timeout: Optional[float] = None):
+        """
+        预留内存额度，退出时归还
+
+        Args:
+            nbytes: 预计占用的字节数
+            timeout: 最长等待秒数，默认使用max_wait，0表示额度不足时立即报错
+        """
+        nbytes = min(max(0, nbytes), self.capacity)
+        timeout = self.max_wait if timeout is None else timeout
+        self._acquire(nbytes, timeout)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_use -= nbytes
+                self._cond.notify_all()
+
+    def _acquire(self, nbytes: int, timeout: float):
+        with self._cond:
+            if not self._waiters and self.in_use + nbytes <= self.capacity:
+                self._take(nbytes)
+                return
+
+        with span("payload.budget_wait", **{"budget.bytes": nbytes}):
+            deadline = time.monotonic() + timeout
+            ticket = object()
+            with self._cond:
+                self._waiters.append(ticket)
+                try:
+                    while self._waiters[0] is not ticket or self.in_use + nbytes > self.capacity:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.rejected += 1
+                            raise TimeoutError(
+                                f"载荷内存预算不足：需要{nbytes}字节，已占用{self.in_use}/{self.capacity}字节，"
+                                f"等待超过{timeout}秒，请稍后重试"
+                            )
+                        self._cond.wait(remaining)
+                    self._take(nbytes)
+                finally:
+                    self._waiters.remove(ticket)
+                    self._cond.notify_all()
+
+    def _take(self, nbytes: int):
+        self.in_use += nbytes
+        self.peak = max(self.peak, self.in_use)
+
+    def stats(self) -> Dict[str, Any]:
+        """预算使用情况"""
+        with self._cond:
+            return {
+                "capacity_bytes": self.capacity,
+                "in_use_bytes": self.in_use,
+                "peak_bytes": self.peak,
+                "waiting": len(self._waiters),
+                "rejected": self.rejected,
+            }
+
@@ -0,0 +1,196 @@
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Dict, Any, List, Optional
+from config import PROFILE_SAMPLE_INTERVAL
+
+PROFILE_MODES = ["sampling", "cprofile"]
+
+# tracemalloc记录的调用栈深度
+_TRACEMALLOC_FRAMES = 10
+
+
+def _frame_label(frame) -> str:
+    """栈帧的函数标签：函数名 (文件名:行号)"""
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _Sampler:
+    """
+    采样分析器：后台线程按固定间隔读取所有线程的调用栈并计数
+
+    只在采样时读取栈帧，不挂钩函数调用，适合在有真实负载的服务上运行。
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="qyweixin-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stopped.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def result(self, top: int) -> Dict[str, Any]:
+        self_counts = Counter()
+        total_counts = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if frames:
+                self_counts[frames[-1]] += count
+            for label in set(frames):
+                total_counts[label] += count
+        return {
+            "samples": self.samples,
+            "interval_ms": self.interval * 1000,
+            "top_self": [{"function": f, "samples": n} for f, n in self_counts.most_common(top)],
+            "top_total": [{"function": f, "samples": n} for f, n in total_counts.most_common(top)],
+            "collapsed": [f"{stack} {count}" for stack, count in self.stacks.most_common(top)],
+        }
+
+    def write_collapsed(self, path: str):
+        """以flamegraph.pl/speedscope可读的折叠栈格式写入全部采样"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _cprofile_result(profiler: cProfile.Profile, top: int) -> Dict[str, Any]:
+    """汇总cProfile结果：按累计耗时排序的函数列表和pstats文本"""
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats("cumulative").print_stats(top)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+    return {
+        "total_calls": stats.total_calls,
+        "top": [{
+            "function": f"{name} ({os.path.basename(filename)}:{line})",
+            "calls": calls,
+            "self_ms": round(self_time * 1000, 3),
+            "cumulative_ms": round(cumulative * 1000, 3),
+        } for (filename, line, name), (_, calls, self_time, cumulative, _) in rows],
+        "pstats": stream.getvalue(),
+    }
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    """内存快照，排除tracemalloc和分析器自身的分配"""
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+
+
+class ProfileSession:
+    """
+    一次性能分析：sampling模式采样所有线程，cprofile模式对调用start的线程做确定性分析
+
+    同时可以开启tracemalloc，结束时返回分析期间新增内存最多的代码位置。
+    同一进程同时只能有一个分析在运行。
+    """
+
+    _active_lock = threading.Lock()
+
+    def __init__(self, mode: str = "sampling", trace_memory: bool = True,
+                 interval: float = PROFILE_SAMPLE_INTERVAL):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"不支持的分析模式: {mode}")
+        self.mode = mode
+        self.trace_memory = trace_memory
+        self.interval = interval
+        self._sampler = None
+        self._profiler = None
+        self._snapshot = None
+        self._started_tracemalloc = False
+        self._start = None
+
+    def start(self):
+        if not ProfileSession._active_lock.acquire(blocking=False):
+            raise RuntimeError("已有性能分析正在运行")
+        try:
+            if self.trace_memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(_TRACEMALLOC_FRAMES)
+                    self._started_tracemalloc = True
+                self._snapshot = _take_snapshot()
+            if self.mode == "sampling":
+                self._sampler = _Sampler(self.interval)
+                self._sampler.start()
+            else:
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+        except BaseException:
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            ProfileSession._active_lock.release()
+            raise
+        self._start = time.monotonic()
+
+    def stop(self, top: int = 20, collapsed_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        结束分析并汇总结果
+
+        Args:
+            top: 返回的条目数
+            collapsed_path: sampling模式下写入完整折叠栈的文件路径
+
+        Returns:
+            Dict: 分析结果
+        """
+        try:
+            result = {"mode": self.mode, "duration_s": round(time.monotonic() - self._start, 3)}
+            if self._sampler is not None:
+                self._sampler.stop()
+                result.update(self._sampler.result(top))
+                if collapsed_path:
+                    self._sampler.write_collapsed(collapsed_path)
+                    result["collapsed_path"] = collapsed_path
+            else:
+                self._profiler.disable()
+                result.update(_cprofile_result(self._profiler, top))
+            if self._snapshot is not None:
+                result["memory"] = self._memory_diff(top)
+            return result
+        finally:
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            ProfileSession._active_lock.release()
+
+    def _memory_diff(self, top: int) -> List[Dict[str, Any]]:
+        """分析期间新增内存最多的代码位置"""
+        diff = _take_snapshot().compare_to(self._snapshot, "lineno")
+        return [{
+            "location": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+            "size_diff_kb": round(stat.size_diff / 1024, 1),
+            "size_kb": round(stat.size / 1024, 1),
+            "count_diff": stat.count_diff,
+        } for stat in diff[:top]]
@@ -0,0 +1,131 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable
+from config import ROBOT_KEYS
+from webhook_client import WebhookClient
+from message_tools import (
+    qyweixin_text, qyweixin_markdown, qyweixin_markdown_v2, qyweixin_markdown_report, qyweixin_markdown_table,
+    qyweixin_image, qyweixin_image_bytes, qyweixin_chart, qyweixin_news, qyweixin_news_bulk,
+    qyweixin_file, qyweixin_large_file, qyweixin_files, qyweixin_voice,
+    qyweixin_template_card, qyweixin_template_card_by_name
+)
+from utils import qyweixin_upload_media_cached
+from tracing import bind_context
+
+# 异步客户端执行发送的线程数，超出的调用排队等待
+ASYNC_MAX_CONCURRENCY = 16
+
+
+def _message_method(func: Callable) -> Callable:
+    """把发送函数包装为客户端方法，调用期间激活该客户端"""
+    @functools.wraps(func)
+    def method(self, *args, **kwargs):
+        with self.activate():
+            return func(*args, **kwargs)
+    return method
+
+
+class QyWeixinBot(WebhookClient):
+    """
+    企业微信群机器人客户端
+
+    提供与MCP工具相同的发送能力，可直接在其他服务中使用：每个实例拥有自己的机器人池、
+    发送频率限制、连接池、内存预算和重试策略，可以按key创建多个实例。
+
+        with QyWeixinBot("your-key") as bot:
+            bot.text("部署完成", mentioned_list=["@all"])
+            bot.image(image_path="/tmp/chart.png", priority="high")
+    """
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "QyWeixinBot":
+        """按环境变量key和QYWEIXIN_KEYS创建客户端"""
+        return cls(keys=ROBOT_KEYS, **kwargs)
+
+    text = _message_method(qyweixin_text)
+    markdown = _message_method(qyweixin_markdown)
+    markdown_v2 = _message_method(qyweixin_markdown_v2)
+    markdown_report = _message_method(qyweixin_markdown_report)
+    markdown_table = _message_method(qyweixin_markdown_table)
+    image = _message_method(qyweixin_image)
+    image_bytes = _message_method(qyweixin_image_bytes)
+    chart = _message_method(qyweixin_chart)
+    news = _message_method(qyweixin_news)
+    news_bulk = _message_method(qyweixin_news_bulk)
+    file = _message_method(qyweixin_file)
+    large_file = _message_method(qyweixin_large_file)
+    files = _message_method(qyweixin_files)
+    voice = _message_method(qyweixin_voice)
+    template_card = _message_method(qyweixin_template_card)
+    template_card_by_name = _message_method(qyweixin_template_card_by_name)
+    upload_media_cached = _message_method(qyweixin_upload_media_cached)
+
+
+def _async_method(name: str) -> Callable:
+    """把QyWeixinBot的方法包装为在线程池中执行的协程方法"""
+    @functools.wraps(getattr(QyWeixinBot, name))
+    async def method(self, *args, **kwargs):
+        return await self.run(getattr(self.bot, name), *args, **kwargs)
+    return method
+
+
+class AsyncQyWeixinBot:
+    """
+    企业微信群机器人的异步客户端
+
+    发送过程中的排队、限流等待和网络请求都在客户端自己的线程池中执行，不阻塞事件循环，
+    也不占用事件循环的默认线程池。参数与QyWeixinBot相同。
+
+        async with AsyncQyWeixinBot("your-key") as bot:
+            await asyncio.gather(bot.text("第一条"), bot.markdown("**第二条**"))
+    """
+
+    def __init__(self, *args, max_concurrency: int = ASYNC_MAX_CONCURRENCY, **kwargs):
+        self.bot = QyWeixinBot(*args, **kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="qyweixin-async")
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "AsyncQyWeixinBot":
+        """按环境变量key和QYWEIXIN_KEYS创建客户端"""
+        return cls(keys=ROBOT_KEYS, **kwargs)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """在客户端的线程池中执行func，用于把幂等包装等同步逻辑和发送一起移出事件循环"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, bind_context(functools.partial(func, *args, **kwargs)))
+
+    async def close(self):
+        """等待进行中的发送完成后关闭"""
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        self.bot.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """机器人池的队列和发送统计，以及载荷内存预算"""
+        return self.bot.stats()
+
+    send = _async_method("send")
+    upload_media = _async_method("upload_media")
+    text = _async_method("text")
+    markdown = _async_method("markdown")
+    markdown_v2 = _async_method("markdown_v2")
+    markdown_report = _async_method("markdown_report")
+    markdown_table = _async_method("markdown_table")
+    image = _async_method("image")
+    image_bytes = _async_method("image_bytes")
+    chart = _async_method("chart")
+    news = _async_method("news")
+    news_bulk = _async_method("news_bulk")
+    file = _async_method("file")
+    large_file = _async_method("large_file")
+    files = _async_method("files")
+    voice = _async_method("voice")
+    template_card = _async_method("template_card")
+    template_card_by_name = _async_method("template_card_by_name")
+    upload_media_cached = _async_method("upload_media_cached")
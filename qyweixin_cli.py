@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+企业微信群机器人命令行发送工具
+
+从文件或标准输入逐行读取JSONL消息，通过与MCP服务相同的客户端（机器人池、频率限制、重试）发送，
+每行的结果以JSONL写入标准输出或--results文件，进度输出到标准错误。输入按行流式读取，
+同时处理的行数有上限，百万行的输入也不会整体读入内存。
+
+每行是一个JSON对象，两种形式：
+    {"type": "text", "content": "部署完成", "mentioned_list": ["@all"]}
+    {"msgtype": "markdown", "markdown": {"content": "**告警**"}}
+
+第一种的type是QyWeixinBot的方法名（text、markdown、image、news、file、voice、template_card等），
+其余字段是方法参数；第二种是原样发送的webhook消息。两种形式都可以带priority和idempotency_key：
+设置了QYWEIXIN_STATE_URL的持久化状态存储时，重新运行中途失败的批次，已发送的行不会重复发送。
+
+    python qyweixin_cli.py messages.jsonl --results results.jsonl
+    generate_alerts | python qyweixin_cli.py - --concurrency 1
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List, Optional, TextIO, Tuple
+from config import ROBOT_KEYS, ROBOT_POOL_STRATEGY, DEFAULT_PRIORITY, PRIORITY_LANES
+from qyweixin_bot import QyWeixinBot
+from robot_pool import POOL_STRATEGIES
+from idempotency import run_idempotent
+from tracing import span
+
+# 可以通过type调用的客户端方法
+MESSAGE_TYPES = [
+    "text", "markdown", "markdown_v2", "markdown_report", "markdown_table", "image", "chart",
+    "news", "news_bulk", "file", "large_file", "files", "voice", "template_card", "template_card_by_name",
+]
+
+# 进度输出间隔（秒）
+PROGRESS_INTERVAL = 5.0
+
+
+def iter_lines(stream: TextIO) -> Iterator[Tuple[int, str]]:
+    """逐行读取输入，跳过空行，返回 (行号, 内容)"""
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if line:
+            yield line_no, line
+
+
+def send_line(bot: QyWeixinBot, line: str, default_priority: str = DEFAULT_PRIORITY) -> Dict[str, Any]:
+    """
+    发送一行JSONL消息
+
+    Args:
+        bot: 客户端
+        line: 一行JSON
+        default_priority: 行内没有priority时使用的优先级
+
+    Returns:
+        Dict: 发送结果
+    """
+    try:
+        message = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"不是有效的JSON: {e.msg}")
+    if not isinstance(message, dict):
+        raise ValueError("每行必须是JSON对象")
+
+    idempotency_key = message.pop("idempotency_key", None)
+    priority = message.pop("priority", default_priority)
+    if "type" in message:
+        message_type = message.pop("type")
+        if message_type not in MESSAGE_TYPES:
+            raise ValueError(f"不支持的type: {message_type}，可选值: {', '.join(MESSAGE_TYPES)}")
+        params = {**message, "priority": priority}
+        fn = lambda: getattr(bot, message_type)(**params)
+    elif "msgtype" in message:
+        message_type, params = "raw", {"message": message, "priority": priority}
+        fn = lambda: bot.send(message, priority=priority)
+    else:
+        raise ValueError("每行必须包含type或msgtype")
+
+    with span(f"cli {message_type}", **{"idempotency.key_present": bool(idempotency_key)}):
+        return run_idempotent(idempotency_key, f"cli_{message_type}", params, fn)
+
+
+class _Progress:
+    """统计处理进度，按间隔输出到标准错误"""
+
+    def __init__(self, stream: TextIO, interval: float = PROGRESS_INTERVAL):
+        self.stream = stream
+        self.interval = interval
+        self.sent = 0
+        self.failed = 0
+        self.start = time.monotonic()
+        self._last_report = self.start
+        self._lock = threading.Lock()
+
+    def record(self, ok: bool):
+        with self._lock:
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+            now = time.monotonic()
+            if now - self._last_report >= self.interval:
+                self._last_report = now
+                self._report(now)
+
+    def _report(self, now: float, final: bool = False):
+        done = self.sent + self.failed
+        elapsed = max(now - self.start, 1e-9)
+        label = "完成" if final else "进度"
+        print(f"{label}: 已处理{done}行，成功{self.sent}，失败{self.failed}，"
+              f"用时{elapsed:.1f}秒，{done / elapsed:.1f}条/秒", file=self.stream, flush=True)
+
+    def finish(self):
+        with self._lock:
+            self._report(time.monotonic(), final=True)
+
+
+def send_stream(bot: QyWeixinBot, lines: Iterator[Tuple[int, str]], results: TextIO,
+                concurrency: int = 4, default_priority: str = DEFAULT_PRIORITY,
+                progress: Optional[_Progress] = None) -> Tuple[int, int]:
+    """
+    并发发送输入的每一行，每行完成后把结果写入results
+
+    同时在处理中的行数不超过concurrency，读取输入的速度跟随发送速度，内存占用与输入行数无关。
+    concurrency大于1时结果按完成顺序写出，每条结果带行号；需要严格按输入顺序发送时使用1。
+
+    Returns:
+        Tuple[int, int]: (成功行数, 失败行数)
+    """
+    progress = progress or _Progress(sys.stderr)
+    slots = threading.BoundedSemaphore(concurrency)
+    write_lock = threading.Lock()
+
+    def _process(line_no: int, line: str):
+        start = time.monotonic()
+        try:
+            try:
+                result = send_line(bot, line, default_priority)
+                ok = not isinstance(result, dict) or result.get("errcode", 0) == 0
+                record = {"line": line_no, "ok": ok, "result": result}
+            except Exception as e:
+                ok = False
+                record = {"line": line_no, "ok": False, "error": str(e)}
+            record["elapsed_ms"] = round((time.monotonic() - start) * 1000, 1)
+            with write_lock:
+                results.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                results.flush()
+            progress.record(ok)
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="qyweixin-cli") as executor:
+        for line_no, line in lines:
+            slots.acquire()
+            executor.submit(_process, line_no, line)
+    progress.finish()
+    return progress.sent, progress.failed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口，全部成功时返回0，有失败的行时返回1，参数错误时返回2"""
+    parser = argparse.ArgumentParser(description="从JSONL批量发送企业微信群机器人消息")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL文件路径，- 或省略时读取标准输入")
+    parser.add_argument("--results", help="逐行结果的输出文件，默认标准输出")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时处理的行数，1表示按输入顺序逐条发送")
+    parser.add_argument("--priority", default=DEFAULT_PRIORITY, choices=PRIORITY_LANES, help="行内未指定时使用的优先级")
+    parser.add_argument("--key", action="append", help="机器人key，可重复指定组成机器人池；默认使用环境变量key和QYWEIXIN_KEYS")
+    parser.add_argument("--strategy", default=ROBOT_POOL_STRATEGY, choices=POOL_STRATEGIES, help="机器人池选择策略")
+    parser.add_argument("--progress-interval", type=float, default=PROGRESS_INTERVAL, help="进度输出间隔（秒）")
+    args = parser.parse_args(argv)
+
+    if args.concurrency < 1:
+        parser.error("--concurrency必须大于0")
+    keys = args.key or ROBOT_KEYS
+    if not keys:
+        parser.error("未设置机器人key：请设置环境变量key或使用--key")
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    results = sys.stdout if not args.results else open(args.results, "a", encoding="utf-8")
+    try:
+        with QyWeixinBot(keys=keys, strategy=args.strategy) as bot:
+            _, failed = send_stream(bot, iter_lines(source), results, args.concurrency, args.priority,
+                                    _Progress(sys.stderr, args.progress_interval))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if results is not sys.stdout:
+            results.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
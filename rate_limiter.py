@@ -0,0 +1,115 @@
+import time
+import hashlib
+from config import (
+    RATE_LIMIT_PER_MINUTE, RATE_LIMIT_MAX_WAIT, RATE_LIMIT_MIN, RATE_LIMIT_MAX,
+    RATE_DECREASE_FACTOR, RATE_INCREASE_STEP, RATE_DECREASE_INTERVAL
+)
+from state_store import get_state_store
+
+# 从状态存储同步其他进程学习到的发送频率的间隔（秒）
+_RATE_SYNC_INTERVAL = 1.0
+
+
+class RateLimiter:
+    """
+    令牌桶限流器，企业微信群机器人默认每分钟最多发送20条消息
+
+    令牌桶状态保存在状态存储中，多个进程使用同一个存储时共享配额。
+    """
+
+    def __init__(self, rate_per_minute: float = RATE_LIMIT_PER_MINUTE, capacity: float = None,
+                 name: str = "default"):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.name = name
+
+    @property
+    def rate_per_minute(self) -> float:
+        return self.rate * 60
+
+    def try_acquire(self) -> float:
+        """尝试获取一个令牌，成功返回0，否则返回需要等待的秒数"""
+        return get_state_store().take_token(self.name, self.rate, self.capacity)
+
+    def acquire(self, timeout: float = RATE_LIMIT_MAX_WAIT):
+        """阻塞直到获取令牌，超过timeout秒仍未获取则抛出异常"""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait_time = self.try_acquire()
+            if wait_time == 0:
+                return
+            if time.monotonic() + wait_time > deadline:
+                raise TimeoutError(f"发送频率超出限制，等待超过{timeout}秒")
+            time.sleep(wait_time)
+
+    def record_success(self):
+        """发送成功后调用，固定频率的限流器不做处理"""
+
+    def record_throttled(self):
+        """被企业微信限流（45009）后调用，固定频率的限流器不做处理"""
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """
+    自适应令牌桶限流器：按AIMD调整发送频率，收敛到机器人实际可用的配额
+
+    同一个key可能被其他系统共用，实际可用的配额并不固定。收到45009时频率乘以
+    RATE_DECREASE_FACTOR并清空令牌桶；发送受限流器限制且持续成功时，每分钟增加
+    RATE_INCREASE_STEP条，逐步探测更高的频率。学习到的频率保存在状态存储中，多个进程共享。
+    """
+
+    def __init__(self, rate_per_minute: float = RATE_LIMIT_PER_MINUTE, name: str = "default",
+                 min_rate: float = RATE_LIMIT_MIN, max_rate: float = RATE_LIMIT_MAX):
+        super().__init__(rate_per_minute, name=name)
+        self.initial_rate = rate_per_minute
+        self.min_rate = min(min_rate, rate_per_minute)
+        self.max_rate = max(max_rate, rate_per_minute)
+        self._rate_per_minute = rate_per_minute
+        self._synced_at = float("-inf")
+        self._saturated_at = float("-inf")
+
+    @property
+    def rate_per_minute(self) -> float:
+        """当前的每分钟发送频率"""
+        now = time.monotonic()
+        if now - self._synced_at >= _RATE_SYNC_INTERVAL:
+            stored = get_state_store().get("rate", self.name)
+            self._rate_per_minute = stored if stored is not None else self.initial_rate
+            self._synced_at = now
+        return self._rate_per_minute
+
+    def _set_rate(self, rate_per_minute: float):
+        self._rate_per_minute = min(self.max_rate, max(self.min_rate, rate_per_minute))
+        self._synced_at = time.monotonic()
+        get_state_store().set("rate", self.name, self._rate_per_minute)
+
+    def try_acquire(self) -> float:
+        rate = self.rate_per_minute
+        # 桶容量跟随频率变化，降低频率后不会再按原来的突发量发送
+        wait_time = get_state_store().take_token(self.name, rate / 60.0, rate)
+        if wait_time > 0:
+            self._saturated_at = time.monotonic()
+        return wait_time
+
+    def record_success(self):
+        # 只在最近一分钟等待过令牌时向上探测，发送量低于配额时频率不会无限增长
+        if time.monotonic() - self._saturated_at > 60:
+            return
+        rate = self.rate_per_minute
+        if rate < self.max_rate:
+            self._set_rate(rate + RATE_INCREASE_STEP / rate)
+
+    def record_throttled(self):
+        # 同一批被限流的请求（可能来自多个进程）只降低一次
+        if not get_state_store().add("rate_decrease", self.name, True, ttl=RATE_DECREASE_INTERVAL):
+            return
+        self._set_rate(self.rate_per_minute * RATE_DECREASE_FACTOR)
+        # 企业微信一侧的配额已用完，清空令牌桶，之后按新频率重新积累
+        for _ in range(int(self._rate_per_minute) + 1):
+            if self.try_acquire() > 0:
+                break
+
+
+def key_id(key: str) -> str:
+    """webhook key的摘要，用作状态存储中的名称，避免明文保存key"""
+    return hashlib.sha256((key or "").encode('utf-8')).hexdigest()[:16]
@@ -0,0 +1,295 @@
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, Any, List, Iterator, Tuple
+from config import MAX_MARKDOWN_LENGTH
+
+# 模板语法（Jinja子集）：
+#   {{ name }} / {{ item.field }}                 变量
+#   {% for item in items %}...{% endfor %}        循环，每次迭代是一个可截断单元
+#   {% if name %}...{% endif %}                   条件
+#   {% section name priority=N %}...{% endsection %}
+#                                                 顶层分节，超出预算时优先保留priority小的分节
+_TOKEN = re.compile(r"(\{\{.*?\}\}|\{%.*?%\})", re.S)
+_FOR = re.compile(r"for\s+(\w+)\s+in\s+([\w.]+)$")
+_IF = re.compile(r"if\s+([\w.]+)$")
+_SECTION = re.compile(r"section\s+(\w+)(?:\s+priority\s*=\s*(-?\d+))?$")
+
+OVERFLOW_MODES = ["truncate", "paginate", "error"]
+OMITTED_MARKER = "\n> 已省略 {count} 项\n"
+
+
+class _Var:
+    def __init__(self, path: str):
+        self.path = path.split(".")
+
+
+class _For:
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path.split(".")
+        self.body = []
+
+
+class _If:
+    def __init__(self, path: str):
+        self.path = path.split(".")
+        self.body = []
+
+
+class _Section:
+    def __init__(self, name: str, priority: int, index: int):
+        self.name = name
+        self.priority = priority
+        self.index = index
+        self.body = []
+
+
+class ReportTemplate:
+    """编译后的Markdown报告模板"""
+
+    def __init__(self, source: str):
+        self.nodes = _parse(source)
+        self.sections = [node for node in self.nodes if isinstance(node, _Section)]
+
+    def render(self, context: Dict[str, Any], budget: int = MAX_MARKDOWN_LENGTH,
+               overflow: str = "truncate") -> List[str]:
+        """
+        渲染模板，返回一条或多条不超过budget字节的Markdown内容
+
+        Args:
+            context: 模板变量
+            budget: 每条消息的UTF-8字节上限
+            overflow: 超出预算时的处理方式，truncate按优先级截断分节，paginate分页，error抛出异常
+
+        Returns:
+            List[str]: 渲染结果，truncate和error模式只有一条
+        """
+        if overflow not in OVERFLOW_MODES:
+            raise ValueError(f"overflow必须是{OVERFLOW_MODES}之一")
+        if overflow == "paginate":
+            return _paginate(self._units(context), budget)
+        return [self._render_truncated(context, budget, overflow == "error")]
+
+    def _units(self, context: Dict[str, Any]) -> Iterator[Tuple[str, int]]:
+        """按文档顺序生成 (文本, UTF-8字节数) 单元"""
+        for node in self.nodes:
+            if isinstance(node, _Section):
+                for text, _ in _section_units(node, context):
+                    yield text, len(text.encode('utf-8'))
+            else:
+                text = _render_nodes([node], [context])
+                yield text, len(text.encode('utf-8'))
+
+    def _render_truncated(self, context: Dict[str, Any], budget: int, strict: bool) -> str:
+        """一次线性渲染：先放固定内容，再按优先级依次填充分节，放不下的部分截断"""
+        fixed = {}
+        used = 0
+        for i, node in enumerate(self.nodes):
+            if not isinstance(node, _Section):
+                fixed[i] = _render_nodes([node], [context])
+                used += len(fixed[i].encode('utf-8'))
+        if used > budget:
+            raise ValueError(f"模板固定内容已超出{budget}字节")
+
+        rendered = {}
+        for section in sorted(self.sections, key=lambda s: (s.priority, s.index)):
+            # (文本, 字节数, 是否循环项)
+            parts = []
+            section_used = 0
+            for text, remaining in _section_units(section, context):
+                size = len(text.encode('utf-8'))
+                if used + section_used + size <= budget:
+                    parts.append((text, size, remaining > 0))
+                    section_used += size
+                    continue
+                if strict:
+                    raise ValueError(f"渲染结果超出{budget}字节")
+                # 第一个单元是分节标题，放不下则整节丢弃；放不下省略标记时继续去掉已放入的循环项，
+                # 仍放不下则整节丢弃。本节之后的分节仍按剩余预算尝试放入
+                if parts and remaining:
+                    omitted = remaining
+                    marker = OMITTED_MARKER.format(count=omitted)
+                    while used + section_used + len(marker.encode('utf-8')) > budget and len(parts) > 1 and parts[-1][2]:
+                        section_used -= parts.pop()[1]
+                        omitted += 1
+                        marker = OMITTED_MARKER.format(count=omitted)
+                    marker_size = len(marker.encode('utf-8'))
+                    if used + section_used + marker_size <= budget:
+                        parts.append((marker, marker_size, False))
+                        section_used += marker_size
+                    else:
+                        parts = []
+                break
+            if parts:
+                rendered[section.index] = "".join(text for text, _, _ in parts)
+                used += section_used
+
+        return "".join(
+            fixed.get(i) if i in fixed else rendered.get(node.index, "")
+            for i, node in enumerate(self.nodes)
+        )
+
+
+def _parse(source: str) -> List[Any]:
+    """把模板源码解析为节点树"""
+    root = []
+    stack = [(None, root)]
+    for token in _TOKEN.split(source):
+        if not token:
+            continue
+        body = stack[-1][1]
+        if token.startswith("{{"):
+            body.append(_Var(token[2:-2].strip()))
+        elif token.startswith("{%"):
+            tag = token[2:-2].strip()
+            if tag in ("endfor", "endif", "endsection"):
+                node = stack[-1][0]
+                expected = {"endfor": _For, "endif": _If, "endsection": _Section}[tag]
+                if not isinstance(node, expected):
+                    raise ValueError(f"模板标签不匹配: {{% {tag} %}}")
+                stack.pop()
+            elif _FOR.match(tag):
+                name, path = _FOR.match(tag).groups()
+                node = _For(name, path)
+                body.append(node)
+                stack.append((node, node.body))
+            elif _IF.match(tag):
+                node = _If(_IF.match(tag).group(1))
+                body.append(node)
+                stack.append((node, node.body))
+            elif _SECTION.match(tag):
+                if len(stack) != 1:
+                    raise ValueError("section只能出现在模板顶层")
+                name, priority = _SECTION.match(tag).groups()
+                node = _Section(name, int(priority or 0), len(root))
+                body.append(node)
+                stack.append((node, node.body))
+            else:
+                raise ValueError(f"不支持的模板标签: {{% {tag} %}}")
+        else:
+            body.append(token)
+    if len(stack) != 1:
+        raise ValueError("模板存在未闭合的标签")
+    return root
+
+
+def _lookup(path: List[str], scopes: List[Dict[str, Any]]) -> Any:
+    """按作用域由内到外查找变量，未定义时返回None"""
+    for scope in reversed(scopes):
+        if path[0] in scope:
+            value = scope[path[0]]
+            break
+    else:
+        return None
+    for key in path[1:]:
+        if isinstance(value, dict):
+            value = value.get(key)
+        else:
+            value = getattr(value, key, None)
+        if value is None:
+            return None
+    return value
+
+
+def _render_nodes(nodes: List[Any], scopes: List[Dict[str, Any]]) -> str:
+    """渲染节点列表为字符串"""
+    out = []
+    for node in nodes:
+        if isinstance(node, str):
+            out.append(node)
+        elif isinstance(node, _Var):
+            value = _lookup(node.path, scopes)
+            out.append("" if value is None else str(value))
+        elif isinstance(node, _If):
+            if _lookup(node.path, scopes):
+                out.append(_render_nodes(node.body, scopes))
+        elif isinstance(node, _For):
+            for item in _lookup(node.path, scopes) or []:
+                out.append(_render_nodes(node.body, scopes + [{node.name: item}]))
+        else:
+            out.append(_render_nodes(node.body, scopes))
+    return "".join(out)
+
+
+def _section_units(section: _Section, context: Dict[str, Any]) -> Iterator[Tuple[str, int]]:
+    """
+    惰性生成分节的渲染单元 (文本, 本单元起未渲染的循环项数)
+
+    分节顶层的循环每次迭代是一个单元，相邻的其他内容合并为一个单元；
+    预算用尽时调用方停止迭代，剩余循环项不会被渲染。
+    """
+    scopes = [context]
+    pending = []
+    for node in section.body:
+        if not isinstance(node, _For):
+            pending.append(_render_nodes([node], scopes))
+            continue
+        if pending:
+            yield "".join(pending), 0
+            pending = []
+        items = list(_lookup(node.path, scopes) or [])
+        for i, item in enumerate(items):
+            yield _render_nodes(node.body, scopes + [{node.name: item}]), len(items) - i
+    if pending:
+        yield "".join(pending), 0
+
+
+def _paginate(units: Iterator[Tuple[str, int]], budget: int) -> List[str]:
+    """把渲染单元按顺序装入不超过budget字节的页面"""
+    pages = []
+    current = []
+    current_size = 0
+    for text, size in units:
+        pieces = [(text, size)] if size <= budget else _split_text(text, budget)
+        for piece, piece_size in pieces:
+            if current and current_size + piece_size > budget:
+                pages.append("".join(current))
+                current = []
+                current_size = 0
+            current.append(piece)
+            current_size += piece_size
+    if current:
+        pages.append("".join(current))
+    return [page for page in pages if page.strip()]
+
+
+def _split_text(text: str, budget: int) -> List[Tuple[str, int]]:
+    """把超出预算的单元按行切分，单行仍超出时按字节切分（不拆开UTF-8字符）"""
+    pieces = []
+    for line in text.splitlines(keepends=True):
+        data = line.encode('utf-8')
+        while len(data) > budget:
+            cut = budget
+            while cut > 0 and (data[cut] & 0xC0) == 0x80:
+                cut -= 1
+            pieces.append((data[:cut].decode('utf-8'), cut))
+            data = data[cut:]
+        pieces.append((data.decode('utf-8'), len(data)))
+    return pieces
+
+
+@lru_cache(maxsize=128)
+def compile_report_template(source: str) -> ReportTemplate:
+    """编译报告模板，相同源码只编译一次"""
+    return ReportTemplate(source)
+
+
+_templates: Dict[str, ReportTemplate] = {}
+_templates_lock = threading.Lock()
+
+
+def register_report_template(name: str, source: str) -> Dict[str, Any]:
+    """注册（或覆盖）命名报告模板"""
+    template = compile_report_template(source)
+    with _templates_lock:
+        _templates[name] = template
+    return {"name": name, "sections": [s.name for s in template.sections]}
+
+
+def get_report_template(name: str) -> ReportTemplate:
+    """获取已注册的报告模板"""
+    template = _templates.get(name)
+    if template is None:
+        raise ValueError(f"报告模板不存在: {name}")
+    return template
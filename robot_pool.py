@@ -0,0 +1,201 @@
+import time
+import hashlib
+import itertools
+import threading
+from collections import deque
+from typing import Dict, Any, Callable, Iterable, Optional
+from config import (
+    ROBOT_POOL_STRATEGY, ROBOT_THROTTLE_COOLDOWN, ROBOT_REVOKED_COOLDOWN,
+    API_BASE_URL, WEBHOOK_URL_TEMPLATE, UPLOAD_URL_TEMPLATE, MEDIA_CACHE_TTL, RATE_ADAPTIVE
+)
+from rate_limiter import RateLimiter, AdaptiveRateLimiter, key_id
+from scheduler import SendScheduler, Delivery
+from state_store import get_state_store
+from tracing import current_span
+
+POOL_STRATEGIES = ["least_loaded", "round_robin"]
+
+# 机器人被限流和key失效（被删除或重置）时的错误码
+ERRCODE_THROTTLED = 45009
+ERRCODE_REVOKED = 93000
+
+
+class Robot:
+    """池中的一个群机器人，拥有独立的令牌桶和优先级发送队列"""
+
+    def __init__(self, key: str, base_url: str = API_BASE_URL):
+        self.key = key
+        self.id = key_id(key)
+        self.base_url = base_url
+        self.webhook_url = WEBHOOK_URL_TEMPLATE.format(base_url=base_url, key=key)
+        self.limiter = (AdaptiveRateLimiter if RATE_ADAPTIVE else RateLimiter)(name=f"send:{self.id}")
+        self.scheduler = SendScheduler(self.limiter)
+        self._recent_sends = deque()
+        self._lock = threading.Lock()
+
+    def upload_url(self, media_type: str) -> str:
+        return UPLOAD_URL_TEMPLATE.format(base_url=self.base_url, key=self.key, media_type=media_type)
+
+    def record_send(self):
+        with self._lock:
+            self._recent_sends.append(time.monotonic())
+
+    def recent_sends(self) -> int:
+        """本进程最近一分钟经该机器人发送的消息数"""
+        cutoff = time.monotonic() - 60
+        with self._lock:
+            while self._recent_sends and self._recent_sends[0] < cutoff:
+                self._recent_sends.popleft()
+            return len(self._recent_sends)
+
+    def queue_depth(self) -> int:
+        return sum(lane["queue_depth"] for lane in self.scheduler.stats().values())
+
+    def disabled_reason(self) -> Optional[str]:
+        """暂停使用的原因，可用时返回None；状态保存在状态存储中，多个进程共享"""
+        return get_state_store().get("robot_disabled", self.id)
+
+    def disable(self, reason: str, seconds: float):
+        get_state_store().set("robot_disabled", self.id, reason, ttl=seconds)
+
+
+class RobotPool:
+    """
+    机器人池：同一个群中的多个机器人分担发送，总吞吐量随机器人数量增加
+
+    每条消息选择一个机器人，进入它的优先级队列并消耗它的配额：
+    least_loaded选择排队最少、最近发送最少的机器人，round_robin轮流使用。
+    sticky_key相同的消息优先使用同一个机器人（按rendezvous哈希选择，该机器人不可用时
+    稳定地落到下一个），用于多页报告等相关消息。
+    每个机器人的发送频率按发送结果自适应调整（见AdaptiveRateLimiter）；
+    某个机器人被限流或key失效时暂停使用，消息改由其他机器人重发；
+    文件和语音消息只能由上传media_id的机器人发送，不会转移。
+    """
+
+    def __init__(self, keys: Iterable[str], strategy: str = ROBOT_POOL_STRATEGY, base_url: str = API_BASE_URL):
+        if strategy not in POOL_STRATEGIES:
+            raise ValueError(f"不支持的机器人池策略: {strategy}")
+        self.robots = [Robot(key, base_url) for key in keys]
+        self.strategy = strategy
+        self._by_id = {robot.id: robot for robot in self.robots}
+        self._counter = itertools.count()
+
+    @property
+    def primary(self) -> Optional[Robot]:
+        """环境变量key对应的机器人"""
+        return self.robots[0] if self.robots else None
+
+    def get(self, robot_id: Optional[str]) -> Optional[Robot]:
+        return self._by_id.get(robot_id)
+
+    def select(self, sticky_key: Optional[str] = None, exclude: Iterable[str] = ()) -> Robot:
+        """选择一个机器人；所有机器人都暂停使用时仍从中选择，由实际发送结果决定"""
+        if not self.robots:
+            raise ValueError("环境变量 'key' 未设置，请设置企业微信群机器人的Webhook Key")
+        excluded = set(exclude)
+        candidates = [r for r in self.robots if r.id not in excluded and r.disabled_reason() is None]
+        if not candidates:
+            candidates = [r for r in self.robots if r.id not in excluded] or self.robots
+
+        if sticky_key is not None:
+            return max(candidates, key=lambda r: hashlib.sha1(f"{sticky_key}:{r.id}".encode('utf-8')).digest())
+        offset = next(self._counter)
+        if self.strategy == "round_robin":
+            return candidates[offset % len(candidates)]
+        # 负载相同时轮流选择，避免总是落到第一个机器人
+        rotated = candidates[offset % len(candidates):] + candidates[:offset % len(candidates)]
+        return min(rotated, key=lambda r: (r.queue_depth(), r.recent_sends()))
+
+    def send(self, data: Dict[str, Any], priority: str, send_fn: Callable[[Dict[str, Any], Robot], Dict[str, Any]],
+             sticky_key: Optional[str] = None, robot: Optional[Robot] = None) -> Dict[str, Any]:
+        """
+        通过池中的机器人发送消息，被限流或key失效时换一个机器人重发
+
+        Args:
+            data: 消息数据
+            priority: 优先级通道
+            send_fn: 实际发送函数，参数为消息数据和机器人
+            sticky_key: 相关消息的粘性键
+            robot: 指定机器人（如media_id所属的机器人），不会转移到其他机器人
+
+        Returns:
+            Dict: 发送结果
+        """
+        # 合并到这条消息中的其他消息等待重发后的最终结果
+        delivery = Delivery()
+        try:
+            result = self._send_with_failover(data, priority, send_fn, sticky_key, robot, delivery)
+        except Exception as e:
+            delivery.fail(e)
+            raise
+        delivery.finish(result)
+        return result
+
+    def _send_with_failover(self, data: Dict[str, Any], priority: str,
+                            send_fn: Callable[[Dict[str, Any], Robot], Dict[str, Any]],
+                            sticky_key: Optional[str], robot: Optional[Robot], delivery: Delivery) -> Dict[str, Any]:
+        """依次通过机器人发送，被限流或key失效时换一个机器人重发"""
+        tried = []
+        while True:
+            current = robot or self.select(sticky_key, tried)
+            current_span().set_attribute("robot.id", current.id)
+
+            def _send(payload, current=current):
+                current.record_send()
+                return send_fn(payload, current)
+
+            result = current.scheduler.send(data, priority, _send, delivery=delivery)
+            errcode = result.get("errcode")
+            if errcode == ERRCODE_THROTTLED:
+                current.limiter.record_throttled()
+                current.disable("throttled", ROBOT_THROTTLE_COOLDOWN)
+            elif errcode == ERRCODE_REVOKED:
+                current.disable("revoked", ROBOT_REVOKED_COOLDOWN)
+            else:
+                if errcode == 0:
+                    current.limiter.record_success()
+                return result
+
+            tried.append(current.id)
+            if robot is not None or len(tried) >= len(self.robots):
+                return result
+            current_span().set_attribute("robot.failover", len(tried))
+
+    def record_media(self, media_id: str, robot: Robot):
+        """记录media_id所属的机器人，只有上传它的机器人能发送"""
+        get_state_store().set("media_robot", media_id, robot.id, MEDIA_CACHE_TTL)
+
+    def media_robot(self, media_id: str) -> Optional[Robot]:
+        """media_id所属的机器人；未知的media_id（如外部上传）视为主机器人上传"""
+        robot_id = get_state_store().get("media_robot", media_id)
+        if robot_id is None:
+            return self.primary
+        robot = self.get(robot_id)
+        if robot is None:
+            raise ValueError("media_id由不在当前机器人池中的机器人上传，只能由上传它的机器人发送")
+        return robot
+
+    def stats(self) -> Dict[str, Any]:
+        """各机器人及合计的队列和发送统计"""
+        robots = []
+        lanes: Dict[str, Dict[str, Any]] = {}
+        for robot in self.robots:
+            robot_lanes = robot.scheduler.stats()
+            robots.append({
+                "robot_id": robot.id,
+                "disabled": robot.disabled_reason(),
+                "rate_per_minute": round(robot.limiter.rate_per_minute, 1),
+                "recent_sends": robot.recent_sends(),
+                "lanes": robot_lanes,
+            })
+            for lane, stats in robot_lanes.items():
+                total = lanes.setdefault(lane, {k: 0 for k in ("queue_depth", "sent", "shed", "coalesced", "timeouts")})
+                for k in total:
+                    total[k] += stats[k]
+        return {
+            "strategy": self.strategy,
+            "capacity_per_minute": round(sum(robot.limiter.rate_per_minute for robot in self.robots), 1),
+            "lanes": lanes,
+            "robots": robots,
+        }
+
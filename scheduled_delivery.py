@@ -0,0 +1,266 @@
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, List, Optional
+from config import SCHEDULE_POLL_INTERVAL, SCHEDULE_MAX_RETRIES, SCHEDULE_RETRY_DELAY
+from state_store import get_state_store
+from tracing import span
+
+logger = logging.getLogger("mcp")
+
+# 定时消息ID到当前outbox条目ID的映射，周期任务每次触发后outbox条目ID会变化
+_NAMESPACE = "schedule"
+
+# cron字段的取值范围：分、时、日、月、星期（0和7都表示周日）
+_CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+# 周期任务最多向后查找的天数
+_CRON_SEARCH_DAYS = 366 * 5
+
+
+class CronSchedule:
+    """
+    五段式cron表达式（分 时 日 月 星期），按服务器本地时间计算
+
+    每段支持 *、数字、逗号列表、范围（1-5）和步长（*/15、0-30/10）。
+    与标准cron一致，日和星期都不是 * 时满足任意一个即可。
+    """
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron表达式必须包含5段（分 时 日 月 星期）: {expression}")
+        self.expression = expression
+        fields = [_parse_cron_field(part, low, high) for part, (low, high) in zip(parts, _CRON_FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        self.weekdays = {d % 7 for d in weekdays}
+        self.any_day = parts[2] == "*"
+        self.any_weekday = parts[4] == "*"
+
+    def _day_matches(self, day: datetime) -> bool:
+        in_days = day.day in self.days
+        in_weekdays = (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_after(self, timestamp: float) -> float:
+        """返回timestamp之后的下一次触发时间戳"""
+        moment = datetime.fromtimestamp(timestamp).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=_CRON_SEARCH_DAYS)
+        # 逐级跳过不匹配的月、日、小时，循环次数与时间跨度的粒度有关而不是分钟数
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError(f"cron表达式在{_CRON_SEARCH_DAYS}天内没有触发时间: {self.expression}")
+
+
+def _parse_cron_field(part: str, low: int, high: int) -> set:
+    """解析单个cron字段为取值集合"""
+    values = set()
+    for item in part.split(","):
+        spec, _, step = item.partition("/")
+        try:
+            step = int(step) if step else 1
+            if spec == "*":
+                start, end = low, high
+            elif "-" in spec:
+                start, end = (int(v) for v in spec.split("-", 1))
+            else:
+                start = int(spec)
+                end = high if step > 1 else start
+        except ValueError:
+            raise ValueError(f"无效的cron字段: {part}")
+        if step < 1 or start < low or end > high or start > end:
+            raise ValueError(f"cron字段超出范围{low}-{high}: {part}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_send_at(send_at: str, now: Optional[float] = None) -> float:
+    """
+    解析发送时间为时间戳
+
+    支持ISO 8601日期时间（2026-01-01T09:00、带时区偏移的时间按偏移换算），
+    以及HH:MM（今天该时刻已过则为明天）。不带时区的时间按服务器本地时间处理。
+    """
+    now = time.time() if now is None else now
+    try:
+        if len(send_at) <= 5 and ":" in send_at:
+            hour, minute = (int(v) for v in send_at.split(":"))
+            moment = datetime.fromtimestamp(now).replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if moment.timestamp() <= now:
+                moment += timedelta(days=1)
+            return moment.timestamp()
+        return datetime.fromisoformat(send_at).timestamp()
+    except ValueError:
+        raise ValueError(f"无法解析发送时间: {send_at}，请使用 2026-01-01T09:00 或 09:00 格式")
+
+
+class DeliveryScheduler:
+    """
+    定时发送：定时消息保存在状态存储的outbox中，后台线程睡眠到最早的计划时间再认领并发送
+
+    每次唤醒只查询堆顶/索引上的最早时间和已到期的条目，代价与到期数量有关，
+    与待发定时消息总数无关。使用SQLite或Redis状态存储时定时消息在重启后仍会发送，
+    多个进程同时运行时由outbox_remove保证每条消息只被一个进程认领。
+    """
+
+    def __init__(self, send_fn: Callable[[Dict[str, Any], Optional[str], str], Dict[str, Any]],
+                 poll_interval: float = SCHEDULE_POLL_INTERVAL):
+        self.send_fn = send_fn
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动后台发送线程，重复调用无副作用"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="qyweixin-schedule", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        """停止后台发送线程"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def schedule(self, message: Dict[str, Any], due: Optional[float] = None, cron: Optional[str] = None,
+                 priority: str = "normal") -> Dict[str, Any]:
+        """
+        添加定时消息
+
+        Args:
+            message: 消息数据
+            due: 发送时间戳；周期任务不传时为下一次触发时间
+            cron: 周期任务的cron表达式
+            priority: 发送优先级
+
+        Returns:
+            Dict: 定时消息ID和计划发送时间
+        """
+        now = time.time()
+        if cron:
+            due = CronSchedule(cron).next_after(now) if due is None else due
+        elif due is None:
+            raise ValueError("必须指定发送时间或cron表达式")
+
+        schedule_id = uuid.uuid4().hex
+        item = {"schedule_id": schedule_id, "message": message, "priority": priority,
+                "cron": cron, "attempts": 0, "created": now}
+        store = get_state_store()
+        store.set(_NAMESPACE, schedule_id, store.outbox_put(item, due))
+        self.start()
+        self._wakeup.set()
+        return {"schedule_id": schedule_id, "due": _format_time(due), "cron": cron}
+
+    def cancel(self, schedule_id: str) -> bool:
+        """取消定时消息；正在发送的周期任务本次仍会发送，之后不再触发"""
+        store = get_state_store()
+        item_id = store.get(_NAMESPACE, schedule_id)
+        if item_id is None:
+            return False
+        store.outbox_remove(item_id)
+        store.delete(_NAMESPACE, schedule_id)
+        return True
+
+    def list(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """按计划时间顺序列出待发送的定时消息"""
+        entries = get_state_store().outbox_due(float("inf"), limit)
+        return [{
+            "schedule_id": item["schedule_id"],
+            "due": _format_time(due),
+            "cron": item.get("cron"),
+            "priority": item.get("priority"),
+            "msgtype": item["message"].get("msgtype"),
+            "attempts": item.get("attempts", 0),
+        } for _, due, item in entries]
+
+    def run_due(self, now: Optional[float] = None) -> int:
+        """认领并发送所有已到期的定时消息，返回本进程发送的数量"""
+        store = get_state_store()
+        now = time.time() if now is None else now
+        sent = 0
+        while not self._stopped.is_set():
+            entries = store.outbox_due(now)
+            if not entries:
+                break
+            for item_id, due, item in entries:
+                if store.outbox_remove(item_id):
+                    self._deliver(store, item_id, item)
+                    sent += 1
+            if len(entries) < 100:
+                break
+        return sent
+
+    def _deliver(self, store, item_id: int, item: Dict[str, Any]):
+        """发送一条已认领的定时消息，失败时重试，周期任务安排下一次触发"""
+        schedule_id = item["schedule_id"]
+        with span("schedule.deliver", **{"schedule.id": schedule_id, "retry.count": item.get("attempts", 0)}):
+            try:
+                result = self.send_fn(item["message"], f"schedule:{item_id}", item.get("priority", "normal"))
+                error = None if result.get("errcode") == 0 else result.get("errmsg", str(result))
+            except Exception as e:
+                error = str(e)
+
+        now = time.time()
+        due = None
+        if error is not None and item.get("attempts", 0) < SCHEDULE_MAX_RETRIES:
+            item["attempts"] = item.get("attempts", 0) + 1
+            item["last_error"] = error
+            due = now + SCHEDULE_RETRY_DELAY * item["attempts"]
+            logger.warning(f"定时消息 {schedule_id} 发送失败（第{item['attempts']}次）: {error}")
+        else:
+            if error is not None:
+                logger.error(f"定时消息 {schedule_id} 重试{SCHEDULE_MAX_RETRIES}次后仍失败，放弃本次发送: {error}")
+            if item.get("cron"):
+                # 停机期间错过的触发不补发，从当前时间计算下一次
+                item["attempts"] = 0
+                item.pop("last_error", None)
+                due = CronSchedule(item["cron"]).next_after(now)
+
+        # 发送期间被取消的任务不再安排
+        if due is None or store.get(_NAMESPACE, schedule_id) != item_id:
+            store.delete(_NAMESPACE, schedule_id)
+            return
+        store.set(_NAMESPACE, schedule_id, store.outbox_put(item, due))
+
+    def _run(self):
+        store_errors = 0
+        while not self._stopped.is_set():
+            try:
+                self.run_due()
+                next_due = get_state_store().outbox_next_due()
+                store_errors = 0
+            except Exception:
+                logger.exception("定时消息发送线程异常")
+                store_errors += 1
+                next_due = None
+            # 没有更早的消息时也定期醒来，以发现其他进程写入的定时消息
+            wait = self.poll_interval * min(store_errors + 1, 10)
+            if next_due is not None:
+                wait = min(wait, max(0.0, next_due - time.time()))
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+
+
+def _format_time(timestamp: float) -> str:
+    """格式化为本地时间字符串"""
+    return datetime.fromtimestamp(timestamp).isoformat(timespec="seconds")
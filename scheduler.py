@@ -0,0 +1,233 @@
+import time
+import threading
+from collections import deque
+from typing import Dict, Any, Callable, Optional
+from config import (
+    PRIORITY_LANES, STARVATION_AGE, QUEUE_OVERFLOW_THRESHOLD,
+    QUEUE_OVERFLOW_POLICY, RATE_LIMIT_MAX_WAIT, MAX_TEXT_LENGTH, MAX_MARKDOWN_LENGTH
+)
+from rate_limiter import RateLimiter
+from tracing import span
+
+# 队列超过阈值时可以被丢弃或合并的通道
+_OVERFLOW_LANES = ("normal", "low")
+
+# 可以合并的消息类型及其长度限制
+_COALESCE_LIMITS = {"text": MAX_TEXT_LENGTH, "markdown": MAX_MARKDOWN_LENGTH, "markdown_v2": MAX_MARKDOWN_LENGTH}
+
+
+class Delivery:
+    """
+    一条消息的最终发送结果
+
+    被合并的消息等待承载它的消息的最终结果。机器人池换机器人重发时，同一条消息在多个机器人的
+    队列中使用同一个Delivery，由机器人池在得到最终结果后完成，被合并的调用方不会拿到中间结果。
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def finish(self, result: Dict[str, Any]):
+        self.result = result
+        self.done.set()
+
+    def fail(self, error: BaseException):
+        self.error = error
+        self.done.set()
+
+
+class _Ticket:
+    """排队中的一条待发消息"""
+
+    def __init__(self, lane: str, data: Dict[str, Any], delivery: Delivery):
+        self.lane = lane
+        self.data = data
+        self.delivery = delivery
+        self.enqueued = time.monotonic()
+        self.coalesced = 0
+
+
+class _LaneStats:
+    """单个通道的统计"""
+
+    def __init__(self):
+        self.sent = 0
+        self.shed = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent_waits = deque(maxlen=200)
+
+
+class SendScheduler:
+    """
+    按优先级通道调度发送：有令牌时优先放行高优先级通道的队首消息
+
+    低优先级消息排队超过STARVATION_AGE秒后视为最高优先级，避免被持续的高优先级消息饿死。
+    队列总长度超过阈值时，normal和low通道的新消息按配置被丢弃（shed）或合并到
+    同通道已排队的同类消息中（coalesce）。
+    """
+
+    def __init__(self, limiter: RateLimiter, lanes=PRIORITY_LANES, starvation_age: float = STARVATION_AGE,
+                 overflow_threshold: int = QUEUE_OVERFLOW_THRESHOLD, overflow_policy: str = QUEUE_OVERFLOW_POLICY):
+        if overflow_policy not in ("block", "shed", "coalesce"):
+            raise ValueError("队列溢出策略必须是block、shed或coalesce")
+        self.limiter = limiter
+        self.lanes = list(lanes)
+        self.starvation_age = starvation_age
+        self.overflow_threshold = overflow_threshold
+        self.overflow_policy = overflow_policy
+        self._queues = {lane: deque() for lane in self.lanes}
+        self._stats = {lane: _LaneStats() for lane in self.lanes}
+        self._cond = threading.Condition()
+
+    def send(self, data: Dict[str, Any], priority: str, send_fn: Callable[[Dict[str, Any]], Dict[str, Any]],
+             timeout: float = RATE_LIMIT_MAX_WAIT, delivery: Optional[Delivery] = None) -> Dict[str, Any]:
+        """
+        排队等待发送配额，轮到后调用send_fn发送
+
+        Args:
+            data: 消息数据
+            priority: 优先级通道
+            send_fn: 实际发送函数
+            timeout: 最长排队时间（秒）
+            delivery: 消息的最终结果，由调用方在重发结束后完成；不指定时以本次发送结果为最终结果
+
+        Returns:
+            Dict: send_fn的返回结果；被合并的消息返回合并后那条消息的最终结果
+        """
+        if priority not in self._queues:
+            raise ValueError(f"优先级必须是{self.lanes}之一")
+
+        own_delivery = delivery is None
+        with span("queue.wait", lane=priority) as wait_span:
+            with self._cond:
+                wait_span.set_attribute("queue.depth", sum(len(q) for q in self._queues.values()))
+                host = self._admit(data, priority)
+                if host is None:
+                    ticket = _Ticket(priority, data, delivery or Delivery())
+                    self._queues[priority].append(ticket)
+                    try:
+                        self._wait_turn(ticket, timeout)
+                    except Exception as e:
+                        if own_delivery:
+                            ticket.delivery.fail(e)
+                        raise
+            wait_span.set_attribute("queue.coalesced", host is not None)
+            if host is not None:
+                return self._wait_coalesced(host, timeout)
+
+        try:
+            result = send_fn(ticket.data)
+        except Exception as e:
+            if own_delivery:
+                ticket.delivery.fail(e)
+            raise
+        if own_delivery:
+            ticket.delivery.finish(result)
+        return result
+
+    def _admit(self, data: Dict[str, Any], priority: str) -> Optional[_Ticket]:
+        """队列溢出处理，调用方需持有锁；合并成功时返回承载合并内容的消息"""
+        if priority not in _OVERFLOW_LANES or self.overflow_policy == "block":
+            return None
+        if sum(len(q) for q in self._queues.values()) < self.overflow_threshold:
+            return None
+
+        if self.overflow_policy == "coalesce":
+            for host in reversed(self._queues[priority]):
+                if _coalesce(host.data, data):
+                    host.coalesced += 1
+                    self._stats[priority].coalesced += 1
+                    return host
+        self._stats[priority].shed += 1
+        raise RuntimeError(f"发送队列已满（{self.overflow_threshold}条），{priority}优先级消息被丢弃")
+
+    def _wait_coalesced(self, host: _Ticket, timeout: float) -> Dict[str, Any]:
+        """等待承载合并内容的消息得到最终结果"""
+        delivery = host.delivery
+        if not delivery.done.wait(timeout + RATE_LIMIT_MAX_WAIT):
+            raise TimeoutError("等待合并消息发送超时")
+        if delivery.error is not None:
+            raise delivery.error
+        return {**delivery.result, "coalesced": True}
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        """选择下一条放行的消息，调用方需持有锁"""
+        now = time.monotonic()
+        heads = [self._queues[lane][0] for lane in self.lanes if self._queues[lane]]
+        if not heads:
+            return None
+        starving = [t for t in heads if now - t.enqueued >= self.starvation_age]
+        if starving:
+            return min(starving, key=lambda t: t.enqueued)
+        return heads[0]
+
+    def _wait_turn(self, ticket: _Ticket, timeout: float):
+        """等待轮到该消息并取得令牌，调用方需持有锁"""
+        deadline = ticket.enqueued + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._queues[ticket.lane].remove(ticket)
+                self._stats[ticket.lane].timeouts += 1
+                self._cond.notify_all()
+                raise TimeoutError(f"发送频率超出限制，排队超过{timeout}秒")
+            if self._next_ticket() is ticket:
+                wait_time = self.limiter.try_acquire()
+                if wait_time == 0:
+                    self._queues[ticket.lane].popleft()
+                    self._record_wait(ticket)
+                    self._cond.notify_all()
+                    return
+                self._cond.wait(min(wait_time, remaining))
+            else:
+                # 队首可能因饥饿保护而变化，定期重新检查
+                self._cond.wait(min(self.starvation_age, remaining))
+
+    def _record_wait(self, ticket: _Ticket):
+        """记录排队时间，调用方需持有锁"""
+        wait = time.monotonic() - ticket.enqueued
+        stats = self._stats[ticket.lane]
+        stats.sent += 1
+        stats.wait_total += wait
+        stats.wait_max = max(stats.wait_max, wait)
+        stats.recent_waits.append(wait)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各通道的队列深度和排队时间统计"""
+        with self._cond:
+            result = {}
+            for lane in self.lanes:
+                s = self._stats[lane]
+                recent = sorted(s.recent_waits)
+                result[lane] = {
+                    "queue_depth": len(self._queues[lane]),
+                    "sent": s.sent,
+                    "shed": s.shed,
+                    "coalesced": s.coalesced,
+                    "timeouts": s.timeouts,
+                    "wait_avg_ms": round(s.wait_total / s.sent * 1000, 1) if s.sent else 0.0,
+                    "wait_p95_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 1) if recent else 0.0,
+                    "wait_max_ms": round(s.wait_max * 1000, 1),
+                }
+            return result
+
+
+def _coalesce(host: Dict[str, Any], data: Dict[str, Any]) -> bool:
+    """尝试把data的内容追加到host中，成功返回True"""
+    msgtype = data.get("msgtype")
+    if host.get("msgtype") != msgtype or msgtype not in _COALESCE_LIMITS:
+        return False
+    host_body, body = host[msgtype], data[msgtype]
+    # 带@的文本消息不合并，避免@对象错位
+    if any(host_body.get(k) or body.get(k) for k in ("mentioned_list", "mentioned_mobile_list")):
+        return False
+    merged = host_body["content"] + "\n\n" + body["content"]
+    if len(merged.encode('utf-8')) > _COALESCE_LIMITS[msgtype]:
+        return False
+    host_body["content"] = merged
+    return True
@@ -1,101 +1,265 @@
+import asyncio
 from fastmcp import FastMCP, Context
+from fastmcp.server.middleware import Middleware
 import logging
 from pydantic import Field
-from typing import Annotated, Optional, List, Dict, Any
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from typing import Annotated, Optional, List, Dict, Any, Callable
 
-# 导入消息发送函数
+# 消息发送由客户端库完成，服务器只负责MCP工具定义和幂等
+from qyweixin_bot import AsyncQyWeixinBot
+from webhook_client import set_default_client
 from message_tools import (
-    qyweixin_text, qyweixin_markdown, qyweixin_markdown_v2, qyweixin_image,
-    qyweixin_news, qyweixin_file, qyweixin_voice, qyweixin_template_card
+    qyweixin_schedule_message, qyweixin_list_schedules,
+    qyweixin_cancel_schedule, qyweixin_stage_blob, qyweixin_delete_blob, delivery_scheduler
 )
 
 # 导入辅助工具函数
-from utils import qyweixin_upload_media, qyweixin_list_message_types, qyweixin_get_message_format
+from utils import qyweixin_list_message_types, qyweixin_get_message_format
+from card_templates import register_card_template, list_card_templates
+from report_templates import register_report_template
+from blob_store import blob_store
+from idempotency import run_idempotent
+from tracing import span
+from profiling import ProfileSession
 
 # 导入配置
-from config import KEY
+from config import KEY, TRANSPORT, HOST, PORT, WORKERS, ADMIN_TOOLS_ENABLED, MAX_PROFILE_SECONDS, QUEUE_OVERFLOW_THRESHOLD
 
 logger = logging.getLogger("mcp")
 
 mcp = FastMCP("qyweixin bot MCP Server", log_level='ERROR')
 
+
+class _TracingMiddleware(Middleware):
+    """每次工具调用作为一条trace的根span，工具和它启动的发送线程在同一上下文中执行，内部的span自动挂在其下"""
+
+    async def on_call_tool(self, context, call_next):
+        arguments = context.message.arguments or {}
+        with span(f"tool {context.message.name}", **{"mcp.tool.name": context.message.name,
+                                                      "idempotency.key_present": bool(arguments.get("idempotency_key"))}):
+            return await call_next(context)
+
+
+mcp.add_middleware(_TracingMiddleware())
+
 # 检查环境变量
 if not KEY:
     raise ValueError("环境变量 'key' 未设置，请设置企业微信群机器人的Webhook Key")
 
+# 所有工具和定时发送共用一个客户端，工具通过异步客户端在它自己的线程池中发送；
+# 线程数与发送队列阈值相同，排队等待配额的低优先级调用不会占满线程池挡住高优先级调用
+async_bot = AsyncQyWeixinBot.from_env(max_concurrency=QUEUE_OVERFLOW_THRESHOLD)
+bot = async_bot.bot
+set_default_client(bot)
+
+
+async def _run_tool(idempotency_key: Optional[str], scope: str, params: Dict[str, Any], fn: Callable[[], Any]) -> Any:
+    """
+    在异步客户端的线程池中以幂等方式执行发送
+
+    发送在机器人的优先级队列中等待配额时会阻塞（最长RATE_LIMIT_MAX_WAIT秒），放到线程中执行，
+    事件循环继续接收其他工具调用，后到的高优先级消息才能越过排队中的低优先级消息。
+    线程复制当前上下文，发送过程中的span仍挂在工具调用的span下。
+    """
+    return await async_bot.run(run_idempotent, idempotency_key, scope, params, fn)
+
 
 @mcp.tool(name="qyweixin_text", description="Send text message to Enterprise WeChat group.")
-def tool_qyweixin_text(
+async def tool_qyweixin_text(
     content: Annotated[str, Field(description="Text message content")],
     mentioned_list: Annotated[Optional[List[str]], Field(description="List of users to mention (@someone), @all means mention everyone")] = None,
     mentioned_mobile_list: Annotated[Optional[List[str]], Field(description="List of mobile numbers to mention (@someone), @all means mention everyone")] = None,
+    priority: Annotated[str, Field(description="Send priority lane: urgent, high, normal or low. Higher lanes are sent first when the bot quota is saturated")] = "normal",
+    idempotency_key: Annotated[Optional[str], Field(description="Optional idempotency key. Repeating a call with the same key returns the original result without sending again, so timed-out calls can be retried safely")] = None,
     ctx: Context = None
 ) -> Dict[str, Any]:
     """Send text message to Enterprise WeChat group."""
-    return qyweixin_text(content, mentioned_list, mentioned_mobile_list)
+    return await _run_tool(idempotency_key, "qyweixin_text", {"content": content, "mentioned_list": mentioned_list, "mentioned_mobile_list": mentioned_mobile_list, "priority": priority},
+                                lambda: bot.text(content, mentioned_list, mentioned_mobile_list, priority))
 
 
 @mcp.tool(name="qyweixin_markdown", description="Send markdown message to Enterprise WeChat group.")
-def tool_qyweixin_markdown(
+async def tool_qyweixin_markdown(
     content: Annotated[str, Field(description="Markdown format message content")],
+    priority: Annotated[str, Field(description="Send priority lane: urgent, high, normal or low. Higher lanes are sent first when the bot quota is saturated")] = "normal",
+    idempotency_key: Annotated[Optional[str], Field(description="Optional idempotency key. Repeating a call with the same key returns the original result without sending again, so timed-out calls can be retried safely")] = None,
     ctx: Context = None
 ) -> Dict[str, Any]:
     """Send markdown message to Enterprise WeChat group."""
-    return qyweixin_markdown(content)
+    return await _run_tool(idempotency_key, "qyweixin_markdown", {"content": content, "priority": priority},
+                                lambda: bot.markdown(content, priority))
 
 
 @mcp.tool(name="qyweixin_markdown_v2", description="Send enhanced markdown message to Enterprise WeChat group (Note: Actually sends regular markdown type, as WeChat Work doesn't support standalone markdown_v2 type).")
-def tool_qyweixin_markdown_v2(
+async def tool_qyweixin_markdown_v2(
     content: Annotated[str, Field(description="Enhanced markdown format message content, supports tables, code blocks, images, etc. (Note: Actually sends as regular markdown)")],
+    priority: Annotated[str, Field(description="Send priority lane: urgent, high, normal or low. Higher lanes are sent first when the bot quota is saturated")] = "normal",
+    idempotency_key: Annotated[Optional[str], Field(description="Optional idempotency key. Repeating a call with the same key returns the original result without sending again, so timed-out calls can be retried safely")] = None,
     ctx: Context = None
 ) -> Dict[str, Any]:
     """Send enhanced markdown message to Enterprise WeChat group."""
-    return qyweixin_markdown_v2(content)
+    return await _run_tool(idempotency_key, "qyweixin_markdown_v2", {"content": content, "priority": priority},
+                                lambda: bot.markdown_v2(content, priority))
+
+
+@mcp.tool(name="qyweixin_register_report_template", description="Register a reusable markdown report template. Syntax: {{ var }}, {% for x in items %}...{% endfor %}, {% if var %}...{% endif %}, and top-level {% section name priority=N %}...{% endsection %} (lower priority number is kept first when the report is too long).")
+def tool_qyweixin_register_report_template(
+    name: Annotated[str, Field(description="Template name")],
+    template: Annotated[str, Field(description="Report template source")],
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """Register a reusable markdown report template."""
+    return register_report_template(name, template)
+
+
+@mcp.tool(name="qyweixin_markdown_report", description="Render a markdown report template and send it, fitting the 4096-byte limit by truncating low-priority sections or splitting into several messages.")
+async def tool_qyweixin_markdown_report(
+    context: Annotated[Dict[str, Any], Field(description="Template variables")],
+    template: Annotated[Optional[str], Field(description="Report template source (compiled once and cached)")] = None,
+    template_name: Annotated[Optional[str], Field(description="Registered report template name, instead of template")] = None,
+    overflow: Annotated[str, Field(description="When over the size limit: truncate (drop items/sections by priority), paginate (send several messages) or error")] = "truncate",
+    markdown_v2: Annotated[bool, Field(description="Send as markdown_v2 instead of markdown")] = False,
+    priority: Annotated[str, Field(description="Send priority lane: urgent, high, normal or low. Higher lanes are sent first when the bot quota is saturated")] = "normal",
+    idempotency_key: Annotated[Optional[str], Field(description="Optional idempotency key. Repeating a call with the same key returns the original result without sending again, so timed-out calls can be retried safely")] = None,
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """Render a markdown report template and send it."""
+    return await _run_tool(idempotency_key, "qyweixin_markdown_report", {"context": context, "template": template, "template_name": template_name, "overflow": overflow, "markdown_v2": markdown_v2, "priority": priority},
+                                lambda: bot.markdown_report(context, template, template_name, overflow, markdown_v2, priority))
+
+
+@mcp.tool(name="qyweixin_markdown_table", description="Render tabular data as markdown_v2 tables (header repeated per message, numbers formatted, wide cells trimmed). Splits into several messages when over 4096 bytes and falls back to sending a CSV file when more than max_messages would be needed; files over 20MB are sent as compressed volumes with a manifest.")
+async def tool_qyweixin_markdown_table(
+    columns: Annotated[Optional[List[Any]], Field(description="Column names, or objects {key, title, format, align, max_width}; format is a Python format spec such as ',.2f'. Defaults to the file header or the keys of the first row")] = None,
+    rows: Annotated[Optional[List[Any]], Field(description="Table rows as objects or lists")] = None,
+    file_path: Annotated[Optional[str], Field(description="CSV/TSV file path or staged blob reference (blob:<id>) to stream rows from, instead of rows")] = None,
+    title: Annotated[Optional[str], Field(description="Table title")] = None,
+    max_messages: Annotated[int, Field(description="Maximum number of markdown messages before falling back to a file")] = 5,
+    max_width: Annotated[int, Field(description="Maximum characters per cell")] = 30,
+    priority: Annotated[str, Field(description="Send priority lane: urgent, high, normal or low. Higher lanes are sent first when the bot quota is saturated")] = "normal",
+    idempotency_key: Annotated[Optional[str], Field(description="Optional idempotency key. Repeating a call with the same key returns the original result without sending again, so timed-out calls can be retried safely")] = None,
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """Render tabular data as markdown_v2 tables and send them."""
+    return await _run_tool(idempotency_key, "qyweixin_markdown_table", {"columns": columns, "rows": rows, "file_path": file_path, "title": title, "max_messages": max_messages, "max_width": max_width, "priority": priority},
+                                lambda: bot.markdown_table(columns, rows, file_path, title, max_messages, max_width, priority))
 
 
 @mcp.tool(name="qyweixin_image", description="Send image message to Enterprise WeChat group.")
-def tool_qyweixin_image(
+async def tool_qyweixin_image(
     image_url: Annotated[Optional[str], Field(description="Image URL")] = None,
-    image_path: Annotated[Optional[str], Field(description="Local image file path")] = None,
+    image_path: Annotated[Optional[str], Field(description="Local image file path, file:// URI or staged blob reference (blob:<id> or qyweixin://blobs/<id>)")] = None,
     image_base64: Annotated[Optional[str], Field(description="Base64 encoded image data")] = None,
     image_md5: Annotated[Optional[str], Field(description="MD5 hash of image data, optional")] = None,
+    priority: Annotated[str, Field(description="Send priority lane: urgent, high, normal or low. Higher lanes are sent first when the bot quota is saturated")] = "normal",
+    idempotency_key: Annotated[Optional[str], Field(description="Optional idempotency key. Repeating a call with the same key returns the original result without sending again, so timed-out calls can be retried safely")] = None,
     ctx: Context = None
 ) -> Dict[str, Any]:
     """Send image message to Enterprise WeChat group."""
-    return qyweixin_image(image_url, image_path, image_base64, image_md5)
+    return await _run_tool(idempotency_key, "qyweixin_image", {"image_url": image_url, "image_path": image_path, "image_base64": image_base64, "image_md5": image_md5, "priority": priority},
+                                lambda: bot.image(image_url, image_path, image_base64, image_md5, priority))
+
+
+@mcp.tool(name="qyweixin_chart", description="Render numeric series as a chart image in memory and send it as an image message. Large series are downsampled (LTTB) and the image is sized to fit the 2MB limit.")
+async def tool_qyweixin_chart(
+    series: Annotated[List[Dict[str, Any]], Field(description="Data series, each with y (list of numbers), optional x (list of numbers) and name")],
+    chart_type: Annotated[str, Field(description="Chart type: line, bar or scatter")] = "line",
+    title: Annotated[Optional[str], Field(description="Chart title")] = None,
+    x_label: Annotated[Optional[str], Field(description="X axis label")] = None,
+    y_label: Annotated[Optional[str], Field(description="Y axis label")] = None,
+    width: Annotated[float, Field(description="Chart width in inches")] = 8,
+    height: Annotated[float, Field(description="Chart height in inches")] = 4.5,
+    priority: Annotated[str, Field(description="Send priority lane: urgent, high, normal or low. Higher lanes are sent first when the bot quota is saturated")] = "normal",
+    idempotency_key: Annotated[Optional[str], Field(description="Optional idempotency key. Repeating a call with the same key returns the original result without sending again, so timed-out calls can be retried safely")] = None,
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """Render numeric series as a chart and send it as an image."""
+    return await _run_tool(idempotency_key, "qyweixin_chart", {"series": series, "chart_type": chart_type, "title": title, "x_label": x_label, "y_label": y_label, "width": width, "height": height, "priority": priority},
+                                lambda: bot.chart(series, chart_type, title, x_label, y_label, width, height, priority))
 
 
 @mcp.tool(name="qyweixin_news", description="Send news message to Enterprise WeChat group.")
-def tool_qyweixin_news(
+async def tool_qyweixin_news(
     articles: Annotated[List[Dict[str, str]], Field(description="List of articles, each containing title, url, description, picurl")],
+    priority: Annotated[str, Field(description="Send priority lane: urgent, high, normal or low. Higher lanes are sent first when the bot quota is saturated")] = "normal",
+    idempotency_key: Annotated[Optional[str], Field(description="Optional idempotency key. Repeating a call with the same key returns the original result without sending again, so timed-out calls can be retried safely")] = None,
     ctx: Context = None
 ) -> Dict[str, Any]:
     """Send news message to Enterprise WeChat group."""
-    return qyweixin_news(articles)
+    return await _run_tool(idempotency_key, "qyweixin_news", {"articles": articles, "priority": priority},
+                                lambda: bot.news(articles, priority))
+
+
+@mcp.tool(name="qyweixin_news_bulk", description="Send any number of news articles to Enterprise WeChat group, automatically split into ordered pages of 8 articles.")
+async def tool_qyweixin_news_bulk(
+    articles: Annotated[List[Dict[str, str]], Field(description="List of articles in display order, each containing title, url, description, picurl")],
+    check_picurl: Annotated[bool, Field(description="Probe every picurl header before sending anything and fail if any is unreachable or not an image")] = False,
+    priority: Annotated[str, Field(description="Send priority lane: urgent, high, normal or low. Higher lanes are sent first when the bot quota is saturated")] = "normal",
+    idempotency_key: Annotated[Optional[str], Field(description="Optional idempotency key. Repeating a call with the same key returns the original result without sending again, so timed-out calls can be retried safely")] = None,
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """Send news articles in pages of 8 to Enterprise WeChat group."""
+    return await _run_tool(idempotency_key, "qyweixin_news_bulk", {"articles": articles, "check_picurl": check_picurl, "priority": priority},
+                                lambda: bot.news_bulk(articles, check_picurl, priority))
 
 
 @mcp.tool(name="qyweixin_file", description="Send file message to Enterprise WeChat group.")
-def tool_qyweixin_file(
-    file_path: Annotated[Optional[str], Field(description="Local file path")] = None,
+async def tool_qyweixin_file(
+    file_path: Annotated[Optional[str], Field(description="Local file path, file:// URI or staged blob reference (blob:<id> or qyweixin://blobs/<id>)")] = None,
     media_id: Annotated[Optional[str], Field(description="Already uploaded file media_id")] = None,
+    priority: Annotated[str, Field(description="Send priority lane: urgent, high, normal or low. Higher lanes are sent first when the bot quota is saturated")] = "normal",
+    idempotency_key: Annotated[Optional[str], Field(description="Optional idempotency key. Repeating a call with the same key returns the original result without sending again, so timed-out calls can be retried safely")] = None,
     ctx: Context = None
 ) -> Dict[str, Any]:
     """Send file message to Enterprise WeChat group."""
-    return qyweixin_file(file_path, media_id)
+    return await _run_tool(idempotency_key, "qyweixin_file", {"file_path": file_path, "media_id": media_id, "priority": priority},
+                                lambda: bot.file(file_path, media_id, priority))
+
+
+@mcp.tool(name="qyweixin_large_file", description="Send a file of any size to Enterprise WeChat group. Files over 20MB are stream-compressed and split into volumes, uploaded concurrently, sent in order and followed by a manifest message.")
+async def tool_qyweixin_large_file(
+    file_path: Annotated[str, Field(description="Local file path, file:// URI or staged blob reference (blob:<id> or qyweixin://blobs/<id>)")],
+    compression: Annotated[str, Field(description="Compression for oversized files: gzip, zstd or none (split only)")] = "gzip",
+    priority: Annotated[str, Field(description="Send priority lane: urgent, high, normal or low. Higher lanes are sent first when the bot quota is saturated")] = "normal",
+    idempotency_key: Annotated[Optional[str], Field(description="Optional idempotency key. Repeating a call with the same key returns the original result without sending again, so timed-out calls can be retried safely")] = None,
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """Send a possibly oversized file to Enterprise WeChat group."""
+    return await _run_tool(idempotency_key, "qyweixin_large_file", {"file_path": file_path, "compression": compression, "priority": priority},
+                                lambda: bot.large_file(file_path, compression, priority))
+
+
+@mcp.tool(name="qyweixin_files", description="Send all files in a directory or matching a glob pattern to Enterprise WeChat group, in file name order. Unchanged files reuse cached media_ids; only new files are uploaded.")
+async def tool_qyweixin_files(
+    path: Annotated[str, Field(description="Directory path or glob pattern, e.g. /data/output/*.csv")],
+    recursive: Annotated[bool, Field(description="Include subdirectories (allows ** in glob patterns)")] = False,
+    bundle_small: Annotated[bool, Field(description="Bundle files up to 1MB into one zip to save message quota")] = False,
+    priority: Annotated[str, Field(description="Send priority lane: urgent, high, normal or low. Higher lanes are sent first when the bot quota is saturated")] = "normal",
+    idempotency_key: Annotated[Optional[str], Field(description="Optional idempotency key. Repeating a call with the same key returns the original result without sending again, so timed-out calls can be retried safely")] = None,
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """Send all files in a directory or matching a glob pattern."""
+    return await _run_tool(idempotency_key, "qyweixin_files", {"path": path, "recursive": recursive, "bundle_small": bundle_small, "priority": priority},
+                                lambda: bot.files(path, recursive, bundle_small, priority))
 
 
 @mcp.tool(name="qyweixin_voice", description="Send voice message to Enterprise WeChat group.")
-def tool_qyweixin_voice(
-    voice_path: Annotated[Optional[str], Field(description="Local voice file path (AMR format)")] = None,
+async def tool_qyweixin_voice(
+    voice_path: Annotated[Optional[str], Field(description="Local voice file path, file:// URI or staged blob reference. AMR is sent as is; WAV, MP3 and other formats are transcoded to AMR. Must be at most 60 seconds")] = None,
     media_id: Annotated[Optional[str], Field(description="Already uploaded voice media_id")] = None,
+    priority: Annotated[str, Field(description="Send priority lane: urgent, high, normal or low. Higher lanes are sent first when the bot quota is saturated")] = "normal",
+    idempotency_key: Annotated[Optional[str], Field(description="Optional idempotency key. Repeating a call with the same key returns the original result without sending again, so timed-out calls can be retried safely")] = None,
     ctx: Context = None
 ) -> Dict[str, Any]:
     """Send voice message to Enterprise WeChat group."""
-    return qyweixin_voice(voice_path, media_id)
+    return await _run_tool(idempotency_key, "qyweixin_voice", {"voice_path": voice_path, "media_id": media_id, "priority": priority},
+                                lambda: bot.voice(voice_path, media_id, priority))
 
 
 @mcp.tool(name="qyweixin_template_card", description="Send template card message to Enterprise WeChat group.")
-def tool_qyweixin_template_card(
+async def tool_qyweixin_template_card(
     card_type: Annotated[str, Field(description="Template card type: text_notice or news_notice")],
     main_title: Annotated[Optional[str], Field(description="Main title for template card")] = None,
     card_action_type: Annotated[Optional[int], Field(description="Card action type: 1=jump to URL, 2=jump to mini program")] = None,
@@ -103,11 +267,13 @@ def tool_qyweixin_template_card(
     main_title_desc: Annotated[Optional[str], Field(description="Main title description for template card")] = None,
     source_desc: Annotated[Optional[str], Field(description="Card source description")] = None,
     source_icon_url: Annotated[Optional[str], Field(description="Card source icon URL")] = None,
-    card_image_url: Annotated[Optional[str], Field(description="Card image URL, required for news_notice type")] = None,
-    card_image_aspect_ratio: Annotated[Optional[float], Field(description="Card image aspect ratio, optional for news_notice type")] = None,
+    card_image_url: Annotated[Optional[str], Field(description="Card image URL, required for news_notice type. The image header is probed before sending to check it is a PNG, JPEG, GIF or WebP image")] = None,
+    card_image_aspect_ratio: Annotated[Optional[float], Field(description="Card image aspect ratio (width / height) between 1.3 and 2.25, optional for news_notice type. Defaults to the probed ratio of the image, clamped to that range")] = None,
     sub_title_text: Annotated[Optional[str], Field(description="Sub title text, optional for text_notice type")] = None,
     emphasis_title: Annotated[Optional[str], Field(description="Emphasis content title, optional for text_notice type")] = None,
     emphasis_desc: Annotated[Optional[str], Field(description="Emphasis content description, optional for text_notice type")] = None,
+    priority: Annotated[str, Field(description="Send priority lane: urgent, high, normal or low. Higher lanes are sent first when the bot quota is saturated")] = "normal",
+    idempotency_key: Annotated[Optional[str], Field(description="Optional idempotency key. Repeating a call with the same key returns the original result without sending again, so timed-out calls can be retried safely")] = None,
     ctx: Context = None
 ) -> Dict[str, Any]:
     """Send template card message to Enterprise WeChat group."""
@@ -133,9 +299,9 @@ def tool_qyweixin_template_card(
             card_params["source"]["icon_url"] = source_icon_url
     
     if card_type == "news_notice" and card_image_url:
-        card_params["card_image_url"] = card_image_url
+        card_params["card_image"] = {"url": card_image_url}
         if card_image_aspect_ratio:
-            card_params["aspect_ratio"] = card_image_aspect_ratio
+            card_params["card_image"]["aspect_ratio"] = card_image_aspect_ratio
     
     if card_type == "text_notice":
         if sub_title_text:
@@ -147,22 +313,139 @@ def tool_qyweixin_template_card(
             if emphasis_desc:
                 card_params["emphasis_content"]["desc"] = emphasis_desc
     
-    return qyweixin_template_card(card_type, **card_params)
+    return await _run_tool(idempotency_key, "qyweixin_template_card", {"card_type": card_type, "priority": priority, "card_params": card_params},
+                                lambda: bot.template_card(card_type, priority, **card_params))
+
+
+@mcp.tool(name="qyweixin_register_card_template", description="Register a reusable named template card. String values may contain {{variable}} placeholders; a value that is exactly one placeholder is replaced by the variable itself (e.g. a horizontal_content_list or jump_list).")
+def tool_qyweixin_register_card_template(
+    name: Annotated[str, Field(description="Template name")],
+    template: Annotated[Dict[str, Any], Field(description="Full template_card object including card_type, may use horizontal_content_list, jump_list, action_menu, etc.")],
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """Register a reusable named template card."""
+    return register_card_template(name, template)
+
+
+@mcp.tool(name="qyweixin_list_card_templates", description="List registered template cards and their variables.")
+def tool_qyweixin_list_card_templates(ctx: Context = None) -> List[Dict[str, Any]]:
+    """List registered template cards and their variables."""
+    return list_card_templates()
+
+
+@mcp.tool(name="qyweixin_template_card_by_name", description="Send a registered template card, filling in only the variable fields.")
+async def tool_qyweixin_template_card_by_name(
+    name: Annotated[str, Field(description="Registered template name")],
+    values: Annotated[Dict[str, Any], Field(description="Values for the template variables")],
+    priority: Annotated[str, Field(description="Send priority lane: urgent, high, normal or low. Higher lanes are sent first when the bot quota is saturated")] = "normal",
+    idempotency_key: Annotated[Optional[str], Field(description="Optional idempotency key. Repeating a call with the same key returns the original result without sending again, so timed-out calls can be retried safely")] = None,
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """Send a registered template card."""
+    return await _run_tool(idempotency_key, "qyweixin_template_card_by_name", {"name": name, "values": values, "priority": priority},
+                                lambda: bot.template_card_by_name(name, values, priority))
+
+
+@mcp.tool(name="qyweixin_schedule_message", description="Schedule a text or markdown message for later delivery: at a given time, after a delay, or repeatedly on a cron schedule. Scheduled messages survive server restarts when a persistent state store is configured.")
+async def tool_qyweixin_schedule_message(
+    content: Annotated[str, Field(description="Message content")],
+    msgtype: Annotated[str, Field(description="Message type: text, markdown or markdown_v2")] = "text",
+    send_at: Annotated[Optional[str], Field(description="Send time in server local time, e.g. 2026-01-01T09:00, or HH:MM for the next occurrence")] = None,
+    delay_seconds: Annotated[Optional[float], Field(description="Send after this many seconds")] = None,
+    cron: Annotated[Optional[str], Field(description="Five-field cron expression (minute hour day month weekday) for recurring delivery, e.g. '0 9 * * 1-5'")] = None,
+    mentioned_list: Annotated[Optional[List[str]], Field(description="List of users to mention (text only)")] = None,
+    mentioned_mobile_list: Annotated[Optional[List[str]], Field(description="List of mobile numbers to mention (text only)")] = None,
+    priority: Annotated[str, Field(description="Send priority lane: urgent, high, normal or low. Higher lanes are sent first when the bot quota is saturated")] = "normal",
+    idempotency_key: Annotated[Optional[str], Field(description="Optional idempotency key. Repeating a call with the same key returns the original result without sending again, so timed-out calls can be retried safely")] = None,
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """Schedule a message for later delivery."""
+    return await _run_tool(idempotency_key, "qyweixin_schedule_message", {"content": content, "msgtype": msgtype, "send_at": send_at, "delay_seconds": delay_seconds, "cron": cron, "mentioned_list": mentioned_list, "mentioned_mobile_list": mentioned_mobile_list, "priority": priority},
+                                lambda: qyweixin_schedule_message(content, msgtype, send_at, delay_seconds, cron, mentioned_list, mentioned_mobile_list, priority))
+
+
+@mcp.tool(name="qyweixin_list_schedules", description="List pending scheduled messages ordered by next send time.")
+def tool_qyweixin_list_schedules(
+    limit: Annotated[int, Field(description="Maximum number of schedules to return")] = 100,
+    ctx: Context = None
+) -> List[Dict[str, Any]]:
+    """List pending scheduled messages."""
+    return qyweixin_list_schedules(limit)
+
+
+@mcp.tool(name="qyweixin_cancel_schedule", description="Cancel a scheduled message. A recurring schedule stops firing after cancellation.")
+def tool_qyweixin_cancel_schedule(
+    schedule_id: Annotated[str, Field(description="Schedule ID returned by qyweixin_schedule_message")],
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """Cancel a scheduled message."""
+    return qyweixin_cancel_schedule(schedule_id)
+
+
+@mcp.tool(name="qyweixin_stage_blob", description="Stage binary data on the server and get a blob reference (blob:<id>) that image, file, voice and upload tools accept in place of a path, so large payloads are sent once instead of inside every call. Large data can be staged in several chunks by passing the returned blob_id. Over HTTP, POST the raw bytes to /blobs?name=<file name> instead to skip base64 and JSON entirely.")
+def tool_qyweixin_stage_blob(
+    data_base64: Annotated[str, Field(description="Base64 encoded data to write")],
+    name: Annotated[Optional[str], Field(description="File name, required when creating a blob")] = None,
+    blob_id: Annotated[Optional[str], Field(description="Existing blob to append to; omit to create a new blob")] = None,
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """Stage binary data and get a blob reference."""
+    return qyweixin_stage_blob(data_base64, name, blob_id)
+
+
+@mcp.tool(name="qyweixin_delete_blob", description="Delete a staged blob. Blobs also expire automatically after a period without writes.")
+def tool_qyweixin_delete_blob(
+    blob_id: Annotated[str, Field(description="Blob reference returned by qyweixin_stage_blob")],
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """Delete a staged blob."""
+    return qyweixin_delete_blob(blob_id)
+
+
+@mcp.resource("qyweixin://blobs/{blob_id}", description="Metadata of a staged blob: name, size and expiry.",
+              mime_type="application/json")
+def resource_blob(blob_id: str) -> Dict[str, Any]:
+    """Metadata of a staged blob."""
+    return blob_store.info(blob_id)
+
+
+@mcp.custom_route("/blobs", methods=["POST"])
+async def route_stage_blob(request: Request) -> JSONResponse:
+    """以原始字节暂存blob（HTTP传输），不经过base64和JSON-RPC"""
+    blob_id = None
+    try:
+        blob_id = blob_store.create(request.query_params.get("name", ""))
+        async for chunk in request.stream():
+            if chunk:
+                blob_store.append(blob_id, chunk)
+        return JSONResponse(blob_store.info(blob_id))
+    except ValueError as e:
+        if blob_id is not None:
+            blob_store.delete(blob_id)
+        return JSONResponse({"error": str(e)}, status_code=400)
 
 
 @mcp.tool(name="qyweixin_upload_media", description="Upload file or voice to Enterprise WeChat robot and get media_id.")
-def tool_qyweixin_upload_media(
-    file_path: Annotated[str, Field(description="Local file path to upload")],
+async def tool_qyweixin_upload_media(
+    file_path: Annotated[str, Field(description="Local file path to upload, file:// URI or staged blob reference")],
     media_type: Annotated[str, Field(description="Media type: file or voice")] = "file",
+    idempotency_key: Annotated[Optional[str], Field(description="Optional idempotency key. Repeating a call with the same key returns the original result without sending again, so timed-out calls can be retried safely")] = None,
     ctx: Context = None
 ) -> str:
     """Upload file or voice to Enterprise WeChat robot and get media_id."""
     try:
-        return qyweixin_upload_media(file_path, media_type)
+        return await _run_tool(idempotency_key, "qyweixin_upload_media", {"file_path": file_path, "media_type": media_type},
+                                    lambda: bot.upload_media(file_path, media_type))
     except Exception as e:
         raise Exception(f"上传媒体文件失败: {str(e)}")
 
 
+@mcp.tool(name="qyweixin_send_stats", description="Get per-priority-lane send queue depth and wait-time metrics, in total and per pooled robot, plus in-flight payload memory usage.")
+def tool_qyweixin_send_stats(ctx: Context = None) -> Dict[str, Any]:
+    """Get per-priority-lane send queue depth and wait-time metrics, in total and per pooled robot, plus in-flight payload memory usage."""
+    return async_bot.stats()
+
+
 @mcp.tool(name="qyweixin_list_message_types", description="List all supported message types for Enterprise WeChat robot.")
 def tool_qyweixin_list_message_types(ctx: Context = None) -> List[Dict[str, Any]]:
     """List all supported message types for Enterprise WeChat robot."""
@@ -178,11 +461,54 @@ def tool_qyweixin_get_message_format(
     return qyweixin_get_message_format(message_type)
 
 
+if ADMIN_TOOLS_ENABLED:
+    @mcp.tool(name="qyweixin_admin_profile", description="Admin: profile the live server process for N seconds while it keeps serving. 'sampling' samples all thread stacks (returns top functions and collapsed stacks for flame graphs); 'cprofile' traces every call on the event loop thread, i.e. MCP request handling; message building and sending run in worker threads and are covered by sampling (returns a pstats summary). Optionally reports the top tracemalloc allocation growth. In multi-worker mode only the worker handling this call is profiled.")
+    async def tool_qyweixin_admin_profile(
+        seconds: Annotated[float, Field(description="Profiling duration in seconds")] = 10,
+        mode: Annotated[str, Field(description="Profiler: sampling or cprofile")] = "sampling",
+        trace_memory: Annotated[bool, Field(description="Also report top memory allocation growth via tracemalloc (adds overhead while running)")] = True,
+        top: Annotated[int, Field(description="Number of entries to return per section")] = 20,
+        collapsed_path: Annotated[Optional[str], Field(description="Write all collapsed stacks to this file (sampling mode), for flamegraph.pl or speedscope")] = None,
+        ctx: Context = None
+    ) -> Dict[str, Any]:
+        """Profile the live server process for N seconds."""
+        if not 0 < seconds <= MAX_PROFILE_SECONDS:
+            raise ValueError(f"分析时间必须在0到{MAX_PROFILE_SECONDS}秒之间")
+        session = ProfileSession(mode, trace_memory)
+        session.start()
+        # 异步等待，分析期间事件循环继续处理其他工具调用
+        try:
+            await asyncio.sleep(seconds)
+        except BaseException:
+            session.stop(top)
+            raise
+        return session.stop(top, collapsed_path)
+
+
+def _worker_app():
+    """在工作进程中启动定时发送线程并创建ASGI应用（线程不会跨fork保留）"""
+    delivery_scheduler.start()
+    return mcp.http_app(transport="http", stateless_http=True)
+
+
 def run_server():
     """启动MCP服务器"""
     logger.info("🚀 启动企业微信机器人MCP服务器...")
     logger.info(f"📡 Webhook Key: {KEY[:8]}..." if KEY else "❌ 未设置Webhook Key")
-    mcp.run()
+    if len(bot.pool.robots) > 1:
+        logger.info(f"🤖 机器人池: {len(bot.pool.robots)}个机器人，策略 {bot.pool.strategy}")
+    if TRANSPORT == "stdio":
+        delivery_scheduler.start()
+        mcp.run()
+    elif WORKERS > 1:
+        # 多进程下请求可能落在任意工作进程，只能使用无状态的HTTP传输
+        if TRANSPORT != "http":
+            raise ValueError("多进程模式只支持http传输")
+        from supervisor import run_workers
+        run_workers(_worker_app, HOST, PORT, WORKERS)
+    else:
+        delivery_scheduler.start()
+        mcp.run(transport=TRANSPORT, host=HOST, port=PORT)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,448 @@
+import os
+import json
+import heapq
+import time
+import sqlite3
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+from config import STATE_URL, MEMORY_STORE_MAX_KEYS
+
+# 状态存储：media_id缓存、令牌桶、去重窗口和待发消息（outbox）共用同一个后端，
+# 多个服务进程指向同一个SQLite文件或Redis即可共享状态。
+#   memory://                  进程内存（默认，单进程）
+#   sqlite:///path/to/state.db 本地SQLite（WAL + mmap，适合同机多进程）
+#   redis://host:6379/0        Redis或兼容服务（需要安装redis）
+
+
+class StateStore:
+    """状态存储接口，值均为可JSON序列化的对象"""
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """读取未过期的值"""
+        raise NotImplementedError
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        """写入值，ttl为过期秒数"""
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str):
+        """删除值"""
+        raise NotImplementedError
+
+    def add(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """键不存在（或已过期）时写入并返回True，否则返回False，用于去重"""
+        raise NotImplementedError
+
+    def take_token(self, bucket: str, rate: float, capacity: float) -> float:
+        """
+        原子地从令牌桶取一个令牌
+
+        Args:
+            bucket: 令牌桶名称
+            rate: 每秒补充的令牌数
+            capacity: 桶容量
+
+        Returns:
+            float: 成功返回0，否则返回需要等待的秒数
+        """
+        raise NotImplementedError
+
+    def outbox_put(self, item: Dict[str, Any], due: float = 0) -> int:
+        """写入待发消息，due为计划发送的时间戳，返回消息ID"""
+        raise NotImplementedError
+
+    def outbox_due(self, now: float, limit: int = 100) -> List[Tuple[int, float, Dict[str, Any]]]:
+        """按计划时间顺序返回已到期的待发消息 (ID, 计划时间, 消息)"""
+        raise NotImplementedError
+
+    def outbox_next_due(self) -> Optional[float]:
+        """返回最早的计划发送时间，没有待发消息时返回None"""
+        raise NotImplementedError
+
+    def outbox_remove(self, item_id: int) -> bool:
+        """删除待发消息，返回是否删除成功（多进程时只有一个进程能成功认领）"""
+        raise NotImplementedError
+
+    def outbox_count(self) -> int:
+        """待发消息数量"""
+        raise NotImplementedError
+
+
+def _refill(tokens: float, updated: float, now: float, rate: float, capacity: float) -> float:
+    """按流逝时间补充令牌"""
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryStateStore(StateStore):
+    """进程内存状态存储"""
+
+    def __init__(self, max_keys: int = MEMORY_STORE_MAX_KEYS):
+        self.max_keys = max_keys
+        self._data: Dict[Tuple[str, str], Tuple[Any, Optional[float]]] = {}
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._outbox: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+        # (计划时间, ID)小顶堆，删除时只从字典中移除，堆中的失效条目在访问堆顶时丢弃
+        self._outbox_heap: List[Tuple[float, int]] = []
+        self._outbox_seq = 0
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _purge(self, now: float):
+        """定期清理过期键，超出max_keys时按写入顺序淘汰带过期时间的键，调用方需持有锁"""
+        self._writes += 1
+        if self._writes % 1000 != 0 and len(self._data) < self.max_keys:
+            return
+        for k in [k for k, (_, exp) in self._data.items() if exp is not None and exp <= now]:
+            del self._data[k]
+        if len(self._data) >= self.max_keys:
+            # 一次淘汰到90%，避免每次写入都遍历；没有过期时间的键（如定时消息）不淘汰
+            excess = len(self._data) - int(self.max_keys * 0.9)
+            for k in [k for k, (_, exp) in self._data.items() if exp is not None][:excess]:
+                del self._data[k]
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._data.get((namespace, key))
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.time():
+                del self._data[(namespace, key)]
+                return None
+            return entry[0]
+
+    def set(self, namespace, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            self._data[(namespace, key)] = (value, now + ttl if ttl else None)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def add(self, namespace, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get((namespace, key))
+            if entry is not None and (entry[1] is None or entry[1] > now):
+                return False
+            self._purge(now)
+            self._data[(namespace, key)] = (value, now + ttl if ttl else None)
+            return True
+
+    def take_token(self, bucket, rate, capacity):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(bucket, (capacity, now))
+            tokens = _refill(tokens, updated, now, rate, capacity)
+            if tokens >= 1:
+                self._buckets[bucket] = (tokens - 1, now)
+                return 0.0
+            self._buckets[bucket] = (tokens, now)
+            return (1 - tokens) / rate
+
+    def outbox_put(self, item, due=0):
+        with self._lock:
+            self._outbox_seq += 1
+            self._outbox[self._outbox_seq] = (due, item)
+            heapq.heappush(self._outbox_heap, (due, self._outbox_seq))
+            return self._outbox_seq
+
+    def _outbox_head(self) -> Optional[Tuple[float, int]]:
+        """丢弃堆顶的失效条目后返回堆顶，调用方需持有锁"""
+        heap = self._outbox_heap
+        while heap and heap[0][1] not in self._outbox:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def outbox_due(self, now, limit=100):
+        with self._lock:
+            # 弹出到期条目后再放回，代价与到期数量成正比而不是与待发总数成正比
+            popped = []
+            while len(popped) < limit:
+                head = self._outbox_head()
+                if head is None or head[0] > now:
+                    break
+                popped.append(heapq.heappop(self._outbox_heap))
+            for entry in popped:
+                heapq.heappush(self._outbox_heap, entry)
+            return [(i, d, self._outbox[i][1]) for d, i in popped]
+
+    def outbox_next_due(self):
+        with self._lock:
+            head = self._outbox_head()
+            return head[0] if head else None
+
+    def outbox_remove(self, item_id):
+        with self._lock:
+            return self._outbox.pop(item_id, None) is not None
+
+    def outbox_count(self):
+        with self._lock:
+            return len(self._outbox)
+
+
+class SQLiteStateStore(StateStore):
+    """
+    SQLite状态存储，WAL模式允许多进程并发读写，mmap减少读路径的系统调用
+
+    每个线程使用独立连接；令牌桶使用 BEGIN IMMEDIATE 事务保证跨进程原子性。
+    """
+
+    def __init__(self, path: str, mmap_size: int = 256 * 1024 * 1024):
+        self.path = path
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS kv (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (namespace, key)
+            );
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                due REAL NOT NULL,
+                item TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS outbox_due ON outbox (due, id);
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        """获取当前线程的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            self._local.conn = conn
+        return conn
+
+    def _purge(self, conn: sqlite3.Connection, now: float):
+        """定期清理过期键"""
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+
+    def get(self, namespace, key):
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace, key, value, ttl=None):
+        now = time.time()
+        conn = self._conn()
+        self._purge(conn, now)
+        conn.execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value, ensure_ascii=False), now + ttl if ttl else None)
+        )
+
+    def delete(self, namespace, key):
+        self._conn().execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def add(self, namespace, key, value, ttl=None):
+        now = time.time()
+        conn = self._conn()
+        self._purge(conn, now)
+        cursor = conn.execute(
+            """INSERT INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)
+               ON CONFLICT (namespace, key) DO UPDATE
+               SET value = excluded.value, expires_at = excluded.expires_at
+               WHERE kv.expires_at IS NOT NULL AND kv.expires_at <= ?""",
+            (namespace, key, json.dumps(value, ensure_ascii=False), now + ttl if ttl else None, now)
+        )
+        return cursor.rowcount > 0
+
+    def take_token(self, bucket, rate, capacity):
+        # 跨进程共享，使用墙上时间
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (bucket,)).fetchone()
+            tokens = _refill(row[0], row[1], now, rate, capacity) if row else capacity
+            wait_time = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait_time = (1 - tokens) / rate
+            conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                         (bucket, tokens, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait_time
+
+    def outbox_put(self, item, due=0):
+        cursor = self._conn().execute(
+            "INSERT INTO outbox (due, item) VALUES (?, ?)", (due, json.dumps(item, ensure_ascii=False)))
+        return cursor.lastrowid
+
+    def outbox_due(self, now, limit=100):
+        rows = self._conn().execute(
+            "SELECT id, due, item FROM outbox WHERE due <= ? ORDER BY due, id LIMIT ?", (now, limit)
+        ).fetchall()
+        return [(row[0], row[1], json.loads(row[2])) for row in rows]
+
+    def outbox_next_due(self):
+        row = self._conn().execute("SELECT MIN(due) FROM outbox").fetchone()
+        return row[0]
+
+    def outbox_remove(self, item_id):
+        return self._conn().execute("DELETE FROM outbox WHERE id = ?", (item_id,)).rowcount > 0
+
+    def outbox_count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+
+class RedisStateStore(StateStore):
+    """
+    Redis（或兼容服务）状态存储
+
+    令牌桶使用 WATCH/MULTI 乐观事务而不是Lua脚本，兼容不支持脚本的Redis兼容服务。
+    client可以是任意实现了redis-py接口的对象，便于用本地替身测试。
+    """
+
+    def __init__(self, client, prefix: str = "qyweixin:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisStateStore":
+        """从redis://地址创建"""
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("Redis状态存储需要安装redis: pip install redis")
+        return cls(redis.Redis.from_url(url))
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}{namespace}:{key}"
+
+    def get(self, namespace, key):
+        value = self.client.get(self._key(namespace, key))
+        return json.loads(value) if value is not None else None
+
+    def set(self, namespace, key, value, ttl=None):
+        self.client.set(self._key(namespace, key), json.dumps(value, ensure_ascii=False),
+                        px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, namespace, key):
+        self.client.delete(self._key(namespace, key))
+
+    def add(self, namespace, key, value, ttl=None):
+        return bool(self.client.set(self._key(namespace, key), json.dumps(value, ensure_ascii=False),
+                                    px=int(ttl * 1000) if ttl else None, nx=True))
+
+    def take_token(self, bucket, rate, capacity):
+        import redis
+        key = f"{self.prefix}bucket:{bucket}"
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    state = pipe.hmget(key, "tokens", "updated")
+                    now = time.time()
+                    if state[0] is None:
+                        tokens = capacity
+                    else:
+                        tokens = _refill(float(state[0]), float(state[1]), now, rate, capacity)
+                    wait_time = 0.0
+                    if tokens >= 1:
+                        tokens -= 1
+                    else:
+                        wait_time = (1 - tokens) / rate
+                    pipe.multi()
+                    pipe.hset(key, mapping={"tokens": tokens, "updated": now})
+                    # 桶闲置到补满后即可丢弃
+                    pipe.expire(key, max(1, int(capacity / rate) + 1))
+                    pipe.execute()
+                    return wait_time
+                except redis.WatchError:
+                    continue
+
+    def outbox_put(self, item, due=0):
+        item_id = self.client.incr(f"{self.prefix}outbox:seq")
+        pipe = self.client.pipeline()
+        pipe.hset(f"{self.prefix}outbox:items", item_id, json.dumps(item, ensure_ascii=False))
+        pipe.zadd(f"{self.prefix}outbox:due", {item_id: due})
+        pipe.execute()
+        return item_id
+
+    def outbox_due(self, now, limit=100):
+        entries = self.client.zrangebyscore(f"{self.prefix}outbox:due", "-inf", now,
+                                            start=0, num=limit, withscores=True)
+        if not entries:
+            return []
+        items = self.client.hmget(f"{self.prefix}outbox:items", [item_id for item_id, _ in entries])
+        return [(int(item_id), due, json.loads(item))
+                for (item_id, due), item in zip(entries, items) if item is not None]
+
+    def outbox_next_due(self):
+        first = self.client.zrange(f"{self.prefix}outbox:due", 0, 0, withscores=True)
+        return first[0][1] if first else None
+
+    def outbox_remove(self, item_id):
+        # ZREM只有一个进程能成功，作为认领标记
+        if not self.client.zrem(f"{self.prefix}outbox:due", item_id):
+            return False
+        self.client.hdel(f"{self.prefix}outbox:items", item_id)
+        return True
+
+    def outbox_count(self):
+        return self.client.zcard(f"{self.prefix}outbox:due")
+
+
+def create_state_store(url: str) -> StateStore:
+    """根据地址创建状态存储"""
+    if url.startswith("memory://"):
+        return MemoryStateStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteStateStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStateStore.from_url(url)
+    raise ValueError(f"不支持的状态存储地址: {url}")
+
+
+_store = None
+_store_url = STATE_URL
+_store_lock = threading.Lock()
+
+
+def configure_state_store(url: str):
+    """指定状态存储地址，下次获取时按新地址创建（多进程模式在fork前调用）"""
+    global _store, _store_url
+    with _store_lock:
+        _store = None
+        _store_url = url
+
+
+def get_state_store_url() -> str:
+    """当前状态存储地址"""
+    return _store_url
+
+
+def get_state_store() -> StateStore:
+    """获取全局状态存储，首次调用时根据QYWEIXIN_STATE_URL创建"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_state_store(_store_url)
+    return _store
@@ -0,0 +1,113 @@
+import os
+import signal
+import socket
+import tempfile
+import time
+import logging
+from typing import Callable, Dict
+from config import KEY
+from rate_limiter import key_id
+from state_store import configure_state_store, get_state_store_url
+
+logger = logging.getLogger("mcp")
+
+# 工作进程异常退出后重启前的等待时间（秒）
+RESTART_DELAY = 1.0
+
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    """在主进程中创建监听套接字，由所有工作进程共享accept"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _ensure_shared_state():
+    """
+    多进程共享发送配额需要进程间共享的状态存储；
+    仍是默认的内存存储时改用临时目录下的SQLite文件
+    """
+    if get_state_store_url().startswith("memory://"):
+        path = os.path.join(tempfile.gettempdir(), f"qyweixin_state_{key_id(KEY)}.db")
+        logger.warning(f"多进程模式下内存状态存储无法共享，改用 sqlite:///{path}")
+        configure_state_store(f"sqlite:///{path}")
+
+
+def _serve(sock: socket.socket, app_factory: Callable):
+    """工作进程：在共享套接字上运行ASGI应用"""
+    import uvicorn
+
+    config = uvicorn.Config(app_factory(), log_level="error", lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def run_workers(app_factory: Callable, host: str, port: int, workers: int):
+    """
+    启动N个工作进程共享同一个监听端口，主进程负责监控和重启
+
+    每个工作进程在fork之后才创建ASGI应用和状态存储连接；令牌桶保存在共享的状态存储中，
+    所有进程合计仍遵守每个机器人的发送频率限制。
+
+    Args:
+        app_factory: 创建ASGI应用的函数，在工作进程中调用
+        host: 监听地址
+        port: 监听端口
+        workers: 工作进程数
+    """
+    if not hasattr(os, "fork"):
+        raise RuntimeError("多进程模式需要支持fork的操作系统")
+    if workers < 1:
+        raise ValueError("工作进程数必须大于0")
+
+    _ensure_shared_state()
+    sock = _bind_socket(host, port)
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def _spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                _serve(sock, app_factory)
+            except BaseException:
+                logger.exception(f"工作进程 {index} 异常退出")
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = index
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    logger.info(f"🚀 启动 {workers} 个工作进程，监听 {host}:{port}")
+    for index in range(workers):
+        _spawn(index)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is not None and not stopping:
+            logger.warning(f"工作进程 {index} (pid={pid}) 退出，状态 {status}，{RESTART_DELAY}秒后重启")
+            time.sleep(RESTART_DELAY)
+            _spawn(index)
+
+    sock.close()
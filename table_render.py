@@ -0,0 +1,175 @@
+import csv
+import os
+from typing import Dict, Any, List, Iterable, Iterator, Optional, Tuple, Union
+from config import MAX_MARKDOWN_LENGTH
+
+# 标题后缀（如 " (2/5)"）预留的字节数
+_TITLE_SUFFIX_RESERVE = 16
+
+
+class Column:
+    """表格列定义"""
+
+    def __init__(self, key: Union[str, int], title: Optional[str] = None, fmt: Optional[str] = None,
+                 align: Optional[str] = None, max_width: Optional[int] = None):
+        self.key = key
+        self.title = title if title is not None else str(key)
+        self.fmt = fmt
+        self.align = align
+        self.max_width = max_width
+
+    @classmethod
+    def from_spec(cls, spec: Union[str, Dict[str, Any]]) -> "Column":
+        """从列名或 {key, title, format, align, max_width} 字典创建列定义"""
+        if isinstance(spec, str):
+            return cls(spec)
+        if "key" not in spec:
+            raise ValueError("列定义必须包含key")
+        align = spec.get("align")
+        if align not in (None, "left", "right", "center"):
+            raise ValueError("align必须是left、right或center")
+        return cls(spec["key"], spec.get("title"), spec.get("format"), align, spec.get("max_width"))
+
+
+def iter_delimited_file(file_path: str, delimiter: Optional[str] = None) -> Tuple[List[str], Iterator[Dict[str, str]]]:
+    """
+    流式读取CSV/TSV文件，返回表头和逐行生成的字典
+
+    未指定分隔符时，.tsv/.tab文件使用制表符，其他使用逗号。
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"文件不存在: {file_path}")
+    if delimiter is None:
+        delimiter = "\t" if os.path.splitext(file_path)[1].lower() in (".tsv", ".tab") else ","
+
+    f = open(file_path, 'r', encoding='utf-8-sig', newline='')
+    reader = csv.reader(f, delimiter=delimiter)
+    header = next(reader, None)
+    if not header:
+        f.close()
+        raise ValueError(f"文件为空或缺少表头: {file_path}")
+
+    def _rows():
+        with f:
+            for row in reader:
+                if row:
+                    yield dict(zip(header, row))
+
+    return header, _rows()
+
+
+def format_cell(value: Any, column: Column, max_width: int) -> str:
+    """格式化单元格：数字格式化、转义竖线和换行、按宽度截断"""
+    if value is None:
+        text = ""
+    elif column.fmt and isinstance(value, str):
+        try:
+            number = int(value) if value.strip().lstrip("-").isdigit() else float(value)
+            text = format(number, column.fmt)
+        except ValueError:
+            text = value
+    elif column.fmt and isinstance(value, (int, float)) and not isinstance(value, bool):
+        text = format(value, column.fmt)
+    elif isinstance(value, float):
+        text = f"{value:.2f}"
+    else:
+        text = str(value)
+
+    text = text.replace("|", "\\|").replace("\r", " ").replace("\n", " ")
+    width = column.max_width or max_width
+    if len(text) > width:
+        text = text[:max(1, width - 1)] + "…"
+    return text
+
+
+def _align_marker(column: Column, sample: Any) -> str:
+    """生成表头分隔行的对齐标记，数字列默认右对齐"""
+    align = column.align
+    if align is None:
+        numeric = column.fmt or (isinstance(sample, (int, float)) and not isinstance(sample, bool))
+        align = "right" if numeric else "left"
+    return {"left": ":---", "right": "---:", "center": ":---:"}[align]
+
+
+def _row_value(row: Any, column: Column, index: int) -> Any:
+    """按列定义取值，行可以是字典或列表"""
+    if isinstance(row, dict):
+        return row.get(column.key)
+    if isinstance(row, (list, tuple)):
+        position = column.key if isinstance(column.key, int) else index
+        return row[position] if position < len(row) else None
+    raise ValueError("表格行必须是字典或列表")
+
+
+def render_table_pages(columns: List[Column], rows: Iterable[Any], title: Optional[str] = None,
+                       budget: int = MAX_MARKDOWN_LENGTH, max_pages: int = 5,
+                       max_width: int = 30) -> Tuple[List[str], bool]:
+    """
+    把表格行渲染为若干条不超过budget字节的Markdown表格，每页重复表头
+
+    行是逐条消费的，最多保留max_pages页；超出时停止读取。
+
+    Returns:
+        Tuple[List[str], bool]: 页面列表，以及是否已完整渲染所有行
+    """
+    if not columns:
+        raise ValueError("表格至少需要一列")
+
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        raise ValueError("表格行不能为空")
+
+    header = "| " + " | ".join(format_cell(c.title, Column(c.key), max_width) for c in columns) + " |\n"
+    separator = "| " + " | ".join(
+        _align_marker(c, _row_value(first, c, i)) for i, c in enumerate(columns)) + " |\n"
+    title_line = f"**{title}**\n\n" if title else ""
+    prefix_size = len((title_line + header + separator).encode('utf-8')) + (_TITLE_SUFFIX_RESERVE if title else 0)
+    if prefix_size >= budget:
+        raise ValueError("表头已超出消息长度限制")
+
+    bodies = []
+    current = []
+    current_size = prefix_size
+
+    def _lines():
+        yield first
+        yield from rows
+
+    for row in _lines():
+        line = "| " + " | ".join(
+            format_cell(_row_value(row, c, i), c, max_width) for i, c in enumerate(columns)) + " |\n"
+        size = len(line.encode('utf-8'))
+        if prefix_size + size > budget:
+            raise ValueError("单行内容超出消息长度限制，请减小max_width")
+        if current_size + size > budget:
+            bodies.append("".join(current))
+            if len(bodies) >= max_pages:
+                return _assemble(bodies, title, header, separator), False
+            current = []
+            current_size = prefix_size
+        current.append(line)
+        current_size += size
+    bodies.append("".join(current))
+    return _assemble(bodies, title, header, separator), True
+
+
+def _assemble(bodies: List[str], title: Optional[str], header: str, separator: str) -> List[str]:
+    """为每页加上标题和表头"""
+    pages = []
+    for i, body in enumerate(bodies):
+        title_line = ""
+        if title:
+            suffix = f" ({i + 1}/{len(bodies)})" if len(bodies) > 1 else ""
+            title_line = f"**{title}**{suffix}\n\n"
+        pages.append(title_line + header + separator + body)
+    return pages
+
+
+def write_csv(file_path: str, columns: List[Column], rows: Iterable[Any]):
+    """把表格行写入CSV文件，用于超出消息数量时以文件形式发送"""
+    with open(file_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([c.title for c in columns])
+        for row in rows:
+            writer.writerow([_row_value(row, c, i) for i, c in enumerate(columns)])
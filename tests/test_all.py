@@ -57,8 +57,26 @@ def main():
         ("test_markdown.py", "Markdown消息测试"),
         ("test_markdown_v2.py", "Markdown_v2消息测试"),
         ("test_image.py", "图片消息测试"),
+        ("test_file.py", "文件消息辅助功能测试"),
         ("test_news.py", "图文消息测试"),
         ("test_template_card.py", "模板卡片消息测试"),
+        ("test_state_store.py", "状态存储后端测试"),
+        ("test_supervisor.py", "多进程工作模式测试"),
+        ("test_scheduler.py", "发送优先级调度测试"),
+        ("test_scheduled_delivery.py", "定时发送测试"),
+        ("test_idempotency.py", "幂等键测试"),
+        ("test_tracing.py", "链路追踪测试"),
+        ("test_profiling.py", "运行时性能分析测试"),
+        ("test_robot_pool.py", "机器人池测试"),
+        ("test_rate_limiter.py", "自适应发送频率测试"),
+        ("test_hedging.py", "对冲发送测试"),
+        ("test_payload_budget.py", "载荷内存预算测试"),
+        ("test_message_body.py", "图片请求体编码测试"),
+        ("test_blob_store.py", "暂存blob测试"),
+        ("test_voice_transcode.py", "语音转码测试"),
+        ("test_image_probe.py", "远程图片探测测试"),
+        ("test_qyweixin_bot.py", "客户端库测试"),
+        ("test_qyweixin_cli.py", "命令行批量发送测试"),
         ("test_utils.py", "工具函数测试"),
     ]
     
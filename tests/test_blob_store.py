@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+测试暂存blob和文件引用解析（离线）
+"""
+
+import base64
+import os
+import tempfile
+import time
+from test_utils import TestUtils
+
+from blob_store import BlobStore, resolve_path, blob_store
+from message_tools import qyweixin_stage_blob, qyweixin_delete_blob
+
+
+def test_put_append_expire():
+    """测试写入、分块追加、大小上限和过期清理"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = BlobStore(tmp, ttl=60, max_size=10)
+        info = store.put(b"hello", "a.txt")
+        assert info["name"] == "a.txt" and info["size"] == 5
+        assert info["ref"] == "blob:" + info["blob_id"]
+        assert store.append(info["uri"], b"12345") == 10
+        try:
+            store.append(info["ref"], b"x")
+            assert False, "超过上限时应报错"
+        except ValueError as e:
+            assert "超出限制" in str(e)
+        with open(store.path(info["blob_id"]), 'rb') as f:
+            assert f.read() == b"hello12345"
+        
+        # 最后一次写入超过有效期后不可用，并被清理
+        path = store.path(info["ref"])
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        other = store.put(b"x", "b.txt")
+        os.utime(store.path(other["ref"]), (time.time() - 120, time.time() - 120))
+        store.cleanup(force=True)
+        assert os.listdir(tmp) == []
+        try:
+            store.path(info["ref"])
+            assert False, "过期的blob应不可用"
+        except ValueError as e:
+            assert "不存在或已过期" in str(e)
+    return True
+
+
+def test_reference_validation():
+    """测试引用解析和非法引用"""
+    assert resolve_path("/dev/shm/a.png") == "/dev/shm/a.png"
+    assert resolve_path("file:///tmp/a%20b.png") == "/tmp/a b.png"
+    for ref in ["blob:../../etc/passwd", "blob:", "qyweixin://blobs/ABC", "blob:" + "0" * 31]:
+        try:
+            resolve_path(ref)
+            assert False, f"应拒绝: {ref}"
+        except ValueError as e:
+            assert "无效的暂存blob引用" in str(e)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ["", "..", "/"]:
+            try:
+                BlobStore(tmp).create(name)
+                assert False, f"应拒绝文件名: {name!r}"
+            except ValueError:
+                pass
+    return True
+
+
+def test_stage_tool():
+    """测试分块暂存后按引用解析为文件"""
+    data = os.urandom(5000)
+    info = qyweixin_stage_blob(base64.b64encode(data[:3000]).decode('ascii'), "report.png")
+    try:
+        info = qyweixin_stage_blob(base64.b64encode(data[3000:]).decode('ascii'), blob_id=info["ref"])
+        assert info["size"] == 5000 and info["name"] == "report.png"
+        for ref in (info["ref"], info["uri"]):
+            path = resolve_path(ref)
+            assert os.path.basename(path) == "report.png"
+            with open(path, 'rb') as f:
+                assert f.read() == data
+        try:
+            qyweixin_stage_blob("not base64!", blob_id=info["ref"])
+            assert False, "无效的base64应报错"
+        except ValueError as e:
+            assert "base64" in str(e)
+    finally:
+        assert qyweixin_delete_blob(info["ref"])["errcode"] == 0
+    try:
+        blob_store.path(info["ref"])
+        assert False, "删除后应不可用"
+    except ValueError:
+        pass
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+    
+    # 测试用例
+    test_cases = [
+        ("写入、追加和过期", test_put_append_expire),
+        ("引用校验", test_reference_validation),
+        ("分块暂存工具", test_stage_tool),
+    ]
+    
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+    
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+    
+    print(f"📊 测试结果: {passed}/{total} 通过")
+    
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+测试 File 消息类型相关的辅助功能
+"""
+
+import gzip
+import os
+import tempfile
+import uuid
+from test_utils import TestUtils
+
+
+def test_split_compressed_volumes():
+    """测试大文件流式压缩分卷，拼接后可完整还原（离线）"""
+    from file_volumes import split_compressed_volumes
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, "bundle.log")
+        content = os.urandom(300 * 1024)
+        with open(source, 'wb') as f:
+            f.write(content)
+        output_dir = os.path.join(temp_dir, "volumes")
+        os.mkdir(output_dir)
+        
+        info = split_compressed_volumes(source, output_dir, "gzip", volume_size=100 * 1024)
+        volumes = info["volumes"]
+        
+        assert len(volumes) == 4
+        assert [os.path.basename(v["path"]) for v in volumes][0] == "bundle.log.gz.001"
+        assert all(v["size"] <= 100 * 1024 for v in volumes)
+        
+        data = b"".join(open(v["path"], 'rb').read() for v in volumes)
+        assert gzip.decompress(data) == content
+    return True
+
+
+def test_single_volume_manifest():
+    """测试只有一卷时去掉序号后缀并生成清单（离线）"""
+    from file_volumes import split_compressed_volumes, build_volume_manifest
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, "export.csv")
+        with open(source, 'w', encoding='utf-8') as f:
+            f.write("id,value\n" * 10000)
+        
+        info = split_compressed_volumes(source, temp_dir, "gzip")
+        manifest = build_volume_manifest(info)
+    
+    assert len(info["volumes"]) == 1
+    assert info["volumes"][0]["path"].endswith("export.csv.gz")
+    assert "gunzip export.csv.gz" in manifest and "cat " not in manifest
+    return True
+
+
+def test_media_cache_and_bundle():
+    """测试media_id缓存和小文件打包的确定性（离线）"""
+    from message_tools import _resolve_files, _bundle_files
+    from utils import file_sha256, cache_media_id, get_cached_media_id
+    from qyweixin_bot import QyWeixinBot
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name in ("b.csv", "a.csv"):
+            with open(os.path.join(temp_dir, name), 'w', encoding='utf-8') as f:
+                f.write(name * 100)
+        files = _resolve_files(os.path.join(temp_dir, "*.csv"), False)
+        assert [os.path.basename(p) for p in files] == ["a.csv", "b.csv"]
+        
+        first = file_sha256(_bundle_files(files, os.path.join(temp_dir, "1.zip")))
+        second = file_sha256(_bundle_files(files, os.path.join(temp_dir, "2.zip")))
+        assert first == second
+        
+        with QyWeixinBot(uuid.uuid4().hex) as bot, bot.activate():
+            assert get_cached_media_id(first, "bundle.zip", "file") is None
+            cache_media_id(first, "bundle.zip", "file", "MEDIA_ID", bot.pool.primary)
+            assert get_cached_media_id(first, "bundle.zip", "file") == "MEDIA_ID"
+            assert get_cached_media_id(first, "other.zip", "file") is None
+        # 其他key的客户端不会复用该media_id
+        with QyWeixinBot(uuid.uuid4().hex) as other, other.activate():
+            assert get_cached_media_id(first, "bundle.zip", "file") is None
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+    
+    # 测试用例
+    test_cases = [
+        ("大文件压缩分卷", test_split_compressed_volumes),
+        ("单卷清单", test_single_volume_manifest),
+        ("media_id缓存和打包", test_media_cache_and_bundle),
+    ]
+    
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+    
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+    
+    print(f"📊 测试结果: {passed}/{total} 通过")
+    
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+测试对冲发送（离线）
+"""
+
+import threading
+import time
+import uuid
+import requests
+from test_utils import TestUtils
+
+from config import HEDGE_MIN_SAMPLES
+from webhook_client import WebhookClient
+
+
+class _Response:
+    """模拟requests的响应"""
+
+    status_code = 200
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class _FakeSession:
+    """
+    模拟连接池：connect_delay秒后开始写入请求体（模拟建立连接），写入后再等response_delay秒返回
+
+    记录发起请求的次数和实际写入请求体（服务端收到完整消息）的次数。
+    """
+
+    def __init__(self, name, connect_delay=0.0, response_delay=0.0, error=None):
+        self.name = name
+        self.connect_delay = connect_delay
+        self.response_delay = response_delay
+        self.error = error
+        self.calls = 0
+        self.written = 0
+        self.lock = threading.Lock()
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.connect_delay)
+        if self.error is not None:
+            raise self.error
+        if hasattr(data, "read"):
+            data.read()
+        with self.lock:
+            self.written += 1
+        time.sleep(self.response_delay)
+        return _Response({"errcode": 0, "errmsg": "ok", "via": self.name})
+
+    def close(self):
+        pass
+
+
+class _OneTokenLimiter:
+    """只有一个令牌的限流器：发送队列取走后，对冲请求拿不到令牌"""
+
+    def __init__(self):
+        self.tokens = 1
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        with self.lock:
+            if self.tokens > 0:
+                self.tokens -= 1
+                return 0.0
+            return 60.0
+
+    def record_success(self):
+        pass
+
+
+def _client(primary, hedge, hedge_delay=0.05):
+    """创建开启对冲的客户端，延迟样本使对冲等待时间为hedge_delay秒"""
+    client = WebhookClient(uuid.uuid4().hex, hedge=True, retries=0)
+    client.session, client.hedge_session = primary, hedge
+    client._latencies.extend([hedge_delay] * HEDGE_MIN_SAMPLES)
+    return client
+
+
+def _text(content):
+    return {"msgtype": "text", "text": {"content": content}}
+
+
+def test_primary_wins():
+    """测试主请求在对冲等待时间内完成时不发对冲请求"""
+    primary, hedge = _FakeSession("primary", connect_delay=0.01), _FakeSession("hedge")
+    with _client(primary, hedge, hedge_delay=0.5) as client:
+        assert client.send(_text("fast"))["via"] == "primary"
+    assert primary.calls == 1 and hedge.calls == 0
+    return True
+
+
+def test_hedge_fires_after_delay():
+    """测试主请求卡在建立连接时发出对冲请求，取对冲结果，主请求随后放弃写入，消息只投递一次"""
+    primary, hedge = _FakeSession("primary", connect_delay=0.3), _FakeSession("hedge", connect_delay=0.01)
+    with _client(primary, hedge) as client:
+        assert client.hedge_delay() == 0.05
+        start = time.monotonic()
+        assert client.send(_text("slow"), client_msg_id="hedged")["via"] == "hedge"
+        elapsed = time.monotonic() - start
+        assert 0.05 <= elapsed < 0.3
+        # 同一client_msg_id再次发送时直接返回首次结果
+        assert client.send(_text("slow"), client_msg_id="hedged")["via"] == "hedge"
+        time.sleep(0.4)
+    assert primary.calls == 1 and hedge.calls == 1
+    assert primary.written == 0 and hedge.written == 1
+    return True
+
+
+def test_no_hedge_after_primary_written():
+    """测试主请求已写入请求体、只是响应慢时不发对冲请求，避免重复投递"""
+    primary = _FakeSession("primary", response_delay=0.3)
+    hedge = _FakeSession("hedge")
+    with _client(primary, hedge) as client:
+        start = time.monotonic()
+        assert client.send(_text("written"))["via"] == "primary"
+        assert time.monotonic() - start >= 0.3
+    assert primary.written == 1 and hedge.calls == 0
+    return True
+
+
+def test_primary_fails_hedge_succeeds():
+    """测试对冲请求发出后主请求失败，返回对冲请求的结果"""
+    primary = _FakeSession("primary", connect_delay=0.2, error=requests.exceptions.ConnectionError("reset"))
+    hedge = _FakeSession("hedge", connect_delay=0.4)
+    with _client(primary, hedge) as client:
+        assert client.send(_text("flaky"))["via"] == "hedge"
+    assert primary.calls == 1 and hedge.calls == 1
+    return True
+
+
+def test_no_hedge_without_token():
+    """测试机器人没有空闲令牌时不发对冲请求，只等待主请求"""
+    primary, hedge = _FakeSession("primary", connect_delay=0.3), _FakeSession("hedge")
+    with _client(primary, hedge) as client:
+        robot = client.pool.primary
+        robot.limiter = robot.scheduler.limiter = _OneTokenLimiter()
+        assert client.send(_text("quota"))["via"] == "primary"
+    assert primary.calls == 1 and hedge.calls == 0
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+
+    # 测试用例
+    test_cases = [
+        ("主请求先完成", test_primary_wins),
+        ("超时后发出对冲请求", test_hedge_fires_after_delay),
+        ("主请求已写入时不对冲", test_no_hedge_after_primary_written),
+        ("主请求失败时使用对冲结果", test_primary_fails_hedge_succeeds),
+        ("没有令牌时不对冲", test_no_hedge_without_token),
+    ]
+
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+
+    print(f"📊 测试结果: {passed}/{total} 通过")
+
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
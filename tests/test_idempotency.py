@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+测试工具调用幂等键（离线）
+"""
+
+import threading
+import time
+from test_utils import TestUtils
+
+import idempotency
+from state_store import configure_state_store, MemoryStateStore
+from idempotency import run_idempotent, next_message_id
+
+
+class _Counter:
+    """记录调用次数的工具函数"""
+    
+    def __init__(self, result=None, error=None, delay=0):
+        self.calls = 0
+        self.result = result if result is not None else {"errcode": 0, "errmsg": "ok"}
+        self.error = error
+        self.delay = delay
+    
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return {**self.result, "call": self.calls}
+
+
+def test_replay_same_key():
+    """测试相同幂等键直接返回首次结果"""
+    configure_state_store("memory://")
+    fn = _Counter()
+    first = run_idempotent("key-1", "qyweixin_text", {"content": "hi"}, fn)
+    second = run_idempotent("key-1", "qyweixin_text", {"content": "hi"}, fn)
+    assert first == second and fn.calls == 1
+    
+    # 不同工具的幂等键互不影响，没有幂等键时每次都执行
+    run_idempotent("key-1", "qyweixin_markdown", {"content": "hi"}, fn)
+    run_idempotent(None, "qyweixin_text", {"content": "hi"}, fn)
+    assert fn.calls == 3
+    
+    try:
+        run_idempotent("key-1", "qyweixin_text", {"content": "other"}, fn)
+        assert False, "相同幂等键用于不同参数时应报错"
+    except ValueError:
+        pass
+    return True
+
+
+def test_failure_allows_retry():
+    """测试异常和非零errcode不记录结果，可以用同一个幂等键重试"""
+    configure_state_store("memory://")
+    failing = _Counter(error=RuntimeError("timeout"))
+    try:
+        run_idempotent("key-2", "qyweixin_text", {"content": "hi"}, failing)
+        assert False
+    except RuntimeError:
+        pass
+    
+    limited = _Counter(result={"errcode": 45009, "errmsg": "api freq out of limit"})
+    assert run_idempotent("key-2", "qyweixin_text", {"content": "hi"}, limited)["errcode"] == 45009
+    
+    ok = _Counter()
+    assert run_idempotent("key-2", "qyweixin_text", {"content": "hi"}, ok)["errcode"] == 0
+    assert run_idempotent("key-2", "qyweixin_text", {"content": "hi"}, ok)["call"] == 1
+    return True
+
+
+def test_concurrent_duplicate_waits():
+    """测试首次调用处理中时重复调用等待其结果"""
+    configure_state_store("memory://")
+    fn = _Counter(delay=0.3)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        run_idempotent("key-3", "qyweixin_text", {"content": "hi"}, fn))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert fn.calls == 1 and len(results) == 3 and all(r == results[0] for r in results)
+    return True
+
+
+def test_pending_refreshed_during_long_call():
+    """测试调用时间超过处理中标记的TTL时，标记被刷新，重试仍等待首次调用的结果"""
+    configure_state_store("memory://")
+    original = idempotency.IDEMPOTENCY_PENDING_TTL
+    idempotency.IDEMPOTENCY_PENDING_TTL = 0.3
+    try:
+        fn = _Counter(delay=1.0)
+        results = []
+        first = threading.Thread(target=lambda: results.append(
+            run_idempotent("key-6", "qyweixin_text", {"content": "hi"}, fn)))
+        first.start()
+        time.sleep(0.6)
+        results.append(run_idempotent("key-6", "qyweixin_text", {"content": "hi"}, fn))
+        first.join(5)
+    finally:
+        idempotency.IDEMPOTENCY_PENDING_TTL = original
+    assert fn.calls == 1 and len(results) == 2 and results[0] == results[1]
+    return True
+
+
+def test_message_ids():
+    """测试幂等调用中按顺序生成确定的消息ID"""
+    configure_state_store("memory://")
+    assert next_message_id() is None
+    
+    ids = []
+    def _send_two():
+        ids.extend([next_message_id(), next_message_id()])
+        raise RuntimeError("second page failed")
+    for _ in range(2):
+        try:
+            run_idempotent("key-4", "qyweixin_news_bulk", {}, _send_two)
+        except RuntimeError:
+            pass
+    assert ids[:2] == ids[2:] and ids[0] != ids[1]
+    assert next_message_id() is None
+    return True
+
+
+def test_memory_store_bounded():
+    """测试内存状态存储超出上限时淘汰可过期的键"""
+    store = MemoryStateStore(max_keys=100)
+    store.set("schedule", "keep", 1)
+    for i in range(500):
+        store.set("idempotency", str(i), i, ttl=60)
+    assert len(store._data) <= 100
+    assert store.get("schedule", "keep") == 1 and store.get("idempotency", "499") == 499
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+    
+    # 测试用例
+    test_cases = [
+        ("相同幂等键返回首次结果", test_replay_same_key),
+        ("失败后允许重试", test_failure_allows_retry),
+        ("并发重复调用", test_concurrent_duplicate_waits),
+        ("长时间调用刷新处理中标记", test_pending_refreshed_during_long_call),
+        ("消息ID", test_message_ids),
+        ("内存存储上限", test_memory_store_bounded),
+    ]
+    
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+    
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+    
+    print(f"📊 测试结果: {passed}/{total} 通过")
+    
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
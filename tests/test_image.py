@@ -104,6 +104,39 @@ def test_base64_image():
     return result["success"]
 
 
+def test_chart_downsample_and_render():
+    """测试图表降采样和内存渲染（离线，需要numpy和matplotlib）"""
+    try:
+        import numpy as np
+        import matplotlib  # noqa: F401
+    except ImportError:
+        print("⚠️ 未安装numpy或matplotlib，跳过图表测试")
+        return True
+    from chart_render import lttb_downsample, bucket_downsample, render_chart
+    from config import MAX_IMAGE_SIZE
+    
+    x = np.arange(100000, dtype=float)
+    y = np.sin(x / 1000)
+    y[54321] = 50  # 尖峰必须被保留
+    xs, ys = lttb_downsample(x, y, 500)
+    
+    assert len(xs) == 500 and xs[0] == 0 and xs[-1] == 99999
+    assert 50 in ys
+    
+    png = render_chart([{"name": "sin", "y": y.tolist()}], title="test")
+    assert png.startswith(b"\x89PNG") and len(png) <= MAX_IMAGE_SIZE
+    
+    # 柱状图合并相邻数据，尾部的数据也参与计算
+    bars = np.ones(2500)
+    bars[-5:] = 1001
+    bx, by, width = bucket_downsample(np.arange(2500), bars, 1000)
+    assert len(bx) == 1000 and by[-1] > 1 and (by[:-3] == 1).all()
+    assert bx[0] < 2 and bx[-1] > 2496 and 0 < width < 3
+    png = render_chart([{"y": bars.tolist()}], chart_type="bar")
+    assert png.startswith(b"\x89PNG")
+    return True
+
+
 def main():
     """主测试函数"""
     utils = TestUtils()
@@ -117,6 +150,7 @@ def main():
         ("从URL发送图片", test_image_from_url),
         ("发送小尺寸图片", test_small_image),
         ("发送Base64编码图片", test_base64_image),
+        ("图表降采样和渲染", test_chart_downsample_and_render),
     ]
     
     results = []
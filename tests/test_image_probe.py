@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+测试远程图片文件头探测和模板卡片宽高比检查（离线）
+"""
+
+import struct
+import uuid
+from test_utils import TestUtils, FakeWebhook
+
+import message_tools
+from qyweixin_bot import QyWeixinBot
+from image_probe import parse_image_size, probe_image, probe_images
+
+_PADDING = bytes(200 * 1024)
+
+IMAGES = {
+    "/wide.png": b"\x89PNG\r\n\x1a\n\x00\x00\x00\x0dIHDR" + struct.pack(">II", 900, 400) + _PADDING,
+    "/square.gif": b"GIF89a" + struct.pack("<HH", 300, 300) + _PADDING,
+    # EXIF段较大，SOF段在第5个读取块之后
+    "/photo.jpg": (b"\xff\xd8" + b"\xff\xe1" + struct.pack(">H", 20000) + bytes(19998)
+                   + b"\xff\xc0" + struct.pack(">HBHHB", 17, 8, 480, 640, 3) + _PADDING),
+    "/lossy.webp": b"RIFF\x00\x00\x00\x00WEBPVP8 \x00\x00\x00\x00" + b"\x00\x00\x00\x9d\x01\x2a"
+                   + struct.pack("<HH", 320, 200) + _PADDING,
+    "/lossless.webp": b"RIFF\x00\x00\x00\x00WEBPVP8L\x00\x00\x00\x00\x2f"
+                      + struct.pack("<I", (160 - 1) | (100 - 1) << 14) + _PADDING,
+    "/extended.webp": b"RIFF\x00\x00\x00\x00WEBPVP8X\x0a\x00\x00\x00\x10\x00\x00\x00"
+                      + (1200 - 1).to_bytes(3, "little") + (600 - 1).to_bytes(3, "little") + _PADDING,
+    "/page.html": b"<html>" + bytes(100),
+}
+
+
+# 图片服务收到的 (路径, Range) 请求
+_requests = []
+
+
+def _serve_image(handler):
+    """按Range返回图片，/norange/前缀的路径忽略Range"""
+    path = handler.path
+    ignore_range = path.startswith("/norange/")
+    if ignore_range:
+        path = path[len("/norange"):]
+    _requests.append((handler.path, handler.headers.get("Range")))
+    data = IMAGES.get(path)
+    if data is None:
+        handler.reply(b"", status=404)
+        return
+    status = 200
+    if handler.headers.get("Range") and not ignore_range:
+        end = int(handler.headers["Range"].split("-")[1])
+        data, status = data[:end + 1], 206
+    handler.reply(data, status=status, content_type="application/octet-stream")
+
+
+def _start_server():
+    """本地图片服务，同时模拟企业微信webhook"""
+    _requests.clear()
+    return FakeWebhook(on_get=_serve_image)
+
+
+def test_parse_headers():
+    """测试解析PNG、JPEG、GIF和WebP文件头，文件头不完整时返回None"""
+    expected = {
+        "/wide.png": ("png", 900, 400),
+        "/square.gif": ("gif", 300, 300),
+        "/photo.jpg": ("jpeg", 640, 480),
+        "/lossy.webp": ("webp", 320, 200),
+        "/lossless.webp": ("webp", 160, 100),
+        "/extended.webp": ("webp", 1200, 600),
+    }
+    for path, size in expected.items():
+        assert parse_image_size(IMAGES[path][:64 * 1024]) == size, path
+    assert parse_image_size(IMAGES["/photo.jpg"][:8192]) is None
+    assert parse_image_size(IMAGES["/wide.png"][:16]) is None
+    try:
+        parse_image_size(IMAGES["/page.html"])
+        assert False, "非图片应报错"
+    except ValueError as e:
+        assert "不是PNG" in str(e)
+    return True
+
+
+def test_probe_over_http():
+    """测试只下载文件头、服务器忽略Range时提前断开、结果按URL缓存、错误的URL报告原因"""
+    server = _start_server()
+    base = server.base_url
+    try:
+        results = probe_images([f"{base}/wide.png", f"{base}/photo.jpg", f"{base}/extended.webp", f"{base}/wide.png"])
+        assert len(results) == 3
+        assert results[f"{base}/wide.png"]["width"] == 900
+        assert results[f"{base}/photo.jpg"]["height"] == 480
+        assert all(r["probed_bytes"] <= 64 * 1024 for r in results.values())
+        assert all(rng == "bytes=0-65535" for _, rng in _requests)
+
+        # 不支持Range的服务器：读到尺寸后立即停止
+        result = probe_image(f"{base}/norange/square.gif")
+        assert result["format"] == "gif" and result["probed_bytes"] < 64 * 1024
+
+        # 缓存命中时不再请求
+        count = len(_requests)
+        assert probe_image(f"{base}/photo.jpg")["width"] == 640
+        assert len(_requests) == count
+
+        assert "404" in probe_image(f"{base}/missing.png")["error"]
+        assert "不是PNG" in probe_image(f"{base}/page.html")["error"]
+    finally:
+        server.close()
+    return True
+
+
+def test_card_and_news_checks():
+    """测试卡片宽高比范围、未指定宽高比时按图片填写；picurl只在check_picurl时探测"""
+    server = _start_server()
+    base = server.base_url
+    try:
+        # 只有card_image必须是可用的图片，其他图片URL不探测
+        card = {"card_type": "news_notice", "card_image": {"url": f"{base}/wide.png"},
+                "source": {"icon_url": f"{base}/page.html"}}
+        message_tools._check_card_images(card)
+        # 900x400的宽高比2.25正好在上限
+        assert card["card_image"]["aspect_ratio"] == 2.25
+        assert all(not path.endswith("page.html") for path, _ in _requests)
+
+        card = {"card_type": "news_notice", "card_image": {"url": f"{base}/square.gif"}}
+        message_tools._check_card_images(card)
+        assert card["card_image"]["aspect_ratio"] == 1.3
+
+        try:
+            message_tools._check_card_images({"card_type": "news_notice",
+                                              "card_image": {"url": f"{base}/wide.png", "aspect_ratio": 3}})
+            assert False, "宽高比超出范围应报错"
+        except ValueError as e:
+            assert "1.3~2.25" in str(e)
+
+        try:
+            message_tools._check_card_images({"card_type": "news_notice", "card_image": {"url": f"{base}/missing.png"}})
+            assert False, "无效card_image应报错"
+        except ValueError as e:
+            assert "card_image" in str(e)
+
+        articles = [{"title": "t", "url": "https://example.com", "picurl": f"{base}/page.html"}]
+        with QyWeixinBot(uuid.uuid4().hex, base_url=base) as bot:
+            # 默认不探测picurl，图片站点不可用时仍然发送
+            assert bot.news(articles)["errcode"] == 0
+            assert bot.news_bulk(articles)["errcode"] == 0
+            assert all(not path.endswith("page.html") for path, _ in _requests)
+            try:
+                bot.news_bulk(articles, check_picurl=True)
+                assert False, "check_picurl时无效picurl应报错"
+            except ValueError as e:
+                assert "picurl" in str(e) and "page.html" in str(e)
+    finally:
+        server.close()
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+
+    # 测试用例
+    test_cases = [
+        ("解析图片文件头", test_parse_headers),
+        ("HTTP探测和缓存", test_probe_over_http),
+        ("卡片和图文检查", test_card_and_news_checks),
+    ]
+
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+
+    print(f"📊 测试结果: {passed}/{total} 通过")
+
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -124,6 +124,66 @@ def test_markdown_notification():
     return result["success"]
 
 
+REPORT_TEMPLATE = """# {{ title }}
+{% section summary priority=0 %}## 摘要
+{{ summary }}
+{% endsection %}{% section details priority=1 %}## 明细
+{% for row in rows %}- {{ row.name }}: {{ row.value }}
+{% endfor %}{% endsection %}"""
+
+
+def test_report_template_truncate():
+    """测试报告模板按优先级截断（离线）"""
+    from report_templates import compile_report_template
+    
+    rows = [{"name": f"指标{i}", "value": i} for i in range(500)]
+    pages = compile_report_template(REPORT_TEMPLATE).render(
+        {"title": "日报", "summary": "一切正常", "rows": rows}, budget=1024)
+    
+    assert len(pages) == 1
+    assert len(pages[0].encode('utf-8')) <= 1024
+    assert "一切正常" in pages[0] and "- 指标0: 0" in pages[0]
+    assert "已省略" in pages[0]
+    return True
+
+
+def test_report_template_omitted_count():
+    """测试截断时省略项数准确，放不下的分节不影响之后的分节（离线）"""
+    from report_templates import compile_report_template
+    
+    rows = [{"name": f"指标{i}", "value": i} for i in range(100)]
+    template = compile_report_template(REPORT_TEMPLATE)
+    for budget in range(60, 300, 7):
+        page = template.render({"title": "日报", "summary": "一切正常", "rows": rows}, budget=budget)[0]
+        assert len(page.encode('utf-8')) <= budget
+        if "## 明细" in page:
+            shown = page.count("- 指标")
+            assert f"已省略 {100 - shown} 项" in page, (budget, page)
+    
+    template = compile_report_template(
+        "# 日报\n{% section big priority=0 %}## 附件\n{{ blob }}\n{% endsection %}"
+        "{% section small priority=1 %}## 备注\n{% for n in notes %}- {{ n }}\n{% endfor %}{% endsection %}")
+    page = template.render({"blob": "x" * 500, "notes": ["a", "b"]}, budget=100)[0]
+    assert "## 附件" not in page and "- a\n- b\n" in page
+    assert "已省略" not in page
+    return True
+
+
+def test_report_template_paginate():
+    """测试报告模板分页后内容完整且顺序不变（离线）"""
+    from report_templates import compile_report_template
+    
+    rows = [{"name": f"指标{i}", "value": i} for i in range(500)]
+    pages = compile_report_template(REPORT_TEMPLATE).render(
+        {"title": "日报", "summary": "一切正常", "rows": rows}, budget=1024, overflow="paginate")
+    
+    assert all(len(page.encode('utf-8')) <= 1024 for page in pages)
+    text = "".join(pages)
+    assert text.index("- 指标0: 0") < text.index("- 指标499: 499")
+    assert text.count("- 指标") == 500
+    return True
+
+
 def main():
     """主测试函数"""
     utils = TestUtils()
@@ -138,6 +198,9 @@ def main():
         ("包含代码的Markdown消息", test_markdown_with_code),
         ("包含颜色的Markdown消息", test_markdown_with_color),
         ("通知类型Markdown消息", test_markdown_notification),
+        ("报告模板截断", test_report_template_truncate),
+        ("报告模板省略项数", test_report_template_omitted_count),
+        ("报告模板分页", test_report_template_paginate),
     ]
     
     results = []
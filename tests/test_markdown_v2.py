@@ -3,7 +3,10 @@
 测试 Markdown_v2 消息类型
 """
 
-from test_utils import TestUtils
+import base64
+import uuid
+from test_utils import TestUtils, FakeWebhook
+from qyweixin_bot import QyWeixinBot
 
 
 def test_simple_markdown_v2():
@@ -140,6 +143,83 @@ def test_pepper_report():
     return result["success"]
 
 
+def test_table_render_pages():
+    """测试表格渲染：数字格式化、转义、截断和分页（离线）"""
+    from table_render import Column, render_table_pages
+    
+    columns = [Column("name", "名称", max_width=8), Column("price", "价格", fmt=",.2f")]
+    rows = [{"name": f"商品|{i}" * 3, "price": 1234.5 + i} for i in range(300)]
+    pages, complete = render_table_pages(columns, rows, title="价格表", budget=1024, max_pages=50)
+    
+    assert complete and len(pages) > 1
+    assert all(len(page.encode('utf-8')) <= 1024 for page in pages)
+    assert all("| 名称 | 价格 |\n| :--- | ---: |" in page for page in pages)
+    assert "| 1,234.50 |" in pages[0] and "\\|" in pages[0] and "…" in pages[0]
+    assert pages[0].startswith(f"**价格表** (1/{len(pages)})")
+    return True
+
+
+def test_table_render_from_csv():
+    """测试从TSV文件流式渲染表格并在超出页数时停止（离线）"""
+    import os
+    import tempfile
+    from table_render import Column, iter_delimited_file, render_table_pages
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "data.tsv")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("city\tvalue\n")
+            for i in range(2000):
+                f.write(f"城市{i}\t{i}\n")
+        
+        header, rows = iter_delimited_file(path)
+        columns = [Column(name) for name in header]
+        pages, complete = render_table_pages(columns, rows, budget=1024, max_pages=2)
+        rows.close()
+    
+    assert header == ["city", "value"]
+    assert not complete and len(pages) == 2
+    return True
+
+
+def test_table_file_fallback_title():
+    """测试表格改为发送CSV文件时，标题中的路径分隔符不会影响文件名（离线）"""
+    webhook = FakeWebhook()
+    rows = [{"city": f"城市{i}", "value": i} for i in range(2000)]
+    try:
+        with QyWeixinBot(uuid.uuid4().hex, base_url=webhook.base_url) as bot:
+            for title in ("日报/华东", "../../x"):
+                assert bot.markdown_table(rows=rows, title=title, max_messages=1)["mode"] == "file"
+    finally:
+        webhook.close()
+    assert webhook.uploads == ["日报_华东.csv", "_.._x.csv"]
+    return True
+
+
+def test_table_file_fallback_large():
+    """测试暂存blob中的CSV按引用读取，改为发送文件时超过20MB的文件按分卷和清单发送（离线）"""
+    import message_tools
+    from message_tools import qyweixin_stage_blob, qyweixin_delete_blob
+
+    lines = ["city,value"] + [f"城市{i},{i}" for i in range(2000)]
+    data = "\n".join(lines).encode("utf-8")
+    blob = qyweixin_stage_blob(base64.b64encode(data).decode("ascii"), "daily.csv")
+    webhook = FakeWebhook()
+    original = message_tools.MAX_FILE_SIZE
+    message_tools.MAX_FILE_SIZE = len(data) // 2
+    try:
+        with QyWeixinBot(uuid.uuid4().hex, base_url=webhook.base_url) as bot:
+            result = bot.markdown_table(file_path=blob["ref"], max_messages=1)
+    finally:
+        message_tools.MAX_FILE_SIZE = original
+        webhook.close()
+        qyweixin_delete_blob(blob["ref"])
+    assert result["mode"] == "file" and len(result["volumes"]) == 1
+    assert webhook.uploads == [result["volumes"][0]["name"]]
+    assert [m["msgtype"] for m in webhook.messages()] == ["file", "markdown"]
+    return True
+
+
 def main():
     """主测试函数"""
     utils = TestUtils()
@@ -154,6 +234,10 @@ def main():
         ("表格Markdown_v2消息", test_table_markdown_v2),
         ("复杂Markdown_v2消息", test_complex_markdown_v2),
         ("辣椒价格报告", test_pepper_report),
+        ("表格渲染分页", test_table_render_pages),
+        ("CSV表格流式渲染", test_table_render_from_csv),
+        ("表格文件名", test_table_file_fallback_title),
+        ("大表格分卷发送", test_table_file_fallback_large),
     ]
     
     results = []
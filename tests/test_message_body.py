@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+测试预编码的图片消息请求体和base64校验（离线）
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+from test_utils import TestUtils
+
+from message_body import encode_image_message, encode_base64_image_message, iter_buffer, iter_file
+
+PNG_HEADER = b"\x89PNG\r\n\x1a\n"
+
+
+def _json_body(image_data):
+    """原来通过字典和json.dumps构造的请求体"""
+    data = {
+        "msgtype": "image",
+        "image": {
+            "base64": base64.b64encode(image_data).decode('utf-8'),
+            "md5": hashlib.md5(image_data).hexdigest()
+        }
+    }
+    return json.dumps(data, allow_nan=False).encode('utf-8')
+
+
+def test_body_matches_json():
+    """测试请求体与json.dumps的结果逐字节一致"""
+    for size in [0, 1, 2, 3, 1000, 196608, 196609, 2 * 1024 * 1024 - 1]:
+        image_data = os.urandom(size)
+        message = encode_image_message(iter_buffer(image_data), size)
+        assert bytes(message.body) == _json_body(image_data), f"大小{size}的请求体不一致"
+        assert message["image"]["md5"] == hashlib.md5(image_data).hexdigest()
+        assert bytes(encode_image_message(iter_file(io.BytesIO(image_data)), size).body) == bytes(message.body)
+    return True
+
+
+def test_unaligned_chunks():
+    """测试数据块长度不是3的倍数时余下的字节并入下一块"""
+    image_data = os.urandom(10000)
+    chunks = [image_data[:1001], image_data[1001:5000], image_data[5000:5002], image_data[5002:]]
+    message = encode_image_message(chunks, len(image_data))
+    assert bytes(message.body) == _json_body(image_data)
+    return True
+
+
+def test_length_mismatch():
+    """测试数据长度与声明的大小不一致时报错"""
+    for size in (99, 101):
+        try:
+            encode_image_message(iter_buffer(b"x" * 100), size)
+            assert False, "长度不一致时应报错"
+        except ValueError as e:
+            assert "图片数据" in str(e)
+    return True
+
+
+def test_base64_validation():
+    """测试调用方传入的base64：请求体一致、MD5核对，超限和损坏的数据在解码前后被拒绝"""
+    for size in [8, 9, 10, 196608 * 2 + 1]:
+        image_data = PNG_HEADER + os.urandom(size - len(PNG_HEADER))
+        image_base64 = base64.b64encode(image_data).decode('ascii')
+        message = encode_base64_image_message(image_base64, 1024 * 1024)
+        assert bytes(message.body) == _json_body(image_data)
+        assert message["image"]["format"] == "png" and message["image"]["size"] == size
+        md5 = hashlib.md5(image_data).hexdigest()
+        assert encode_base64_image_message(image_base64, 1024 * 1024, md5.upper())["image"]["md5"] == md5
+    
+    # BMP和WEBP同样支持，按76字符折行的base64去除换行后校验
+    for head, image_format in [(b"BM", "bmp"), (b"RIFF\x00\x00\x00\x00WEBPVP8 ", "webp")]:
+        image_data = head + os.urandom(300)
+        wrapped = base64.encodebytes(image_data).decode('ascii')
+        message = encode_base64_image_message(wrapped, 1024 * 1024)
+        assert bytes(message.body) == _json_body(image_data)
+        assert message["image"]["format"] == image_format and message["image"]["size"] == len(image_data)
+    
+    valid = base64.b64encode(PNG_HEADER + os.urandom(400000)).decode('ascii')
+    invalid_cases = [
+        ("", "长度"),
+        (valid[:-1], "长度"),
+        (valid[:1000] + "!" + valid[1001:], "非base64字符"),
+        (valid[:1000] + "中" + valid[1001:], "非base64字符"),
+        (valid[:1000] + "====" + valid[1004:], "填充"),
+        (valid[:-4] + "A===", "填充"),
+        (base64.b64encode(b"TIFF" + os.urandom(100)).decode('ascii'), "不是JPG、PNG、GIF、BMP或WEBP图片"),
+    ]
+    for image_base64, message in invalid_cases:
+        try:
+            encode_base64_image_message(image_base64, 1024 * 1024)
+            assert False, f"应拒绝: {message}"
+        except ValueError as e:
+            assert message in str(e), f"{message}: {e}"
+    # 超限的数据不做解码直接拒绝
+    try:
+        encode_base64_image_message(valid, 300000)
+        assert False, "超限时应报错"
+    except ValueError as e:
+        assert "超出限制" in str(e)
+    try:
+        encode_base64_image_message(valid, 1024 * 1024, "0" * 32)
+        assert False, "MD5不一致时应报错"
+    except ValueError as e:
+        assert "image_md5" in str(e)
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+    
+    # 测试用例
+    test_cases = [
+        ("与json.dumps一致", test_body_matches_json),
+        ("未对齐的数据块", test_unaligned_chunks),
+        ("长度不一致", test_length_mismatch),
+        ("base64校验", test_base64_validation),
+    ]
+    
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+    
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+    
+    print(f"📊 测试结果: {passed}/{total} 通过")
+    
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
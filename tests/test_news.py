@@ -132,6 +132,34 @@ def test_max_news():
     return result["success"]
 
 
+def test_bulk_news_pagination():
+    """测试批量图文消息分页（离线）"""
+    from message_tools import _paginate_articles
+    
+    articles = [{"title": f"第{i}篇", "url": f"https://example.com/{i}"} for i in range(1, 21)]
+    pages = _paginate_articles(articles)
+    
+    assert [len(page) for page in pages] == [8, 8, 4]
+    assert [a["title"] for page in pages for a in page] == [a["title"] for a in articles]
+    return True
+
+
+def test_bulk_news_validation():
+    """测试批量图文消息一次性校验所有文章（离线）"""
+    from message_tools import qyweixin_news_bulk
+    
+    articles = [{"title": f"第{i}篇", "url": f"https://example.com/{i}"} for i in range(1, 11)]
+    articles[2] = {"title": "缺少url"}
+    articles[9] = {"url": "https://example.com/no-title"}
+    
+    try:
+        qyweixin_news_bulk(articles)
+    except ValueError as e:
+        assert "[3, 10]" in str(e)
+        return True
+    raise AssertionError("缺少title或url的文章应被拒绝")
+
+
 def main():
     """主测试函数"""
     utils = TestUtils()
@@ -147,6 +175,8 @@ def main():
         ("无图片图文消息", test_news_without_image),
         ("最简图文消息", test_news_minimal),
         ("最大数量图文消息", test_max_news),
+        ("批量图文分页", test_bulk_news_pagination),
+        ("批量图文校验", test_bulk_news_validation),
     ]
     
     results = []
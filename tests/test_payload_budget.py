@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+测试在途载荷内存预算（离线）
+"""
+
+import threading
+import time
+from test_utils import TestUtils
+
+from payload_budget import ByteBudget, image_payload_bytes
+
+
+def test_wait_and_release():
+    """测试额度不足时排队等待，归还后按顺序放行"""
+    budget = ByteBudget(capacity=100, max_wait=5)
+    order = []
+    
+    def _work(name, nbytes, hold):
+        with budget.reserve(nbytes):
+            order.append(name)
+            time.sleep(hold)
+    
+    first = threading.Thread(target=_work, args=("first", 80, 0.2))
+    first.start()
+    time.sleep(0.05)
+    waiters = [threading.Thread(target=_work, args=(name, nbytes, 0)) for name, nbytes in [("large", 60), ("small", 10)]]
+    for thread in waiters:
+        thread.start()
+        time.sleep(0.02)
+    
+    stats = budget.stats()
+    assert stats["in_use_bytes"] == 80 and stats["waiting"] == 2
+    for thread in [first] + waiters:
+        thread.join()
+    
+    # 先等待的大请求不会被后到的小请求插队
+    assert order == ["first", "large", "small"]
+    stats = budget.stats()
+    assert stats["in_use_bytes"] == 0 and stats["peak_bytes"] == 80 and stats["waiting"] == 0
+    return True
+
+
+def test_reject_after_timeout():
+    """测试等待超时时报错并计数，超过总额度的请求可以独占运行"""
+    budget = ByteBudget(capacity=100, max_wait=5)
+    with budget.reserve(100):
+        start = time.monotonic()
+        try:
+            with budget.reserve(1, timeout=0.1):
+                assert False, "额度不足时应报错"
+        except TimeoutError as e:
+            assert "内存预算不足" in str(e)
+        assert time.monotonic() - start < 1
+    assert budget.stats()["rejected"] == 1
+    
+    with budget.reserve(1000):
+        assert budget.stats()["in_use_bytes"] == 100
+    assert budget.stats()["in_use_bytes"] == 0
+    return True
+
+
+def test_image_estimate():
+    """测试图片载荷估算包含原始数据和请求体"""
+    assert image_payload_bytes(3 * 1024 * 1024) == 3 * 1024 * 1024 + 4 * 1024 * 1024
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+    
+    # 测试用例
+    test_cases = [
+        ("排队等待和归还", test_wait_and_release),
+        ("超时拒绝", test_reject_after_timeout),
+        ("图片载荷估算", test_image_estimate),
+    ]
+    
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+    
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+    
+    print(f"📊 测试结果: {passed}/{total} 通过")
+    
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+测试运行时性能分析（离线）
+"""
+
+import base64
+import json
+import os
+import tempfile
+import threading
+from test_utils import TestUtils
+
+from profiling import ProfileSession
+
+
+def _busy_encode(stop):
+    """模拟负载：反复做base64编码和JSON序列化"""
+    data = os.urandom(256 * 1024)
+    while not stop.is_set():
+        json.dumps({"image": {"base64": base64.b64encode(data).decode('utf-8')}})
+
+
+def test_sampling_profile():
+    """测试采样分析能定位到工作线程中的热点并输出折叠栈"""
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_encode, args=(stop,), name="busy-worker")
+    worker.start()
+    try:
+        session = ProfileSession("sampling", trace_memory=True, interval=0.002)
+        session.start()
+        stop.wait(0.5)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "stacks.txt")
+            result = session.stop(top=10, collapsed_path=path)
+            with open(path, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+    finally:
+        stop.set()
+        worker.join()
+    
+    assert result["samples"] > 10
+    assert any("_busy_encode" in item["function"] for item in result["top_total"])
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any(line.startswith("busy-worker;") for line in lines)
+    assert isinstance(result["memory"], list)
+    return True
+
+
+def test_cprofile_profile():
+    """测试cProfile模式返回按累计耗时排序的函数和pstats文本"""
+    session = ProfileSession("cprofile", trace_memory=False)
+    session.start()
+    data = os.urandom(64 * 1024)
+    for _ in range(50):
+        json.dumps({"base64": base64.b64encode(data).decode('utf-8')})
+    result = session.stop(top=15)
+    
+    assert result["total_calls"] > 0 and "memory" not in result
+    assert any("b64encode" in item["function"] for item in result["top"])
+    assert "cumulative" in result["pstats"]
+    return True
+
+
+def test_single_session():
+    """测试同一时间只能运行一个分析，结束后可以再次开始"""
+    first = ProfileSession("sampling", trace_memory=False)
+    first.start()
+    try:
+        ProfileSession("cprofile", trace_memory=False).start()
+        assert False, "应拒绝并发的性能分析"
+    except RuntimeError:
+        pass
+    finally:
+        first.stop()
+    
+    second = ProfileSession("sampling", trace_memory=False)
+    second.start()
+    second.stop()
+    
+    try:
+        ProfileSession("perf")
+        assert False
+    except ValueError:
+        pass
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+    
+    # 测试用例
+    test_cases = [
+        ("采样分析", test_sampling_profile),
+        ("cProfile分析", test_cprofile_profile),
+        ("单一分析会话", test_single_session),
+    ]
+    
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+    
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+    
+    print(f"📊 测试结果: {passed}/{total} 通过")
+    
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
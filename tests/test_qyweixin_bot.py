@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+测试同步和异步客户端库（离线）
+"""
+
+import asyncio
+import os
+import socket
+import tempfile
+import uuid
+from test_utils import TestUtils, FakeWebhook
+
+from qyweixin_bot import QyWeixinBot, AsyncQyWeixinBot
+from webhook_client import current_client, default_client
+
+
+def test_instances_per_key():
+    """测试每个实例只使用自己的key，激活只在调用期间有效"""
+    webhook = FakeWebhook()
+    base_url = webhook.base_url
+    key_a, key_b = uuid.uuid4().hex, uuid.uuid4().hex
+    try:
+        with QyWeixinBot(key_a, base_url=base_url) as bot_a, QyWeixinBot(key_b, base_url=base_url) as bot_b:
+            assert bot_a.text("a")["errcode"] == 0
+            assert bot_b.markdown("**b**")["errcode"] == 0
+            assert bot_a.send({"msgtype": "text", "text": {"content": "raw"}})["errcode"] == 0
+            assert current_client() is default_client()
+
+            # 文件由实例自己的机器人上传并发送
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "report.txt")
+                with open(path, "w") as f:
+                    f.write("report")
+                assert bot_b.file(path)["errcode"] == 0
+
+        assert [m["text"]["content"] for m in webhook.messages(key_a)] == ["a", "raw"]
+        assert [m["msgtype"] for m in webhook.messages(key_b)] == ["markdown", "file"]
+        assert webhook.messages(key_b)[1]["file"]["media_id"] == f"media-{key_b}"
+        assert bot_a.stats()["lanes"]["normal"]["sent"] == 2
+    finally:
+        webhook.close()
+    return True
+
+
+def test_caches_per_key():
+    """测试media_id缓存和去重记录按key区分，其他key的客户端不会复用"""
+    webhook = FakeWebhook()
+    base_url = webhook.base_url
+    key_a, key_b = uuid.uuid4().hex, uuid.uuid4().hex
+    try:
+        with QyWeixinBot(key_a, base_url=base_url) as bot_a, QyWeixinBot(key_b, base_url=base_url) as bot_b, \
+                tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "report.txt"), "w") as f:
+                f.write("report")
+            assert bot_a.files(tmp)["files"][0]["cached"] is False
+            assert bot_b.files(tmp)["files"][0]["cached"] is False
+            assert bot_a.files(tmp)["files"][0]["cached"] is True
+
+            message = {"msgtype": "text", "text": {"content": "same id"}}
+            assert bot_a.send(dict(message), client_msg_id="shared")["errcode"] == 0
+            assert bot_b.send(dict(message), client_msg_id="shared")["errcode"] == 0
+
+            # 其他机器人上传的media_id不能由本实例发送
+            try:
+                bot_b.file(media_id=f"media-{key_a}")
+                assert False, "其他key上传的media_id应报错"
+            except ValueError as e:
+                assert "机器人池" in str(e)
+
+        assert [m["file"]["media_id"] for m in webhook.messages(key_a) if m["msgtype"] == "file"] == [f"media-{key_a}"] * 2
+        assert [m["file"]["media_id"] for m in webhook.messages(key_b) if m["msgtype"] == "file"] == [f"media-{key_b}"]
+        assert [m["msgtype"] for m in webhook.messages(key_b)] == ["file", "text"]
+    finally:
+        webhook.close()
+    return True
+
+
+def test_async_bot():
+    """测试异步客户端并发发送，不阻塞事件循环"""
+    webhook = FakeWebhook()
+    base_url = webhook.base_url
+    key = uuid.uuid4().hex
+
+    async def _run():
+        async with AsyncQyWeixinBot(key, base_url=base_url) as bot:
+            results = await asyncio.gather(*(bot.text(f"m{i}") for i in range(5)))
+            assert all(r["errcode"] == 0 for r in results)
+            assert (await bot.news([{"title": "t", "url": "https://example.com"}]))["errcode"] == 0
+            return bot.stats()
+
+    try:
+        stats = asyncio.run(_run())
+        assert sorted(m["text"]["content"] for m in webhook.messages(key) if m["msgtype"] == "text") == [f"m{i}" for i in range(5)]
+        assert stats["lanes"]["normal"]["sent"] == 6
+    finally:
+        webhook.close()
+    return True
+
+
+def test_connection_retry():
+    """测试连接失败时按重试策略重试后报错"""
+    # 取一个没有监听的端口
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    with QyWeixinBot(uuid.uuid4().hex, base_url=f"http://127.0.0.1:{port}", retries=1) as bot:
+        attempts = []
+        original = bot._post
+        bot._post = lambda *args: attempts.append(1) or original(*args)
+        try:
+            bot.text("x")
+            assert False, "连接失败应报错"
+        except Exception as e:
+            assert "Connection" in type(e).__name__ or "Connection" in str(e)
+        assert len(attempts) == 2
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+
+    # 测试用例
+    test_cases = [
+        ("按key创建实例", test_instances_per_key),
+        ("按key区分缓存", test_caches_per_key),
+        ("异步客户端", test_async_bot),
+        ("连接失败重试", test_connection_retry),
+    ]
+
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+
+    print(f"📊 测试结果: {passed}/{total} 通过")
+
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
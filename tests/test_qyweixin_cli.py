@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+测试命令行JSONL批量发送（离线）
+"""
+
+import io
+import json
+import uuid
+from contextlib import redirect_stderr
+from test_utils import TestUtils, FakeWebhook
+
+import qyweixin_cli
+from qyweixin_bot import QyWeixinBot
+
+
+def _run(bot, text, concurrency=4):
+    """发送输入文本，返回 (成功数, 失败数, 按行号排序的结果)"""
+    results = io.StringIO()
+    progress = qyweixin_cli._Progress(io.StringIO())
+    sent, failed = qyweixin_cli.send_stream(bot, qyweixin_cli.iter_lines(io.StringIO(text)), results, concurrency,
+                                            progress=progress)
+    records = sorted((json.loads(line) for line in results.getvalue().splitlines()), key=lambda r: r["line"])
+    return sent, failed, records
+
+
+def test_typed_and_raw_lines():
+    """测试按type调用客户端方法、原样发送msgtype消息、错误的行单独报告不影响其他行"""
+    webhook = FakeWebhook()
+    base_url = webhook.base_url
+    key = uuid.uuid4().hex
+    text = "\n".join([
+        json.dumps({"type": "text", "content": "部署完成", "mentioned_list": ["@all"]}, ensure_ascii=False),
+        json.dumps({"type": "markdown", "content": "**告警**", "priority": "high"}),
+        "",
+        json.dumps({"msgtype": "text", "text": {"content": "raw"}}),
+        "{not json",
+        json.dumps({"type": "unknown"}),
+        json.dumps({"content": "缺少类型"}, ensure_ascii=False),
+    ])
+    try:
+        with QyWeixinBot(key, base_url=base_url) as bot:
+            sent, failed, records = _run(bot, text)
+        assert (sent, failed) == (3, 3)
+        assert [r["line"] for r in records] == [1, 2, 4, 5, 6, 7]
+        assert [r["ok"] for r in records] == [True, True, True, False, False, False]
+        assert "不是有效的JSON" in records[3]["error"]
+        assert "不支持的type" in records[4]["error"]
+        assert "type或msgtype" in records[5]["error"]
+        assert all("elapsed_ms" in r for r in records)
+
+        messages = webhook.messages(key)
+        assert sorted(m["msgtype"] for m in messages) == ["markdown", "text", "text"]
+        assert {"部署完成", "raw"} == {m["text"]["content"] for m in messages if m["msgtype"] == "text"}
+        assert bot.stats()["lanes"]["high"]["sent"] == 1
+    finally:
+        webhook.close()
+    return True
+
+
+def test_ordered_and_idempotent():
+    """测试并发为1时按输入顺序发送，相同幂等键的行只发送一次"""
+    webhook = FakeWebhook()
+    base_url = webhook.base_url
+    key = uuid.uuid4().hex
+    batch = uuid.uuid4().hex
+    lines = [json.dumps({"type": "text", "content": f"m{i}", "idempotency_key": f"{batch}-{i}"}) for i in range(20)]
+    text = "\n".join(lines)
+    try:
+        with QyWeixinBot(key, base_url=base_url) as bot:
+            assert _run(bot, text, concurrency=1)[:2] == (20, 0)
+            # 重新运行同一批次，已发送的行不再重复发送
+            sent, failed, records = _run(bot, text + "\n" + json.dumps({"type": "text", "content": "new"}), 1)
+        assert (sent, failed) == (21, 0)
+        assert [m["text"]["content"] for m in webhook.messages(key)] == [f"m{i}" for i in range(20)] + ["new"]
+    finally:
+        webhook.close()
+    return True
+
+
+def test_main_usage_errors():
+    """测试参数错误时以状态码2退出"""
+    for argv in (["--concurrency", "0", "--key", "k"], ["--priority", "asap", "--key", "k"]):
+        try:
+            with redirect_stderr(io.StringIO()):
+                qyweixin_cli.main(argv)
+            assert False, "参数错误应退出"
+        except SystemExit as e:
+            assert e.code == 2
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+
+    # 测试用例
+    test_cases = [
+        ("按行发送和错误报告", test_typed_and_raw_lines),
+        ("顺序发送和幂等重跑", test_ordered_and_idempotent),
+        ("参数错误", test_main_usage_errors),
+    ]
+
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+
+    print(f"📊 测试结果: {passed}/{total} 通过")
+
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
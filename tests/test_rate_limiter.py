@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+测试自适应发送频率（离线）
+"""
+
+import uuid
+from test_utils import TestUtils
+
+from config import RATE_DECREASE_FACTOR
+from rate_limiter import AdaptiveRateLimiter
+from state_store import get_state_store
+
+
+def _limiter(rate=20, **kwargs):
+    """每个测试使用新的令牌桶名称，避免状态存储中学习到的频率互相影响"""
+    return AdaptiveRateLimiter(rate, name=f"test:{uuid.uuid4().hex}", **kwargs)
+
+
+def test_throttle_backs_off():
+    """测试收到45009后频率按比例降低、清空令牌桶，同一批限流只降低一次"""
+    limiter = _limiter(20)
+    assert limiter.try_acquire() == 0
+    limiter.record_throttled()
+    assert limiter.rate_per_minute == 20 * RATE_DECREASE_FACTOR
+    assert limiter.try_acquire() > 0, "限流后令牌桶应已清空"
+    
+    limiter.record_throttled()
+    assert limiter.rate_per_minute == 20 * RATE_DECREASE_FACTOR
+    
+    # 其他进程（同名的限流器）看到相同的频率
+    other = AdaptiveRateLimiter(20, name=limiter.name)
+    assert other.rate_per_minute == limiter.rate_per_minute
+    return True
+
+
+def test_probe_only_when_saturated():
+    """测试只有发送受限流器限制时才向上探测，且不超过上限"""
+    limiter = _limiter(10, max_rate=12)
+    for _ in range(5):
+        limiter.record_success()
+    assert limiter.rate_per_minute == 10, "未等待过令牌时不应提高频率"
+    
+    while limiter.try_acquire() == 0:
+        pass
+    for _ in range(10):
+        limiter.record_success()
+    # 按当前频率发送满一分钟约增加1条
+    assert 10.9 < limiter.rate_per_minute < 11.1
+    for _ in range(100):
+        limiter.record_success()
+    assert limiter.rate_per_minute == 12
+    return True
+
+
+def test_rate_bounds():
+    """测试频率不会低于下限"""
+    limiter = _limiter(20, min_rate=4)
+    for _ in range(5):
+        limiter.record_throttled()
+        # 跳过同一批限流的合并窗口
+        get_state_store().delete("rate_decrease", limiter.name)
+    assert limiter.rate_per_minute == 4
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+    
+    # 测试用例
+    test_cases = [
+        ("限流后降低频率", test_throttle_backs_off),
+        ("饱和时向上探测", test_probe_only_when_saturated),
+        ("频率下限", test_rate_bounds),
+    ]
+    
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+    
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+    
+    print(f"📊 测试结果: {passed}/{total} 通过")
+    
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
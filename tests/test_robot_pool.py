@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+测试机器人池的分担、故障转移和粘性选择（离线）
+"""
+
+import uuid
+from collections import Counter
+from test_utils import TestUtils
+
+from robot_pool import RobotPool
+
+
+def _keys(n):
+    """每个测试使用新的key，避免状态存储中的暂停记录互相影响"""
+    return [uuid.uuid4().hex for _ in range(n)]
+
+
+def _text(content):
+    return {"msgtype": "text", "text": {"content": content}}
+
+
+def test_spread_across_robots():
+    """测试消息分散到所有机器人"""
+    for strategy in ("least_loaded", "round_robin"):
+        pool = RobotPool(_keys(3), strategy)
+        used = Counter()
+        for i in range(9):
+            result = pool.send(_text(str(i)), "normal", lambda payload, robot: used.update([robot.id]) or {"errcode": 0})
+            assert result["errcode"] == 0
+        assert sorted(used.values()) == [3, 3, 3], f"{strategy}: {used}"
+    assert pool.stats()["lanes"]["normal"]["sent"] == 9
+    return True
+
+
+def test_failover_on_throttle():
+    """测试机器人被限流或key失效时换一个机器人重发，并暂停使用"""
+    pool = RobotPool(_keys(3))
+    throttled, revoked, healthy = pool.robots
+    responses = {throttled.id: {"errcode": 45009, "errmsg": "api freq out of limit"},
+                 revoked.id: {"errcode": 93000, "errmsg": "invalid webhook url"}}
+    attempts = []
+
+    def send_fn(payload, robot):
+        attempts.append(robot.id)
+        return responses.get(robot.id, {"errcode": 0})
+
+    for i in range(3):
+        assert pool.send(_text(str(i)), "normal", send_fn)["errcode"] == 0
+    assert throttled.disabled_reason() == "throttled"
+    assert revoked.disabled_reason() == "revoked"
+    # 暂停期间不再选择失败的机器人，每个失败的机器人最多被尝试一次
+    assert attempts.count(throttled.id) <= 1 and attempts.count(revoked.id) <= 1
+    assert attempts.count(healthy.id) == 3
+
+    # 所有机器人都失败时返回最后一个错误
+    result = RobotPool(_keys(2)).send(_text("x"), "normal", lambda payload, robot: {"errcode": 45009})
+    assert result["errcode"] == 45009
+    return True
+
+
+def test_sticky_and_pinned():
+    """测试粘性键选择稳定的机器人，指定机器人时不转移"""
+    pool = RobotPool(_keys(4))
+    sticky = {pool.select(sticky_key="report-1").id for _ in range(10)}
+    assert len(sticky) == 1
+    chosen = pool.get(sticky.pop())
+
+    # 粘性机器人不可用时稳定地落到另一个机器人
+    chosen.disable("throttled", 60)
+    fallback = {pool.select(sticky_key="report-1").id for _ in range(10)}
+    assert len(fallback) == 1 and chosen.id not in fallback
+
+    # media_id只能由上传它的机器人发送，被限流时不转移
+    pool.record_media("media-1", chosen)
+    assert pool.media_robot("media-1") is chosen
+    assert pool.media_robot("unknown") is pool.primary
+    attempts = []
+    result = pool.send({"msgtype": "file", "file": {"media_id": "media-1"}}, "normal",
+                       lambda payload, robot: attempts.append(robot.id) or {"errcode": 45009},
+                       robot=chosen)
+    assert result["errcode"] == 45009 and attempts == [chosen.id]
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+
+    # 测试用例
+    test_cases = [
+        ("消息分担", test_spread_across_robots),
+        ("限流故障转移", test_failover_on_throttle),
+        ("粘性选择和media固定", test_sticky_and_pinned),
+    ]
+
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+
+    print(f"📊 测试结果: {passed}/{total} 通过")
+
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+测试定时发送（离线）
+"""
+
+import os
+import tempfile
+import time
+from datetime import datetime
+from test_utils import TestUtils
+
+from state_store import configure_state_store, get_state_store
+from scheduled_delivery import CronSchedule, DeliveryScheduler, parse_send_at
+
+
+def _text(content):
+    return {"msgtype": "text", "text": {"content": content}}
+
+
+class _Recorder:
+    """记录发送调用的发送函数"""
+    
+    def __init__(self, errcode=0):
+        self.sent = []
+        self.errcode = errcode
+    
+    def __call__(self, data, client_msg_id, priority):
+        self.sent.append((data["text"]["content"], priority))
+        return {"errcode": self.errcode, "errmsg": "ok" if self.errcode == 0 else "failed"}
+
+
+def test_cron_next_after():
+    """测试cron表达式的下一次触发时间"""
+    base = datetime(2026, 1, 2, 8, 30).timestamp()  # 周五
+    
+    assert datetime.fromtimestamp(CronSchedule("*/15 * * * *").next_after(base)) == datetime(2026, 1, 2, 8, 45)
+    assert datetime.fromtimestamp(CronSchedule("0 9 * * *").next_after(base)) == datetime(2026, 1, 2, 9, 0)
+    # 工作日9点：周五9点之后的下一次是周一
+    weekday = CronSchedule("0 9 * * 1-5")
+    assert datetime.fromtimestamp(weekday.next_after(datetime(2026, 1, 2, 9, 0).timestamp())) == datetime(2026, 1, 5, 9, 0)
+    assert datetime.fromtimestamp(CronSchedule("0 0 1 3 *").next_after(base)) == datetime(2026, 3, 1, 0, 0)
+    
+    for expression in ["* * * *", "60 * * * *", "a * * * *", "5-1 * * * *"]:
+        try:
+            CronSchedule(expression)
+            assert False, f"应拒绝无效表达式: {expression}"
+        except ValueError:
+            pass
+    return True
+
+
+def test_parse_send_at():
+    """测试发送时间解析"""
+    now = datetime(2026, 1, 2, 10, 0).timestamp()
+    assert datetime.fromtimestamp(parse_send_at("09:00", now)) == datetime(2026, 1, 3, 9, 0)
+    assert datetime.fromtimestamp(parse_send_at("11:30", now)) == datetime(2026, 1, 2, 11, 30)
+    assert datetime.fromtimestamp(parse_send_at("2026-02-01T09:00", now)) == datetime(2026, 2, 1, 9, 0)
+    try:
+        parse_send_at("tomorrow", now)
+        assert False
+    except ValueError:
+        pass
+    return True
+
+
+def test_one_shot_and_cancel():
+    """测试到期发送、取消和列表"""
+    configure_state_store("memory://")
+    recorder = _Recorder()
+    scheduler = DeliveryScheduler(recorder)
+    try:
+        now = time.time()
+        scheduler.schedule(_text("due"), due=now - 1, priority="high")
+        later = scheduler.schedule(_text("later"), due=now + 3600)
+        cancelled = scheduler.schedule(_text("cancelled"), due=now + 7200)
+        assert scheduler.cancel(cancelled["schedule_id"])
+        assert not scheduler.cancel(cancelled["schedule_id"])
+        
+        deadline = time.time() + 2
+        while not recorder.sent and time.time() < deadline:
+            time.sleep(0.01)
+        assert recorder.sent == [("due", "high")]
+        assert [s["schedule_id"] for s in scheduler.list()] == [later["schedule_id"]]
+    finally:
+        scheduler.stop()
+    return True
+
+
+def test_cron_reschedule_and_retry():
+    """测试周期任务发送后安排下一次，失败时按重试间隔重新排队"""
+    configure_state_store("memory://")
+    scheduler = DeliveryScheduler(_Recorder())
+    scheduler.start = lambda: None
+    
+    scheduler.schedule(_text("daily"), due=time.time() - 1, cron="0 9 * * *")
+    assert scheduler.run_due() == 1
+    pending = scheduler.list()
+    assert len(pending) == 1 and pending[0]["cron"] == "0 9 * * *"
+    assert datetime.fromisoformat(pending[0]["due"]).time().hour == 9
+    
+    failing = DeliveryScheduler(_Recorder(errcode=45009))
+    failing.start = lambda: None
+    configure_state_store("memory://")
+    failing.schedule(_text("retry"), due=time.time() - 1)
+    assert failing.run_due() == 1
+    pending = failing.list()
+    assert len(pending) == 1 and pending[0]["attempts"] == 1
+    return True
+
+
+def test_survives_restart():
+    """测试定时消息保存在SQLite中，重启后由新的调度器发送"""
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_state_store(f"sqlite:///{os.path.join(tmp, 'state.db')}")
+        try:
+            first = DeliveryScheduler(_Recorder())
+            first.start = lambda: None
+            first.schedule(_text("after restart"), due=time.time() + 0.2)
+            assert first.run_due() == 0
+            
+            # 模拟重启：重新打开状态存储，新的调度器实例接管
+            configure_state_store(f"sqlite:///{os.path.join(tmp, 'state.db')}")
+            recorder = _Recorder()
+            second = DeliveryScheduler(recorder)
+            second.start = lambda: None
+            time.sleep(0.3)
+            assert second.run_due() == 1 and recorder.sent == [("after restart", "normal")]
+            assert get_state_store().outbox_count() == 0
+        finally:
+            configure_state_store("memory://")
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+    
+    # 测试用例
+    test_cases = [
+        ("cron表达式", test_cron_next_after),
+        ("发送时间解析", test_parse_send_at),
+        ("到期发送和取消", test_one_shot_and_cancel),
+        ("周期任务和失败重试", test_cron_reschedule_and_retry),
+        ("重启后继续发送", test_survives_restart),
+    ]
+    
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+    
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+    
+    print(f"📊 测试结果: {passed}/{total} 通过")
+    
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
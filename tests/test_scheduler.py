@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+测试发送调度器的优先级通道（离线）
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from test_utils import TestUtils, FakeWebhook
+
+from scheduler import SendScheduler
+from webhook_client import WebhookClient
+
+
+class ManualLimiter:
+    """手动发放令牌的限流器，便于控制放行时机"""
+    
+    def __init__(self, tokens=0):
+        self.tokens = tokens
+        self.lock = threading.Lock()
+    
+    def release(self, n=1):
+        with self.lock:
+            self.tokens += n
+    
+    def try_acquire(self):
+        with self.lock:
+            if self.tokens > 0:
+                self.tokens -= 1
+                return 0.0
+            return 0.01
+
+
+def _send_async(scheduler, data, priority, sent, errors=None):
+    """在后台线程中发送消息"""
+    def _run():
+        try:
+            sent.append(scheduler.send(data, priority, lambda d: {"errcode": 0, "content": d["text"]["content"]}))
+        except Exception as e:
+            if errors is not None:
+                errors.append(e)
+    thread = threading.Thread(target=_run)
+    thread.start()
+    return thread
+
+
+def _text(content):
+    return {"msgtype": "text", "text": {"content": content}}
+
+
+def test_priority_order():
+    """测试配额不足时高优先级通道先发送"""
+    limiter = ManualLimiter()
+    scheduler = SendScheduler(limiter, starvation_age=60, overflow_policy="block")
+    sent = []
+    threads = [_send_async(scheduler, _text(f"low-{i}"), "low", sent) for i in range(3)]
+    time.sleep(0.1)
+    threads.append(_send_async(scheduler, _text("urgent"), "urgent", sent))
+    time.sleep(0.1)
+    
+    for _ in range(4):
+        limiter.release()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join(2)
+    
+    assert [r["content"] for r in sent] == ["urgent", "low-0", "low-1", "low-2"]
+    stats = scheduler.stats()
+    assert stats["urgent"]["sent"] == 1 and stats["low"]["sent"] == 3
+    return True
+
+
+def test_starvation_protection():
+    """测试低优先级消息排队超时后优先于新的高优先级消息"""
+    limiter = ManualLimiter()
+    scheduler = SendScheduler(limiter, starvation_age=0.2, overflow_policy="block")
+    sent = []
+    threads = [_send_async(scheduler, _text("low"), "low", sent)]
+    time.sleep(0.3)
+    threads.append(_send_async(scheduler, _text("high"), "high", sent))
+    time.sleep(0.05)
+    
+    limiter.release(2)
+    for thread in threads:
+        thread.join(2)
+    
+    assert [r["content"] for r in sent] == ["low", "high"]
+    return True
+
+
+def test_overflow_coalesce_and_shed():
+    """测试队列超过阈值后合并或丢弃低优先级消息"""
+    limiter = ManualLimiter()
+    scheduler = SendScheduler(limiter, starvation_age=60, overflow_threshold=1, overflow_policy="coalesce")
+    sent, errors = [], []
+    threads = [_send_async(scheduler, _text("first"), "low", sent)]
+    time.sleep(0.1)
+    threads.append(_send_async(scheduler, _text("second"), "low", sent))
+    time.sleep(0.1)
+    threads.append(_send_async(scheduler, {"msgtype": "markdown", "markdown": {"content": "md"}}, "low", sent, errors))
+    time.sleep(0.1)
+    
+    limiter.release(3)
+    for thread in threads:
+        thread.join(2)
+    
+    assert len(sent) == 2 and all(r["content"] == "first\n\nsecond" for r in sent)
+    assert any(r.get("coalesced") for r in sent)
+    assert len(errors) == 1 and isinstance(errors[0], RuntimeError)
+    stats = scheduler.stats()["low"]
+    assert stats["coalesced"] == 1 and stats["shed"] == 1 and stats["sent"] == 1
+    return True
+
+
+class _Response:
+    """模拟requests的响应"""
+
+    status_code = 200
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class _ThrottledSession:
+    """模拟连接池：发往throttled_url的请求返回45009，其他返回成功，按顺序记录 (url, 内容)"""
+
+    def __init__(self, throttled_url):
+        self.throttled_url = throttled_url
+        self.posts = []
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        self.posts.append((url, json.loads(data)["text"]["content"]))
+        if url == self.throttled_url:
+            return _Response({"errcode": 45009, "errmsg": "api freq out of limit"})
+        return _Response({"errcode": 0, "errmsg": "ok"})
+
+    def close(self):
+        pass
+
+
+def test_coalesced_after_failover():
+    """测试被合并的消息得到换机器人重发后的最终结果，并按自己的client_msg_id去重"""
+    client = WebhookClient(keys=[uuid.uuid4().hex, uuid.uuid4().hex], hedge=False, retries=0)
+    throttled = client.pool.select(sticky_key="report")
+    healthy = next(robot for robot in client.pool.robots if robot is not throttled)
+    limiter = ManualLimiter()
+    throttled.scheduler = SendScheduler(limiter, starvation_age=60, overflow_threshold=1, overflow_policy="coalesce")
+    healthy.scheduler = SendScheduler(ManualLimiter(tokens=10), starvation_age=60)
+    session = client.session = _ThrottledSession(throttled.webhook_url)
+
+    results = []
+    def _send(content, client_msg_id):
+        thread = threading.Thread(target=lambda: results.append(
+            (content, client.send(_text(content), client_msg_id=client_msg_id, sticky_key="report"))))
+        thread.start()
+        return thread
+
+    threads = [_send("first", "m1")]
+    time.sleep(0.1)
+    threads.append(_send("second", "m2"))
+    time.sleep(0.1)
+    limiter.release()
+    for thread in threads:
+        thread.join(5)
+
+    merged = "first\n\nsecond"
+    assert session.posts == [(throttled.webhook_url, merged), (healthy.webhook_url, merged)]
+    assert sorted(content for content, _ in results) == ["first", "second"]
+    assert all(result["errcode"] == 0 for _, result in results)
+    assert dict(results)["second"]["coalesced"]
+
+    # 被合并的消息重试时命中去重，不再发送
+    assert client.send(_text("second"), client_msg_id="m2")["errcode"] == 0
+    assert len(session.posts) == 2
+    client.close()
+    return True
+
+
+# 在子进程中按测试环境变量导入server，通过内存中的MCP客户端调用工具
+_MCP_SCRIPT = """
+import asyncio, sys
+sys.path.insert(0, "tests")
+try:
+    from fastmcp import Client
+    import server
+except ImportError as e:
+    print(f"SKIP {e}")
+    sys.exit(0)
+from test_scheduler import ManualLimiter
+
+async def main():
+    robot = server.bot.pool.primary
+    limiter = robot.scheduler.limiter = ManualLimiter()
+    async with Client(server.mcp) as client:
+        low = asyncio.create_task(client.call_tool("qyweixin_text", {"content": "low", "priority": "low"}))
+        await asyncio.sleep(0.5)
+        urgent = asyncio.create_task(client.call_tool("qyweixin_text", {"content": "urgent", "priority": "urgent"}))
+        await asyncio.sleep(0.5)
+        print(f"DEPTH {robot.queue_depth()}")
+        for _ in range(2):
+            limiter.release()
+            await asyncio.sleep(0.2)
+        await asyncio.wait_for(asyncio.gather(low, urgent), 10)
+
+asyncio.run(main())
+"""
+
+
+def test_priority_through_mcp():
+    """测试通过MCP工具调用时，后到的urgent消息越过已在排队的low消息（需要fastmcp）"""
+    webhook = FakeWebhook()
+    env = {**os.environ, "key": uuid.uuid4().hex, "QYWEIXIN_KEYS": "", "QYWEIXIN_STATE_URL": "memory://",
+           "QYWEIXIN_API_BASE": webhook.base_url}
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        proc = subprocess.run([sys.executable, "-c", _MCP_SCRIPT], cwd=root, env=env,
+                              capture_output=True, text=True, timeout=60)
+    finally:
+        webhook.close()
+    if proc.stdout.startswith("SKIP"):
+        print(f"⚠️ fastmcp不可用，跳过MCP层优先级测试: {proc.stdout.strip()}")
+        return True
+
+    assert proc.returncode == 0, proc.stderr
+    # 两个调用同时在队列中：low调用等待配额时没有阻塞事件循环
+    assert "DEPTH 2" in proc.stdout, proc.stdout
+    assert [m["text"]["content"] for m in webhook.messages()] == ["urgent", "low"]
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+    
+    # 测试用例
+    test_cases = [
+        ("优先级顺序", test_priority_order),
+        ("饥饿保护", test_starvation_protection),
+        ("队列溢出合并和丢弃", test_overflow_coalesce_and_shed),
+        ("合并消息的重发结果和去重", test_coalesced_after_failover),
+        ("MCP层优先级", test_priority_through_mcp),
+    ]
+    
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+    
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+    
+    print(f"📊 测试结果: {passed}/{total} 通过")
+    
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
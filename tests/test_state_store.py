@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+测试状态存储后端（离线）
+"""
+
+import os
+import tempfile
+import time
+from multiprocessing import Pool
+from test_utils import TestUtils
+
+from state_store import MemoryStateStore, SQLiteStateStore, RedisStateStore
+
+
+def _check_store(store):
+    """对任意后端执行相同的检查"""
+    store.set("media", "k", {"media_id": "abc"}, ttl=60)
+    assert store.get("media", "k") == {"media_id": "abc"}
+    store.set("media", "short", 1, ttl=0.05)
+    time.sleep(0.1)
+    assert store.get("media", "short") is None
+    
+    assert store.add("dedupe", "msg-1", 1, ttl=60)
+    assert not store.add("dedupe", "msg-1", 2, ttl=60)
+    assert store.get("dedupe", "msg-1") == 1
+    
+    # 容量为3的桶：前三次成功，第四次需要等待
+    waits = [store.take_token("bucket", rate=1.0, capacity=3) for _ in range(4)]
+    assert waits[:3] == [0, 0, 0] and waits[3] > 0
+    
+    late = store.outbox_put({"text": "late"}, due=200)
+    early = store.outbox_put({"text": "early"}, due=100)
+    assert store.outbox_next_due() == 100
+    assert [item["text"] for _, _, item in store.outbox_due(150)] == ["early"]
+    assert store.outbox_remove(early) and not store.outbox_remove(early)
+    assert store.outbox_count() == 1 and store.outbox_remove(late)
+    return True
+
+
+def test_memory_store():
+    """测试内存状态存储"""
+    return _check_store(MemoryStateStore())
+
+
+def test_sqlite_store():
+    """测试SQLite状态存储"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        return _check_store(SQLiteStateStore(os.path.join(temp_dir, "state.db")))
+
+
+def test_redis_store():
+    """测试Redis状态存储（使用fakeredis作为本地替身）"""
+    try:
+        import fakeredis
+    except ImportError:
+        print("⚠️ 未安装fakeredis，跳过Redis状态存储测试")
+        return True
+    return _check_store(RedisStateStore(fakeredis.FakeRedis()))
+
+
+def _take_tokens(path):
+    """在子进程中从共享令牌桶取令牌"""
+    store = SQLiteStateStore(path)
+    return sum(1 for _ in range(10) if store.take_token("shared", rate=0.001, capacity=10) == 0)
+
+
+def test_sqlite_shared_across_processes():
+    """测试多个进程共享同一个SQLite令牌桶，总配额不被放大"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "state.db")
+        SQLiteStateStore(path)
+        with Pool(4) as pool:
+            acquired = sum(pool.map(_take_tokens, [path] * 4))
+    assert acquired == 10
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+    
+    # 测试用例
+    test_cases = [
+        ("内存状态存储", test_memory_store),
+        ("SQLite状态存储", test_sqlite_store),
+        ("Redis状态存储", test_redis_store),
+        ("SQLite多进程共享配额", test_sqlite_shared_across_processes),
+    ]
+    
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+    
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+    
+    print(f"📊 测试结果: {passed}/{total} 通过")
+    
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
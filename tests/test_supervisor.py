@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+测试多进程工作模式的主进程监控（离线）
+"""
+
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import requests
+from test_utils import TestUtils
+
+from rate_limiter import key_id
+
+# 在子进程中启动主进程：每个工作进程运行一个返回自身pid和状态存储地址的ASGI应用
+_SUPERVISOR_SCRIPT = """
+import json, os, sys
+from supervisor import run_workers
+from state_store import get_state_store_url
+
+def app_factory():
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                else:
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        body = json.dumps({"pid": os.getpid(), "ppid": os.getppid(), "state_url": get_state_store_url()}).encode()
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+    return app
+
+run_workers(app_factory, "127.0.0.1", int(sys.argv[1]), 2)
+"""
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _collect_pids(url, count, timeout=20, exclude=()):
+    """反复请求，直到收到count个不同工作进程（不含exclude）的响应"""
+    pids, info = set(), {}
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            info = requests.get(url, headers={"Connection": "close"}, timeout=2).json()
+        except requests.exceptions.RequestException:
+            time.sleep(0.1)
+            continue
+        if info["pid"] not in exclude:
+            pids.add(info["pid"])
+        if len(pids) >= count:
+            return pids, info
+    raise AssertionError(f"{timeout}秒内只收到{len(pids)}个工作进程的响应")
+
+
+def test_workers_share_socket_and_restart():
+    """测试2个工作进程共享监听端口、被杀死的工作进程自动重启、内存状态存储改为共享SQLite"""
+    if not hasattr(os, "fork"):
+        print("⚠️ 当前系统不支持fork，跳过多进程测试")
+        return True
+    key = uuid.uuid4().hex
+    port = _free_port()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "key": key, "QYWEIXIN_STATE_URL": "memory://"}
+    proc = subprocess.Popen([sys.executable, "-c", _SUPERVISOR_SCRIPT, str(port)], cwd=root, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    url = f"http://127.0.0.1:{port}/"
+    try:
+        pids, info = _collect_pids(url, 2)
+        assert info["ppid"] == proc.pid
+        db_path = os.path.join(tempfile.gettempdir(), f"qyweixin_state_{key_id(key)}.db")
+        assert info["state_url"] == f"sqlite:///{db_path}"
+
+        killed = pids.pop()
+        os.kill(killed, signal.SIGKILL)
+        # 重启后的工作进程和存活的工作进程都能接受连接
+        new_pids, info = _collect_pids(url, 2, exclude={killed})
+        assert killed not in new_pids and pids <= new_pids
+        assert info["ppid"] == proc.pid
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        for suffix in ("", "-wal", "-shm"):
+            path = os.path.join(tempfile.gettempdir(), f"qyweixin_state_{key_id(key)}.db{suffix}")
+            if os.path.exists(path):
+                os.remove(path)
+    assert proc.returncode == 0, proc.stderr.read().decode("utf-8", "replace")
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+
+    # 测试用例
+    test_cases = [
+        ("多进程共享端口和重启", test_workers_share_socket_and_restart),
+    ]
+
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+
+    print(f"📊 测试结果: {passed}/{total} 通过")
+
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -188,6 +188,53 @@ def test_minimal_card():
     return result["success"]
 
 
+def test_card_template_render():
+    """测试预编译模板卡片渲染（离线）"""
+    from card_templates import CardTemplate
+    
+    template = CardTemplate("alert", {
+        "card_type": "text_notice",
+        "main_title": {"title": "{{service}} 告警", "desc": "级别 {{level}}"},
+        "horizontal_content_list": "{{fields}}",
+        "jump_list": [{"type": 1, "title": "查看详情", "url": "https://example.com/{{id}}"}],
+        "card_action": {"type": 1, "url": "https://example.com/{{id}}"}
+    })
+    
+    fields = [{"keyname": "主机", "value": "web-01"}]
+    card = template.render({"service": "api", "level": "P0", "id": 42, "fields": fields})
+    
+    assert template.variables == {"service", "level", "id", "fields"}
+    assert card["main_title"] == {"title": "api 告警", "desc": "级别 P0"}
+    assert card["horizontal_content_list"] == fields
+    assert card["jump_list"][0]["url"] == "https://example.com/42"
+    
+    # 整个值替换为变量的副本，修改渲染结果不影响调用方的对象
+    card["horizontal_content_list"][0]["value"] = "web-02"
+    assert fields[0]["value"] == "web-01"
+    
+    # 数字开头的 {{0}} 不是变量，按普通文本保留
+    literal = CardTemplate("literal", {"card_type": "text_notice",
+                                       "main_title": {"title": "{{0}} 和 {{name}}", "desc": "{{1}}"}})
+    assert literal.variables == {"name"}
+    assert literal.render({"name": "x"})["main_title"] == {"title": "{{0}} 和 x", "desc": "{{1}}"}
+    return True
+
+
+def test_card_template_limits():
+    """测试模板卡片变量缺失和列表长度限制（离线）"""
+    from card_templates import CardTemplate
+    
+    template = CardTemplate("jump", {"card_type": "text_notice", "jump_list": "{{links}}"})
+    
+    for values in ({}, {"links": [{"title": str(i)} for i in range(4)]}):
+        try:
+            template.render(values)
+        except ValueError:
+            continue
+        raise AssertionError("缺少变量或jump_list超过3项时应抛出异常")
+    return True
+
+
 def main():
     """主测试函数"""
     utils = TestUtils()
@@ -203,6 +250,8 @@ def main():
         ("图文展示卡片", test_news_notice),
         ("带操作菜单的卡片", test_card_with_action_menu),
         ("最简卡片", test_minimal_card),
+        ("预编译模板卡片渲染", test_card_template_render),
+        ("模板卡片校验", test_card_template_limits),
     ]
     
     results = []
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+测试链路追踪（离线）
+"""
+
+import base64
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from test_utils import TestUtils, FakeWebhook
+
+from qyweixin_bot import QyWeixinBot
+from tracing import configure_tracing, span, bind_context
+
+
+def _png_file(directory):
+    from PIL import Image
+    path = os.path.join(directory, "dot.png")
+    Image.new("RGB", (8, 8), "red").save(path)
+    return path
+
+
+def test_image_send_spans_to_file():
+    """测试图片发送的各步骤写入文件并挂在同一条trace下"""
+    webhook = FakeWebhook()
+    bot = QyWeixinBot("test", base_url=webhook.base_url)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            trace_path = os.path.join(tmp, "traces.jsonl")
+            tracer = configure_tracing(f"file://{trace_path}", sample_rate=1.0)
+            image_path = _png_file(tmp)
+            with open(image_path, 'rb') as f:
+                image_data = f.read()
+            with span("tool qyweixin_image"):
+                assert bot.image(image_path=image_path)["errcode"] == 0
+            tracer.flush()
+            
+            with open(trace_path, encoding='utf-8') as f:
+                spans = [json.loads(line) for line in f]
+        
+        by_name = {s["name"]: s for s in spans}
+        for name in ["image.encode", "send_message", "queue.wait", "webhook.post", "tool qyweixin_image"]:
+            assert name in by_name, f"缺少span: {name}"
+        assert len({s["trace_id"] for s in spans}) == 1
+        assert by_name["tool qyweixin_image"]["parent_span_id"] is None
+        assert by_name["image.encode"]["parent_span_id"] == by_name["tool qyweixin_image"]["span_id"]
+        # 预编码的请求体与原来的JSON序列化结果一致
+        webhook_body = webhook.messages()[-1]
+        assert base64.b64decode(webhook_body["image"]["base64"]) == image_data
+        assert webhook_body["image"]["md5"] == hashlib.md5(image_data).hexdigest()
+        post = by_name["webhook.post"]["attributes"]
+        assert post["http.request.body.size"] > 0 and post["qyweixin.errcode"] == 0
+    finally:
+        configure_tracing("")
+        bot.close()
+        webhook.close()
+    return True
+
+
+def test_otlp_export():
+    """测试OTLP/HTTP JSON导出到collector"""
+    collector = FakeWebhook()
+    try:
+        tracer = configure_tracing(collector.base_url, sample_rate=1.0)
+        with span("root", attempt=1):
+            try:
+                with span("child"):
+                    raise ValueError("boom")
+            except ValueError:
+                pass
+        tracer.flush()
+        
+        path, payload = collector.posts[0]
+        assert path == "/v1/traces"
+        spans = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        child = next(s for s in spans if s["name"] == "child")
+        root = next(s for s in spans if s["name"] == "root")
+        assert child["parentSpanId"] == root["spanId"] and child["status"]["code"] == 2
+        assert root["attributes"] == [{"key": "attempt", "value": {"intValue": "1"}}]
+    finally:
+        configure_tracing("")
+        collector.close()
+    return True
+
+
+def test_sampling_and_context():
+    """测试未采样的trace不记录任何span，线程池任务继承追踪上下文"""
+    exported = []
+    
+    class _ListExporter:
+        def export(self, spans):
+            exported.extend(spans)
+    
+    def _work(i):
+        with span(f"worker {i}"):
+            pass
+    
+    tracer = configure_tracing("file://" + os.path.join(tempfile.gettempdir(), "unused.jsonl"), sample_rate=0.0)
+    tracer.exporter = _ListExporter()
+    try:
+        with span("unsampled"):
+            with span("child"):
+                pass
+        
+        tracer.sample_rate = 1.0
+        with span("sampled") as root:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(bind_context(_work), range(2)))
+        tracer.flush()
+    finally:
+        configure_tracing("")
+    
+    assert sorted(s.name for s in exported) == ["sampled", "worker 0", "worker 1"]
+    workers = [s for s in exported if s.name.startswith("worker")]
+    assert all(s.trace_id == root.trace_id and s.parent_id == root.span_id for s in workers)
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+    
+    # 测试用例
+    test_cases = [
+        ("图片发送的span写入文件", test_image_send_spans_to_file),
+        ("OTLP导出", test_otlp_export),
+        ("采样和上下文传递", test_sampling_and_context),
+    ]
+    
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+    
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+    
+    print(f"📊 测试结果: {passed}/{total} 通过")
+    
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,14 @@
 """
 
 import json
+import re
 import requests
 import os
 import sys
-from typing import Dict, Any, Optional
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Callable, List, Optional
+from urllib.parse import urlparse, parse_qs
 
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -89,4 +93,72 @@ class TestUtils:
         }
         
         result = self.send_message(data)
-        return result["success"] 
\ No newline at end of file
+        return result["success"] 
+
+
+class FakeWebhook:
+    """
+    本地模拟的企业微信webhook和上传接口，供离线测试使用
+
+    发送接口按到达顺序记录 (key, 消息)；上传接口记录文件名并返回 media-<key>；
+    其他路径的POST按 (path, 请求体) 记录，可同时充当OTLP collector。
+    GET请求交给on_get处理（如按Range返回图片），未指定时返回404。
+    """
+
+    def __init__(self, on_get: Optional[Callable[[BaseHTTPRequestHandler], None]] = None):
+        self.received: List[tuple] = []
+        self.uploads: List[str] = []
+        self.posts: List[tuple] = []
+        fake = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                url = urlparse(self.path)
+                key = parse_qs(url.query).get("key", [None])[0]
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                payload = {"errcode": 0, "errmsg": "ok"}
+                if url.path.endswith("/upload_media"):
+                    fake.uploads.append(re.search(rb'filename="([^"]*)"', body).group(1).decode("utf-8"))
+                    payload["media_id"] = f"media-{key}"
+                elif url.path.endswith("/webhook/send"):
+                    fake.received.append((key, json.loads(body)))
+                else:
+                    fake.posts.append((self.path, json.loads(body)))
+                self.reply(json.dumps(payload).encode("utf-8"))
+
+            def do_GET(self):
+                if on_get is None:
+                    self.reply(b"", status=404)
+                else:
+                    on_get(self)
+
+            def reply(self, data: bytes, status: int = 200, content_type: str = "application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def messages(self, key: Optional[str] = None) -> List[Dict[str, Any]]:
+        """收到的消息，指定key时只返回该key的消息"""
+        return [message for k, message in self.received if key is None or k == key]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+测试语音AMR时长计算和转码缓存（离线）
+"""
+
+import os
+import sys
+import tempfile
+from test_utils import TestUtils
+
+import voice_transcode
+from voice_transcode import amr_duration, prepare_voice, AMR_NB_MAGIC, AMR_WB_MAGIC
+
+# 假的ffmpeg：记录调用次数，向最后一个参数写入3秒的AMR-NB
+_FAKE_FFMPEG = f"""#!{sys.executable}
+import os, sys
+with open(os.path.join(os.path.dirname(__file__), "calls"), "a") as f:
+    f.write(" ".join(sys.argv[1:]) + "\\n")
+with open(sys.argv[-1], "wb") as f:
+    f.write({AMR_NB_MAGIC!r} + (bytes([0x3C]) + bytes(31)) * 150)
+"""
+
+
+def _write_amr(path, magic, frame_type, frame_size, frames):
+    with open(path, 'wb') as f:
+        f.write(magic + (bytes([frame_type << 3 | 0x04]) + bytes(frame_size - 1)) * frames)
+    return path
+
+
+def test_amr_duration():
+    """测试按帧头计算AMR-NB和AMR-WB时长，损坏的帧报错"""
+    with tempfile.TemporaryDirectory() as tmp:
+        # 12.2kbps的NB帧32字节，23.85kbps的WB帧61字节，每帧20毫秒
+        nb = _write_amr(os.path.join(tmp, "nb.amr"), AMR_NB_MAGIC, 7, 32, 500)
+        assert abs(amr_duration(nb) - 10.0) < 1e-9
+        wb = _write_amr(os.path.join(tmp, "wb.amr"), AMR_WB_MAGIC, 8, 61, 250)
+        assert abs(amr_duration(wb) - 5.0) < 1e-9
+
+        # 截断的最后一帧
+        with open(nb, 'ab') as f:
+            f.write(bytes([7 << 3 | 0x04]) + bytes(10))
+        try:
+            amr_duration(nb)
+            assert False, "截断的帧应报错"
+        except ValueError as e:
+            assert "第501帧" in str(e)
+
+        # 保留的帧类型
+        bad = _write_amr(os.path.join(tmp, "bad.amr"), AMR_NB_MAGIC, 10, 13, 3)
+        try:
+            amr_duration(bad)
+            assert False, "保留的帧类型应报错"
+        except ValueError as e:
+            assert "损坏" in str(e)
+    return True
+
+
+def test_amr_passthrough_and_limit():
+    """测试AMR文件直接使用，超过60秒的语音在上传前被拒绝"""
+    with tempfile.TemporaryDirectory() as tmp:
+        short = _write_amr(os.path.join(tmp, "short.amr"), AMR_NB_MAGIC, 7, 32, 100)
+        assert prepare_voice(short) == (short, 2.0)
+
+        # 61秒的4.75kbps语音只有约40KB，大小不超限但时长超限
+        long = _write_amr(os.path.join(tmp, "long.amr"), AMR_NB_MAGIC, 0, 13, 3050)
+        try:
+            prepare_voice(long)
+            assert False, "超过60秒应报错"
+        except ValueError as e:
+            assert "时长超出限制" in str(e)
+
+        try:
+            prepare_voice(os.path.join(tmp, "missing.amr"))
+            assert False, "文件不存在应报错"
+        except FileNotFoundError:
+            pass
+    return True
+
+
+def test_transcode_cached():
+    """测试非AMR语音经进程池转码，相同内容只转码一次"""
+    saved = voice_transcode.FFMPEG_PATH, voice_transcode.VOICE_CACHE_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        ffmpeg = os.path.join(tmp, "ffmpeg")
+        with open(ffmpeg, 'w') as f:
+            f.write(_FAKE_FFMPEG)
+        os.chmod(ffmpeg, 0o755)
+        voice_transcode.FFMPEG_PATH = ffmpeg
+        voice_transcode.VOICE_CACHE_DIR = os.path.join(tmp, "cache")
+        try:
+            wav = os.path.join(tmp, "speech.wav")
+            with open(wav, 'wb') as f:
+                f.write(b"RIFF" + os.urandom(1000))
+            amr_path, duration = prepare_voice(wav)
+            assert amr_path.startswith(voice_transcode.VOICE_CACHE_DIR) and amr_path.endswith(".amr")
+            assert abs(duration - 3.0) < 1e-9
+            assert prepare_voice(wav) == (amr_path, duration)
+
+            with open(os.path.join(tmp, "calls")) as f:
+                calls = f.read().splitlines()
+            assert len(calls) == 1, calls
+            assert "libopencore_amrnb" in calls[0] and "-ar 8000" in calls[0]
+            assert [name for name in os.listdir(voice_transcode.VOICE_CACHE_DIR) if name.endswith(".tmp")] == []
+
+            # 没有ffmpeg时给出明确的错误
+            voice_transcode.FFMPEG_PATH = os.path.join(tmp, "missing-ffmpeg")
+            with open(wav, 'ab') as f:
+                f.write(b"more")
+            try:
+                prepare_voice(wav)
+                assert False, "没有ffmpeg时应报错"
+            except ValueError as e:
+                assert "ffmpeg" in str(e)
+        finally:
+            voice_transcode.FFMPEG_PATH, voice_transcode.VOICE_CACHE_DIR = saved
+    return True
+
+
+def main():
+    """主测试函数"""
+    utils = TestUtils()
+
+    # 测试用例
+    test_cases = [
+        ("AMR时长计算", test_amr_duration),
+        ("AMR直接使用和时长限制", test_amr_passthrough_and_limit),
+        ("转码和缓存", test_transcode_cached),
+    ]
+
+    results = []
+    for test_name, test_func in test_cases:
+        utils.print_test_header(test_name)
+        try:
+            success = test_func()
+            utils.print_test_result(test_name, success)
+            results.append((test_name, success))
+        except Exception as e:
+            utils.print_test_result(test_name, False, str(e))
+            results.append((test_name, False))
+
+    # 总结
+    utils.print_test_header("测试总结")
+    passed = sum(1 for _, success in results if success)
+    total = len(results)
+
+    print(f"📊 测试结果: {passed}/{total} 通过")
+
+    for test_name, success in results:
+        status = "✅" if success else "❌"
+        print(f"   {status} {test_name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import atexit
+import random
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, List, Optional
+from config import TRACE_URL, TRACE_SAMPLE_RATE, TRACE_EXPORT_INTERVAL, TRACE_QUEUE_SIZE, REQUEST_TIMEOUT
+
+# 链路追踪：每次工具调用是一条trace，下载、编码、排队、webhook请求等步骤是其中的span。
+# 采样在根span上决定，未采样的trace内所有span都是空操作。
+#   （空）                          关闭
+#   file:///path/to/traces.jsonl    每行一个span的JSON文件
+#   http://collector:4318           OTLP/HTTP JSON导出到 {地址}/v1/traces
+
+SERVICE_NAME = "qyweixin-bot-mcp"
+
+# 每批导出的最大span数
+_BATCH_SIZE = 512
+
+_current_span = contextvars.ContextVar("qyweixin_span", default=None)
+
+
+class Span:
+    """一个已采样的span"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error", "_t0")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._t0 = time.perf_counter_ns()
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_exception(self, error: BaseException):
+        self.error = f"{type(error).__name__}: {error}"
+
+    def finish(self):
+        self.end_ns = self.start_ns + time.perf_counter_ns() - self._t0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """未采样或关闭追踪时使用的空span"""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def record_exception(self, error: BaseException):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class FileSpanExporter:
+    """把span按JSON行追加写入本地文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: List[Span]):
+        lines = "".join(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + "\n" for s in spans)
+        # 追加模式的单次write，多个进程写同一个文件时各行不会交错
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    """转换为OTLP AnyValue"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpHttpSpanExporter:
+    """按OTLP/HTTP JSON编码把span发送到collector"""
+
+    def __init__(self, endpoint: str):
+        import requests
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self._session = requests.Session()
+
+    def export(self, spans: List[Span]):
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": "qyweixin"},
+                "spans": [{
+                    "traceId": s.trace_id,
+                    "spanId": s.span_id,
+                    "parentSpanId": s.parent_id or "",
+                    "name": s.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(s.start_ns),
+                    "endTimeUnixNano": str(s.end_ns),
+                    "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                    "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+                } for s in spans],
+            }],
+        }]}
+        response = self._session.post(self.url, json=payload, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+
+
+class Tracer:
+    """
+    按采样率创建span，结束的span放入有界队列，由后台线程批量导出
+
+    队列满时丢弃新的span而不是阻塞调用方；导出线程在首次使用时按进程启动，多进程模式下fork后各自导出。
+    """
+
+    def __init__(self, exporter, sample_rate: float = TRACE_SAMPLE_RATE,
+                 export_interval: float = TRACE_EXPORT_INTERVAL, queue_size: int = TRACE_QUEUE_SIZE):
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("采样率必须在0到1之间")
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.export_interval = export_interval
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def should_sample(self) -> bool:
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def submit(self, span: Span):
+        with self._lock:
+            if len(self._queue) >= self.queue_size:
+                self.dropped += 1
+                return
+            self._queue.append(span)
+            size = len(self._queue)
+        self._ensure_thread()
+        if size >= _BATCH_SIZE:
+            self._wakeup.set()
+
+    def _ensure_thread(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid != pid:
+                self._pid = pid
+                self._thread = threading.Thread(target=self._run, name="qyweixin-trace", daemon=True)
+                self._thread.start()
+
+    def flush(self):
+        """导出队列中的所有span"""
+        while True:
+            with self._lock:
+                batch = [self._queue.popleft() for _ in range(min(_BATCH_SIZE, len(self._queue)))]
+            if not batch:
+                return
+            try:
+                self.exporter.export(batch)
+            except Exception:
+                # 导出失败时丢弃这一批，避免追踪影响消息发送
+                with self._lock:
+                    self.dropped += len(batch)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.export_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+def create_tracer(url: str, sample_rate: float = TRACE_SAMPLE_RATE) -> Optional[Tracer]:
+    """根据导出地址创建Tracer，地址为空时返回None"""
+    if not url:
+        return None
+    if url.startswith("file://"):
+        return Tracer(FileSpanExporter(url[len("file://"):]), sample_rate)
+    if url.startswith(("http://", "https://")):
+        return Tracer(OtlpHttpSpanExporter(url), sample_rate)
+    raise ValueError(f"不支持的追踪导出地址: {url}")
+
+
+_tracer = create_tracer(TRACE_URL)
+
+
+def configure_tracing(url: str, sample_rate: float = TRACE_SAMPLE_RATE) -> Optional[Tracer]:
+    """替换全局Tracer，地址为空时关闭追踪"""
+    global _tracer
+    if _tracer is not None:
+        _tracer.flush()
+    _tracer = create_tracer(url, sample_rate)
+    return _tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    """当前的全局Tracer，关闭追踪时为None"""
+    return _tracer
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    创建span的上下文管理器，产出的span可以继续设置属性
+
+    没有父span时作为根span并按采样率决定是否记录；父span未采样时直接产出空span，开销只有一次上下文变量读取。
+    """
+    tracer = _tracer
+    parent = _current_span.get()
+    if tracer is None or parent is NOOP_SPAN:
+        yield NOOP_SPAN
+        return
+    if parent is None and not tracer.should_sample():
+        token = _current_span.set(NOOP_SPAN)
+        try:
+            yield NOOP_SPAN
+        finally:
+            _current_span.reset(token)
+        return
+
+    current = Span(name, parent.trace_id if parent else f"{random.getrandbits(128):032x}",
+                   parent.span_id if parent else None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish()
+        tracer.submit(current)
+
+
+def current_span():
+    """当前的span，不在追踪中时返回空span"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def bind_context(fn: Callable) -> Callable:
+    """把当前追踪上下文绑定到函数上，用于提交到线程池的任务"""
+    context = contextvars.copy_context()
+    # 同一个Context不能被多个线程同时进入，每次调用使用一份副本
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+@atexit.register
+def _flush_at_exit():
+    if _tracer is not None:
+        _tracer.flush()
@@ -1,47 +1,61 @@
 import os
-import requests
-from typing import Dict, Any, List
-from config import (
-    KEY, UPLOAD_URL_TEMPLATE, MAX_FILE_SIZE, MAX_VOICE_SIZE, 
-    MESSAGE_TYPES, MEDIA_TYPES, UPLOAD_TIMEOUT
-)
+import hashlib
+from typing import Dict, Any, List, Optional, Tuple
+from config import MESSAGE_TYPES, MEDIA_CACHE_TTL
+from state_store import get_state_store
+from tracing import span
+from robot_pool import Robot
+from webhook_client import current_client
 
 
-def qyweixin_upload_media(file_path: str, media_type: str) -> str:
-    """上传媒体文件到企业微信，返回media_id"""
-    if not KEY:
-        raise ValueError("环境变量 'key' 未设置")
-    
-    if media_type not in MEDIA_TYPES:
-        raise ValueError(f"不支持的媒体类型: {media_type}")
-    
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"文件不存在: {file_path}")
-    
-    file_size = os.path.getsize(file_path)
-    max_size = MAX_VOICE_SIZE if media_type == "voice" else MAX_FILE_SIZE
-    
-    if file_size > max_size:
-        max_mb = max_size / (1024 * 1024)
-        raise ValueError(f"文件大小超出限制: {file_size} 字节 > {max_mb}MB")
-    
-    upload_url = UPLOAD_URL_TEMPLATE.format(key=KEY, media_type=media_type)
-    
-    try:
+def qyweixin_upload_media(file_path: str, media_type: str, robot: Optional[Robot] = None) -> str:
+    """上传媒体文件到企业微信，返回media_id；media_id只能由上传它的机器人发送"""
+    return current_client().upload_media(file_path, media_type, robot)
+
+
+def file_sha256(file_path: str) -> str:
+    """分块计算文件sha256"""
+    digest = hashlib.sha256()
+    with span("file.hash", **{"file.path": file_path}):
         with open(file_path, 'rb') as f:
-            files = {'media': (os.path.basename(file_path), f, 'application/octet-stream')}
-            response = requests.post(upload_url, files=files, timeout=UPLOAD_TIMEOUT)
-        
-        response.raise_for_status()
-        result = response.json()
-        
-        if result.get('errcode') == 0:
-            return result['media_id']
-        else:
-            raise Exception(f"上传失败: {result.get('errmsg', '未知错误')}")
-            
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"网络请求失败: {str(e)}")
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _media_cache_key(robot_id: str, file_hash: str, file_name: str, media_type: str) -> str:
+    return f"{robot_id}:{media_type}:{file_hash}:{file_name}"
+
+
+def get_cached_media_id(file_hash: str, file_name: str, media_type: str) -> Optional[str]:
+    """查询当前客户端机器人池中的机器人上传的、未过期的media_id缓存"""
+    store = get_state_store()
+    for robot in current_client().pool.robots:
+        media_id = store.get("media", _media_cache_key(robot.id, file_hash, file_name, media_type))
+        if media_id:
+            return media_id
+    return None
+
+
+def cache_media_id(file_hash: str, file_name: str, media_type: str, media_id: str, robot: Robot):
+    """按上传的机器人缓存media_id，企业微信的media_id有效期为3天，且只能由上传它的机器人发送"""
+    get_state_store().set("media", _media_cache_key(robot.id, file_hash, file_name, media_type), media_id, MEDIA_CACHE_TTL)
+
+
+def qyweixin_upload_media_cached(file_path: str, media_type: str,
+                                 file_hash: Optional[str] = None) -> Tuple[str, bool]:
+    """上传媒体文件，内容和文件名相同时复用缓存的media_id，返回 (media_id, 是否命中缓存)"""
+    file_hash = file_hash or file_sha256(file_path)
+    file_name = os.path.basename(file_path)
+    with span("media.upload_cached", **{"media.type": media_type}) as cache_span:
+        media_id = get_cached_media_id(file_hash, file_name, media_type)
+        cache_span.set_attribute("cache.hit", bool(media_id))
+        if media_id:
+            return media_id, True
+        robot = current_client().pool.select()
+        media_id = qyweixin_upload_media(file_path, media_type, robot)
+        cache_media_id(file_hash, file_name, media_type, media_id, robot)
+        return media_id, False
 
 
 def qyweixin_list_message_types() -> List[Dict[str, Any]]:
@@ -53,7 +67,7 @@ def qyweixin_list_message_types() -> List[Dict[str, Any]]:
         {"type": "image", "name": "图片消息", "description": "发送图片消息，支持URL、本地文件、base64编码"},
         {"type": "news", "name": "图文消息", "description": "发送图文消息，支持多篇文章"},
         {"type": "file", "name": "文件消息", "description": "发送文件消息，支持本地文件上传"},
-        {"type": "voice", "name": "语音消息", "description": "发送语音消息，支持AMR格式"},
+        {"type": "voice", "name": "语音消息", "description": "发送语音消息，支持AMR格式，其他格式自动转码"},
         {"type": "template_card", "name": "模板卡片", "description": "发送模板卡片消息，支持文本通知和图文展示"}
     ]
 
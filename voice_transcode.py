@@ -0,0 +1,160 @@
+import os
+import time
+import shutil
+import threading
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple
+from config import (MAX_VOICE_SIZE, MAX_VOICE_DURATION, FFMPEG_PATH, VOICE_WORKERS, VOICE_TRANSCODE_TIMEOUT,
+                    VOICE_CACHE_DIR, VOICE_CACHE_TTL)
+from tracing import span
+from utils import file_sha256
+
+# AMR文件头（RFC 4867 存储格式）
+AMR_NB_MAGIC = b"#!AMR\n"
+AMR_WB_MAGIC = b"#!AMR-WB\n"
+
+# 按帧类型（帧头第3~6位）索引的帧长度，包含1字节帧头；0表示保留的帧类型
+_AMR_NB_FRAME_SIZES = [13, 14, 16, 18, 20, 21, 27, 32, 6, 0, 0, 0, 0, 0, 0, 1]
+_AMR_WB_FRAME_SIZES = [18, 24, 33, 37, 41, 47, 51, 59, 61, 6, 0, 0, 0, 0, 1, 1]
+
+# 每帧20毫秒
+AMR_FRAME_DURATION = 0.02
+
+# 清理过期缓存的最小间隔（秒）
+_CLEANUP_INTERVAL = 600
+
+_executor = None
+_executor_lock = threading.Lock()
+_last_cleanup = 0.0
+
+
+def is_amr(path: str) -> bool:
+    """根据文件头判断是否为AMR文件"""
+    with open(path, 'rb') as f:
+        head = f.read(len(AMR_WB_MAGIC))
+    return head.startswith(AMR_NB_MAGIC) or head.startswith(AMR_WB_MAGIC)
+
+
+def amr_duration(path: str) -> float:
+    """
+    根据帧头计算AMR文件的时长，不解码音频
+
+    每帧的帧头给出帧类型，由帧类型得到帧长度后直接跳到下一帧，帧数乘以20毫秒即为时长。
+
+    Args:
+        path: AMR文件路径
+
+    Returns:
+        float: 时长（秒）
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data.startswith(AMR_WB_MAGIC):
+        pos, frame_sizes = len(AMR_WB_MAGIC), _AMR_WB_FRAME_SIZES
+    elif data.startswith(AMR_NB_MAGIC):
+        pos, frame_sizes = len(AMR_NB_MAGIC), _AMR_NB_FRAME_SIZES
+    else:
+        raise ValueError(f"不是AMR文件: {path}")
+
+    frames = 0
+    while pos < len(data):
+        frame_size = frame_sizes[(data[pos] >> 3) & 0x0F]
+        if not frame_size or pos + frame_size > len(data):
+            raise ValueError(f"AMR文件已损坏：第{frames + 1}帧无效")
+        pos += frame_size
+        frames += 1
+    return frames * AMR_FRAME_DURATION
+
+
+def transcode_to_amr(ffmpeg: str, src: str, dst: str, timeout: float = VOICE_TRANSCODE_TIMEOUT):
+    """
+    用ffmpeg把音频转为单声道8kHz的AMR-NB
+
+    只转换前MAX_VOICE_DURATION+1秒，超长的音频不会整段转码，转码结果的时长检查会拒绝它。
+    """
+    command = [ffmpeg, "-nostdin", "-v", "error", "-y", "-i", src, "-t", str(MAX_VOICE_DURATION + 1),
+               "-ar", "8000", "-ac", "1", "-c:a", "libopencore_amrnb", "-b:a", "12.2k", "-f", "amr", dst]
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise TimeoutError(f"语音转码超时（{timeout}秒）: {src}")
+    if result.returncode != 0:
+        error = result.stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise ValueError(f"语音转码失败: {error[-1] if error else result.returncode}")
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """延迟创建语音转码进程池"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=VOICE_WORKERS)
+        return _executor
+
+
+def _cleanup_cache():
+    """删除超过VOICE_CACHE_TTL未使用的转码结果，最多每10分钟执行一次"""
+    global _last_cleanup
+    now = time.time()
+    if now - _last_cleanup < _CLEANUP_INTERVAL:
+        return
+    _last_cleanup = now
+    for entry in os.scandir(VOICE_CACHE_DIR):
+        try:
+            if entry.stat().st_mtime + VOICE_CACHE_TTL < now:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            continue
+
+
+def _transcode_cached(path: str) -> str:
+    """转码为AMR，结果按源文件内容的SHA-256缓存，相同内容只转码一次"""
+    ffmpeg = shutil.which(FFMPEG_PATH)
+    if not ffmpeg:
+        raise ValueError(f"语音不是AMR格式，转码需要ffmpeg（含libopencore_amrnb编码器），未找到: {FFMPEG_PATH}")
+
+    os.makedirs(VOICE_CACHE_DIR, exist_ok=True)
+    _cleanup_cache()
+    cached = os.path.join(VOICE_CACHE_DIR, f"{file_sha256(path)}.amr")
+    with span("voice.transcode", **{"file.path": path}) as transcode_span:
+        hit = os.path.isfile(cached)
+        transcode_span.set_attribute("cache.hit", hit)
+        if hit:
+            os.utime(cached)
+            return cached
+
+        # 先写临时文件再改名，并发转码同一内容时不会读到写了一半的文件
+        tmp = f"{cached}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            _get_executor().submit(transcode_to_amr, ffmpeg, path, tmp).result(timeout=VOICE_TRANSCODE_TIMEOUT + 5)
+            os.replace(tmp, cached)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return cached
+
+
+def prepare_voice(path: str) -> Tuple[str, float]:
+    """
+    准备要上传的语音：AMR文件直接使用，其他格式（WAV、MP3等）在进程池中转码为AMR
+
+    上传前按帧头计算时长，超过MAX_VOICE_DURATION秒或超过MAX_VOICE_SIZE时报错。
+
+    Args:
+        path: 本地语音文件路径
+
+    Returns:
+        Tuple[str, float]: (AMR文件路径, 时长秒数)
+    """
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"文件不存在: {path}")
+
+    amr_path = path if is_amr(path) else _transcode_cached(path)
+    size = os.path.getsize(amr_path)
+    if size > MAX_VOICE_SIZE:
+        raise ValueError(f"语音大小超出限制: {size} > {MAX_VOICE_SIZE}")
+    duration = amr_duration(amr_path)
+    if duration > MAX_VOICE_DURATION:
+        raise ValueError(f"语音时长超出限制: {duration:.1f}秒 > {MAX_VOICE_DURATION}秒")
+    return amr_path, duration
@@ -0,0 +1,358 @@
+import os
+import json
+import time
+import threading
+import contextvars
+import requests
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait, FIRST_COMPLETED
+from typing import Dict, Any, Iterable, Optional
+from config import (
+    ROBOT_KEYS, ROBOT_POOL_STRATEGY, API_BASE_URL, MAX_FILE_SIZE, MAX_VOICE_SIZE, MEDIA_TYPES,
+    REQUEST_TIMEOUT, UPLOAD_TIMEOUT, SEND_RETRIES, SEND_RETRY_BACKOFF, DEDUPE_TTL, DEFAULT_PRIORITY,
+    HEDGE_ENABLED, HEDGE_PERCENTILE, HEDGE_DEFAULT_DELAY, HEDGE_MIN_SAMPLES, HEDGE_SAMPLE_SIZE, PAYLOAD_BUDGET_BYTES
+)
+from robot_pool import RobotPool, Robot
+from rate_limiter import key_id
+from payload_budget import ByteBudget, upload_payload_bytes
+from message_body import EncodedMessage
+from blob_store import resolve_path
+from idempotency import next_message_id
+from state_store import get_state_store
+from tracing import span, current_span, bind_context
+
+# 当前调用使用的客户端，未激活任何客户端时使用默认客户端
+_current_client = contextvars.ContextVar("qyweixin_client", default=None)
+_default_client = None
+_default_lock = threading.Lock()
+
+
+class _WriteDenied(Exception):
+    """另一个请求已开始写入同一条消息的请求体，本请求在写入前放弃"""
+
+
+class _WriteClaim:
+    """同一条消息的主请求与对冲请求之间的发送权，先开始写入请求体的一方获得"""
+
+    def __init__(self):
+        self.owner = None
+        self._lock = threading.Lock()
+
+    def acquire(self, owner: str) -> bool:
+        """取得发送权，已被另一方取得时返回False；同一方重试时仍持有"""
+        with self._lock:
+            if self.owner is None:
+                self.owner = owner
+            return self.owner == owner
+
+
+class _ClaimedBody:
+    """
+    开始写入socket前取得发送权的请求体
+
+    连接建立、请求头发出后才读取请求体，此时取不到发送权就中止请求：
+    服务端只收到请求头、收不到完整的请求体，不会投递消息。
+    """
+
+    def __init__(self, body: bytes, claim: _WriteClaim, owner: str):
+        self._body = memoryview(body)
+        self._pos = 0
+        self._claim = claim
+        self._owner = owner
+
+    def __len__(self):
+        return len(self._body) - self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        if self._pos == 0 and not self._claim.acquire(self._owner):
+            raise _WriteDenied()
+        end = len(self._body) if size is None or size < 0 else min(len(self._body), self._pos + size)
+        chunk = self._body[self._pos:end].tobytes()
+        self._pos = end
+        return chunk
+
+
+class WebhookClient:
+    """
+    企业微信群机器人webhook的发送引擎
+
+    每个实例拥有自己的机器人池（每个机器人独立的令牌桶和优先级队列）、主连接池和对冲连接池、
+    延迟样本、载荷内存预算和重试策略，可以按key创建多个实例。令牌桶、去重记录和media_id缓存
+    保存在状态存储中并按key区分：同一个key的多个实例或进程共享发送配额和缓存，
+    其他key的实例不会复用它们（media_id只能由上传它的机器人发送）。
+
+    消息构造函数（message_tools）通过current_client()取得当前客户端发送，
+    在 `with client.activate():` 中调用即使用该客户端。
+    """
+
+    def __init__(self, key: Optional[str] = None, keys: Optional[Iterable[str]] = None,
+                 strategy: str = ROBOT_POOL_STRATEGY, base_url: str = API_BASE_URL,
+                 hedge: bool = HEDGE_ENABLED, retries: int = SEND_RETRIES,
+                 payload_budget_bytes: int = PAYLOAD_BUDGET_BYTES):
+        """
+        Args:
+            key: 群机器人webhook的key
+            keys: 同一个群中其他机器人的key，与key组成机器人池分担发送
+            strategy: 机器人池选择策略：least_loaded或round_robin
+            base_url: 企业微信API地址
+            hedge: 是否开启对冲请求
+            retries: 连接失败时的重试次数
+            payload_budget_bytes: 在途图片和上传载荷的内存预算（字节）
+        """
+        keys = list(dict.fromkeys(k for k in [key, *(keys or [])] if k))
+        self.pool = RobotPool(keys, strategy, base_url)
+        # 去重记录按机器人池区分，同一组key的实例和进程共享，不同key的客户端互不影响
+        self.id = key_id(",".join(sorted(robot.id for robot in self.pool.robots)))
+        self.hedge = hedge
+        self.retries = retries
+        self.payload_budget = ByteBudget(payload_budget_bytes)
+        # 主连接池与对冲连接池分开，保证对冲请求走另一条TCP连接
+        self.session = requests.Session()
+        self.hedge_session = requests.Session()
+        self._hedge_executor = None
+        self._executor_lock = threading.Lock()
+        # 最近的发送延迟样本，用于计算对冲等待时间
+        self._latencies = deque(maxlen=HEDGE_SAMPLE_SIZE)
+        self._latency_lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        """在当前上下文中使用该客户端发送，退出时恢复"""
+        token = _current_client.set(self)
+        try:
+            yield self
+        finally:
+            _current_client.reset(token)
+
+    def close(self):
+        """关闭连接池和对冲线程池"""
+        self.session.close()
+        self.hedge_session.close()
+        with self._executor_lock:
+            if self._hedge_executor is not None:
+                self._hedge_executor.shutdown(wait=False)
+                self._hedge_executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _post(self, session: requests.Session, data: Dict[str, Any], url: str,
+              claim: Optional[_WriteClaim] = None) -> Dict[str, Any]:
+        """通过指定连接池发送一次请求，并记录延迟样本；指定claim时写入请求体前须取得发送权"""
+        connection = "hedge" if session is self.hedge_session else "primary"
+        with span("webhook.post", connection=connection) as post_span:
+            if isinstance(data, EncodedMessage):
+                body = data.body
+            else:
+                # 与requests的json参数相同的序列化方式，单独计时并记录请求体大小
+                with span("json.encode"):
+                    body = json.dumps(data, allow_nan=False).encode('utf-8')
+            post_span.set_attribute("http.request.body.size", len(body))
+
+            start = time.monotonic()
+            response = session.post(
+                url,
+                data=body if claim is None else _ClaimedBody(body, claim, connection),
+                headers={"Content-Type": "application/json"},
+                timeout=REQUEST_TIMEOUT
+            )
+            post_span.set_attribute("http.response.status_code", response.status_code)
+            response.raise_for_status()
+            result = response.json()
+            post_span.set_attribute("qyweixin.errcode", result.get("errcode"))
+            with self._latency_lock:
+                self._latencies.append(time.monotonic() - start)
+            return result
+
+    def _post_with_retry(self, data: Dict[str, Any], url: str,
+                         claim: Optional[_WriteClaim] = None) -> Dict[str, Any]:
+        """连接失败时按指数退避重试；读取响应超时时请求可能已送达，不重试，避免重复投递"""
+        for attempt in range(self.retries + 1):
+            try:
+                return self._post(self.session, data, url, claim)
+            except requests.exceptions.ConnectionError:
+                if attempt == self.retries:
+                    raise
+                current_span().set_attribute("http.retries", attempt + 1)
+                time.sleep(SEND_RETRY_BACKOFF * 2 ** attempt)
+
+    def hedge_delay(self) -> float:
+        """根据最近延迟样本的百分位数计算对冲等待时间（秒）"""
+        with self._latency_lock:
+            samples = sorted(self._latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        index = min(len(samples) - 1, int(len(samples) * HEDGE_PERCENTILE / 100))
+        return samples[index]
+
+    def _get_hedge_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="qyweixin-hedge")
+            return self._hedge_executor
+
+    def _send_hedged(self, data: Dict[str, Any], robot: Robot) -> Dict[str, Any]:
+        """
+        对冲发送：主请求超过百分位延迟仍未完成时，通过另一条连接再发一次，取先完成者
+
+        企业微信webhook没有服务端幂等，主请求和对冲请求共享一个发送权：先开始写入请求体的一方获得，
+        另一方在写入请求体前放弃。主请求卡在建立连接时由对冲请求投递；主请求已发出请求体、
+        只是响应慢时不再对冲，只等待主请求，同一条消息不会投递两次。
+        """
+        executor = self._get_hedge_executor()
+        claim = _WriteClaim()
+        primary = executor.submit(bind_context(self._post_with_retry), data, robot.webhook_url, claim)
+        try:
+            return primary.result(timeout=self.hedge_delay())
+        except FutureTimeoutError:
+            pass
+
+        def _hedge_attempt():
+            # 主请求已完成或已开始写入请求体时，再发会重复投递
+            if primary.done() or claim.owner is not None:
+                return primary.result()
+            # 对冲请求同样占用机器人配额，没有空闲令牌时只等待主请求
+            if robot.limiter.try_acquire() > 0:
+                return primary.result()
+            current_span().set_attribute("hedge.fired", True)
+            try:
+                return self._post(self.hedge_session, data, robot.webhook_url, claim)
+            except _WriteDenied:
+                return primary.result()
+
+        hedge = executor.submit(bind_context(_hedge_attempt))
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    error = e
+        raise error
+
+    def send(self, data: Dict[str, Any], client_msg_id: Optional[str] = None,
+             priority: str = DEFAULT_PRIORITY, sticky_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        发送一条已构造好的消息
+
+        Args:
+            data: 消息数据字典
+            client_msg_id: 客户端消息ID，去重窗口内重复的ID直接返回首次投递结果；
+                未指定时在幂等调用中按发送顺序生成
+            priority: 优先级通道：urgent、high、normal或low
+            sticky_key: 相关消息的粘性键，相同的键优先由同一个机器人发送
+
+        Returns:
+            Dict: 响应结果
+        """
+        if client_msg_id is None:
+            client_msg_id = next_message_id()
+        with span("send_message", msgtype=data.get("msgtype"), priority=priority) as send_span:
+            if client_msg_id:
+                delivered = self._lookup_delivered(client_msg_id)
+                send_span.set_attribute("dedupe.hit", delivered is not None)
+                if delivered is not None:
+                    return delivered
+
+            # 文件和语音的media_id只能由上传它的机器人发送
+            msgtype = data.get("msgtype")
+            robot = self.pool.media_robot(data[msgtype]["media_id"]) if msgtype in ("file", "voice") else None
+            result = self.pool.send(data, priority,
+                                    lambda payload, robot: self._deliver(payload, client_msg_id, robot),
+                                    sticky_key=sticky_key, robot=robot)
+            # 被合并的消息随承载它的消息一起投递，同样记录自己的client_msg_id，重试时不会再次发送
+            if client_msg_id and result.get("coalesced") and result.get("errcode") == 0:
+                self._record_delivered(client_msg_id, result)
+            return result
+
+    def _deliver(self, data: Dict[str, Any], client_msg_id: Optional[str], robot: Robot) -> Dict[str, Any]:
+        """取得机器人的发送配额后实际投递消息"""
+        if not self.hedge:
+            result = self._post_with_retry(data, robot.webhook_url)
+        else:
+            with span("deliver.hedged"):
+                result = self._send_hedged(data, robot)
+
+        if client_msg_id and result.get('errcode') == 0:
+            self._record_delivered(client_msg_id, result)
+        return result
+
+    def upload_media(self, file_path: str, media_type: str, robot: Optional[Robot] = None) -> str:
+        """上传媒体文件到企业微信，返回media_id；media_id只能由上传它的机器人发送"""
+        if not self.pool.robots:
+            raise ValueError("环境变量 'key' 未设置")
+
+        file_path = resolve_path(file_path)
+
+        if media_type not in MEDIA_TYPES:
+            raise ValueError(f"不支持的媒体类型: {media_type}")
+
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"文件不存在: {file_path}")
+
+        file_size = os.path.getsize(file_path)
+        max_size = MAX_VOICE_SIZE if media_type == "voice" else MAX_FILE_SIZE
+
+        if file_size > max_size:
+            max_mb = max_size / (1024 * 1024)
+            raise ValueError(f"文件大小超出限制: {file_size} 字节 > {max_mb}MB")
+
+        robot = robot or self.pool.select()
+        upload_url = robot.upload_url(media_type)
+
+        try:
+            with span("media.upload", **{"media.type": media_type, "file.size": file_size, "robot.id": robot.id}):
+                with self.payload_budget.reserve(upload_payload_bytes(file_size)), open(file_path, 'rb') as f:
+                    files = {'media': (os.path.basename(file_path), f, 'application/octet-stream')}
+                    response = self.session.post(upload_url, files=files, timeout=UPLOAD_TIMEOUT)
+
+            response.raise_for_status()
+            result = response.json()
+
+            if result.get('errcode') == 0:
+                self.pool.record_media(result['media_id'], robot)
+                return result['media_id']
+            else:
+                raise Exception(f"上传失败: {result.get('errmsg', '未知错误')}")
+
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"网络请求失败: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """机器人池的队列和发送统计，以及载荷内存预算"""
+        return {**self.pool.stats(), "payload_budget": self.payload_budget.stats()}
+
+    def _lookup_delivered(self, client_msg_id: str) -> Optional[Dict[str, Any]]:
+        """查找去重窗口内已投递的消息结果"""
+        return get_state_store().get("delivered", f"{self.id}:{client_msg_id}")
+
+    def _record_delivered(self, client_msg_id: str, result: Dict[str, Any]):
+        """记录已成功投递的消息"""
+        get_state_store().set("delivered", f"{self.id}:{client_msg_id}", result, DEDUPE_TTL)
+
+
+def default_client() -> WebhookClient:
+    """默认客户端，未设置时按环境变量配置的key创建"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = WebhookClient(keys=ROBOT_KEYS)
+        return _default_client
+
+
+def set_default_client(client: WebhookClient):
+    """设置默认客户端，定时发送等不在任何客户端调用中的发送也使用它"""
+    global _default_client
+    with _default_lock:
+        _default_client = client
+
+
+def current_client() -> WebhookClient:
+    """当前激活的客户端，没有激活的客户端时返回默认客户端"""
+    return _current_client.get() or default_client()